@@ -78,7 +78,7 @@ import datetime
 from spambayes import storage
 from spambayes import Options
 from spambayes import mboxutils
-from spambayes.tokenizer import tokenize
+from spambayes.tokencache import tokenize
 
 prog = os.path.basename(sys.argv[0])
 
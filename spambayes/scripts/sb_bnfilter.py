@@ -56,6 +56,9 @@ Where:
 *   -S
         [EXPERIMENTAL] untrain spam (only use if you've already trained
         this message)
+*   -m
+        stdin is a Unix mailbox: filter all of the messages in it as a
+        single batch, writing the filtered mailbox to stdout
         
     -k FILE
         Unix domain socket used to communicate with a short-lived server
@@ -89,7 +92,7 @@ def usage(code, msg=''):
         
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hfgstGSd:p:o:a:A:k:')
+        opts, args = getopt.getopt(sys.argv[1:], 'hfgstGSmd:p:o:a:A:k:')
     except getopt.error, msg:
         usage(2, msg)
 
@@ -101,7 +104,7 @@ def main():
     for opt, arg in opts:
         if opt == '-h':
             usage(0)
-        elif opt in ('-f', '-g', '-s', '-t', '-G', '-S'):
+        elif opt in ('-f', '-g', '-s', '-t', '-G', '-S', '-m'):
             action_options.append(opt)
         elif opt in ('-d', '-p', '-o', '-a', '-A'):
             server_options.append(opt)
@@ -125,10 +125,12 @@ class BNRequest(SocketServer.StreamRequestHandler):
     def _calc_response(self, switches, body):
         switches = switches.split()
         actions = []
-        opts, args = getopt.getopt(switches, 'fgstGS')
+        opts, args = getopt.getopt(switches, 'fgstGSm')
         h = self.server.hammie
         for opt, arg in opts:
-            if opt == '-f':
+            if opt == '-m':
+                return self._calc_mbox_response(body)
+            elif opt == '-f':
                 actions.append(h.filter)
             elif opt == '-g':
                 actions.append(h.train_ham)
@@ -148,6 +150,17 @@ class BNRequest(SocketServer.StreamRequestHandler):
             action(msg)
         return mboxutils.as_string(msg, 1)
 
+    def _calc_mbox_response(self, body):
+        # The body is a Unix mailbox; filter all of its messages in one
+        # batch, so that tokens they share are only looked up once.
+        import mailbox
+        from cStringIO import StringIO
+        from spambayes import mboxutils
+        msgs = list(mailbox.PortableUnixMailbox(StringIO(body),
+                                                mboxutils.get_message))
+        self.server.hammie.filter_many(msgs)
+        return ''.join([mboxutils.as_string(msg, 1) for msg in msgs])
+
 
 def make_HammieFilter():
     # The sb_hammie script has some logic in the HammieFiler class that we need here too.
@@ -35,6 +35,7 @@ Usage:
             -f: FN : flat file to export to or import from
             -p: FN : name of pickled database file to use
             -d: FN : name of dbm database file to use
+            -s: FN : name of binary snapshot file to use
             -m     : merge import into an existing database file.  This is
                      meaningful only for import. If omitted, a new database
                      file will be created.  If specified, the imported
@@ -45,7 +46,7 @@ Usage:
 
             -h     : help
 
-If neither -p nor -d is specified, then the values in your configuration
+If none of -p, -d and -s is specified, then the values in your configuration
 file (or failing that, the defaults) will be used.  In this way, you may
 convert to and from storage formats other than pickle and dbm.
 
@@ -61,6 +62,10 @@ Examples:
         sb_dbexpimp -e -p abayes.db -f abayes.export
         sb_dbexpimp -i -d abayes.db -f abayes.export
 
+    Convert a pickled bayes database to a binary snapshot
+        sb_dbexpimp -e -p abayes.db -f abayes.export
+        sb_dbexpimp -i -s abayes.snap -f abayes.export
+
     Create a new DBM database (newbayes.db) from two
         DBM databases (abayes.db, bbayes.db)
         sb_dbexpimp -e -d abayes.db -f abayes.export
@@ -100,13 +105,25 @@ def uunquote(s):
     # punt
     return s
 
+def database_type(opts):
+    """Return the name and type of the database to use, as for
+    spambayes.storage.database_type, but also allowing -s for a
+    snapshot.  Only one of -p, -d and -s may be given."""
+    snapshots = [arg for opt, arg in opts if opt == '-s']
+    if not snapshots:
+        return spambayes.storage.database_type(opts)
+    others = [opt for opt, arg in opts if opt in ('-p', '-d')]
+    if others or len(snapshots) > 1:
+        raise spambayes.storage.MutuallyExclusiveError()
+    return snapshots[0], "snapshot"
+
 def runExport(dbFN, useDBM, outFN):
     bayes = spambayes.storage.open_storage(dbFN, useDBM)
     if useDBM == "dbm":
         words = bayes.db.keys()
         words.remove(bayes.statekey)
     else:
-        words = bayes.wordinfo.keys()
+        words = bayes._wordinfokeys()
 
     try:
         fp = open(outFN, 'wb')
@@ -183,7 +200,7 @@ def runImport(dbFN, useDBM, newDBM, inFN):
         words = bayes.db.keys()
         words.remove(bayes.statekey)
     else:
-        words = bayes.wordinfo.keys()
+        words = bayes._wordinfokeys()
 
     print "Database has %s ham, %s spam, and %s words" \
            % (bayes.nham, bayes.nspam, len(words))
@@ -192,14 +209,12 @@ def runImport(dbFN, useDBM, newDBM, inFN):
 if __name__ == '__main__':
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'iehmvd:p:f:o:')
+        opts, args = getopt.getopt(sys.argv[1:], 'iehmvd:p:s:f:o:')
     except getopt.error, msg:
         print >> sys.stderr, str(msg) + '\n\n' + __doc__
         sys.exit()
 
-    useDBM = "pickle"
     newDBM = True
-    dbFN = None
     flatFN = None
     exp = False
     imp = False
@@ -218,7 +233,7 @@ if __name__ == '__main__':
             newDBM = False
         elif opt in ('-o', '--option'):
             options.set_from_cmdline(arg, sys.stderr)
-    dbFN, useDBM = spambayes.storage.database_type(opts)
+    dbFN, useDBM = database_type(opts)
 
     if (dbFN and flatFN):
         if exp:
@@ -185,6 +185,14 @@ class HammieFilter(object):
             self.open('r')
         return self.h.filter(msg)
 
+    def filter_many(self, msgs):
+        # Batch scoring can't train on the results as it goes, so fall
+        # back to one message at a time if train_on_filter is set.
+        if Options.options["Hammie", "train_on_filter"]:
+            return [self.filter(msg) for msg in msgs]
+        self.open('r')
+        return self.h.filter_many(msgs)
+
     def filter_train(self, msg):
         self.open('c')
         return self.h.filter(msg, train=True)
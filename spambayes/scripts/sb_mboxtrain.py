@@ -40,11 +40,14 @@ Where OPTIONS is one or more of:
 
     -o section:option:value
         set [section, option] in the options database to value
+
+    -j N
+        tokenize the messages in N processes at once
 """
 
 import sys, os, getopt, email
 import shutil
-from spambayes import hammie, storage, mboxutils
+from spambayes import hammie, storage, mboxutils, tokenpool
 from spambayes.Options import options, get_pathname_option
 
 program = sys.argv[0]
@@ -70,8 +73,14 @@ def get_message(obj):
         msg = None
     return msg
 
-def msg_train(h, msg, is_spam, force):
-    """Train bayes with a single message."""
+def msg_check(msg, is_spam, force):
+    """Check whether a message needs to be trained on.
+
+    Returns None if it doesn't, or else whether it has been trained as
+    the other kind, and so needs to be untrained first.  The trained
+    header is removed if the message is to be trained.
+
+    """
 
     # XXX: big hack -- why is email.Message unable to represent
     # multipart/alternative?
@@ -79,7 +88,7 @@ def msg_train(h, msg, is_spam, force):
         mboxutils.as_string(msg)
     except TypeError:
         # We'll be unable to represent this as text :(
-        return False
+        return None
 
     if is_spam:
         spamtxt = options["Headers", "header_spam_string"]
@@ -92,17 +101,80 @@ def msg_train(h, msg, is_spam, force):
             del msg[options["Headers", "trained_header_name"]]
     elif oldtxt == spamtxt:
         # Skip this one, we've already trained with it.
-        return False
+        return None
     elif oldtxt != None:
         # It's been trained, but as something else.  Untrain.
         del msg[options["Headers", "trained_header_name"]]
-        h.untrain(msg, not is_spam)
-    h.train(msg, is_spam)
+        return True
+    return False
+
+def msg_learn(h, msg, is_spam, retrain, tokens=None):
+    """Train bayes with a message that msg_check() says needs it.
+
+    tokens, if given, are the message's tokens.
+
+    """
+
+    if is_spam:
+        spamtxt = options["Headers", "header_spam_string"]
+    else:
+        spamtxt = options["Headers", "header_ham_string"]
+    if retrain:
+        if tokens is not None:
+            # They are used twice.
+            tokens = tuple(tokens)
+        h.untrain(msg, not is_spam, tokens)
+    h.train(msg, is_spam, tokens=tokens)
     msg.add_header(options["Headers", "trained_header_name"], spamtxt)
 
+def msg_train(h, msg, is_spam, force):
+    """Train bayes with a single message."""
+
+    retrain = msg_check(msg, is_spam, force)
+    if retrain is None:
+        return False
+    msg_learn(h, msg, is_spam, retrain)
     return True
 
-def maildir_train(h, path, is_spam, force, removetrained):
+def train_messages(h, items, is_spam, force, jobs=1):
+    """Train bayes with the messages that need it.
+
+    items are (message, name) pairs, with a message of None if it
+    couldn't be read.  Generates (message, name, trained) for each of
+    them, in order.  If jobs is more than one, the messages are
+    tokenized in that many processes at once.
+
+    """
+
+    def checked():
+        for msg, name in items:
+            retrain = None
+            if msg:
+                retrain = msg_check(msg, is_spam, force)
+            yield msg, name, retrain
+
+    def message(item):
+        msg, name, retrain = item
+        if retrain is None:
+            return None
+        return msg
+
+    for (msg, name, retrain), tokens in \
+            tokenpool.tokenize_many(checked(), jobs, message):
+        if retrain is not None:
+            msg_learn(h, msg, is_spam, retrain, tokens)
+        yield msg, name, retrain is not None
+
+def read_messages(filenames):
+    """Generate (message, filename) for each of the files."""
+
+    for fn in filenames:
+        f = file(fn, "rb")
+        msg = get_message(f)
+        f.close()
+        yield msg, fn
+
+def maildir_train(h, path, is_spam, force, removetrained, jobs=1):
     """Train bayes with all messages from a maildir."""
 
     if loud:
@@ -116,24 +188,25 @@ def maildir_train(h, path, is_spam, force, removetrained):
     counter = 0
     trained = 0
 
+    filenames = []
     for fn in os.listdir(path):
         cfn = os.path.join(path, fn)
+        if not os.path.isdir(cfn):
+            filenames.append(cfn)
+
+    for msg, cfn, msg_trained in train_messages(h, read_messages(filenames),
+                                                is_spam, force, jobs):
         tfn = os.path.normpath(os.path.join(path, "..", "tmp",
                            "%d.%d_%d.%s" % (time.time(), pid,
                                             counter, host)))
-        if (os.path.isdir(cfn)):
-            continue
         counter += 1
         if loud and counter % 10 == 0:
             sys.stdout.write("\r%6d" % counter)
             sys.stdout.flush()
-        f = file(cfn, "rb")
-        msg = get_message(f)
-        f.close()
         if not msg:
             print "Malformed message: %s.  Skipping..." % cfn
             continue
-        if not msg_train(h, msg, is_spam, force):
+        if not msg_trained:
             continue
         trained += 1
         if not options["Headers", "include_trained"]:
@@ -154,7 +227,7 @@ def maildir_train(h, path, is_spam, force, removetrained):
         sys.stdout.write("\r  Trained %d out of %d messages\n" %
                          (trained, counter))
 
-def mbox_train(h, path, is_spam, force):
+def mbox_train(h, path, is_spam, force, jobs=1):
     """Train bayes with a Unix mbox"""
 
     if loud:
@@ -169,11 +242,16 @@ def mbox_train(h, path, is_spam, force):
     fcntl.flock(f, fcntl.LOCK_EX)
     mbox = mailbox.PortableUnixMailbox(f, get_message)
 
+    def items():
+        for msg in mbox:
+            yield msg, None
+
     outf = os.tmpfile()
     counter = 0
     trained = 0
 
-    for msg in mbox:
+    for msg, unused, msg_trained in train_messages(h, items(), is_spam,
+                                                   force, jobs):
         if not msg:
             print "Malformed message number %d.  I can't train on this mbox, sorry." % counter
             return
@@ -181,7 +259,7 @@ def mbox_train(h, path, is_spam, force):
         if loud and counter % 10 == 0:
             sys.stdout.write("\r%6d" % counter)
             sys.stdout.flush()
-        if msg_train(h, msg, is_spam, force):
+        if msg_trained:
             trained += 1
         if options["Headers", "include_trained"]:
             # Write it out with the Unix "From " line
@@ -212,7 +290,7 @@ def mbox_train(h, path, is_spam, force):
         sys.stdout.write("\r  Trained %d out of %d messages\n" %
                          (trained, counter))
 
-def mhdir_train(h, path, is_spam, force):
+def mhdir_train(h, path, is_spam, force, jobs=1):
     """Train bayes with an mh directory"""
 
     if loud:
@@ -223,21 +301,18 @@ def mhdir_train(h, path, is_spam, force):
     counter = 0
     trained = 0
 
-    for fn in glob.glob(os.path.join(path, "[0-9]*")):
+    filenames = glob.glob(os.path.join(path, "[0-9]*"))
+    for msg, cfn, msg_trained in train_messages(h, read_messages(filenames),
+                                                is_spam, force, jobs):
         counter += 1
 
-        cfn = fn
         tfn = os.path.join(path, "spambayes.tmp")
         if loud and counter % 10 == 0:
             sys.stdout.write("\r%6d" % counter)
             sys.stdout.flush()
-        f = file(fn, "rb")
-        msg = get_message(f)
-        f.close()
         if not msg:
             print "Malformed message: %s.  Skipping..." % cfn
             continue
-        msg_train(h, msg, is_spam, force)
         trained += 1
         if not options["Headers", "include_trained"]:
             continue
@@ -255,19 +330,19 @@ def mhdir_train(h, path, is_spam, force):
         sys.stdout.write("\r  Trained %d out of %d messages\n" %
                          (trained, counter))
 
-def train(h, path, is_spam, force, trainnew, removetrained):
+def train(h, path, is_spam, force, trainnew, removetrained, jobs=1):
     if not os.path.exists(path):
         raise ValueError("Nonexistent path: %s" % path)
     elif os.path.isfile(path):
-        mbox_train(h, path, is_spam, force)
+        mbox_train(h, path, is_spam, force, jobs)
     elif os.path.isdir(os.path.join(path, "cur")):
         maildir_train(h, os.path.join(path, "cur"), is_spam, force,
-                      removetrained)
+                      removetrained, jobs)
         if trainnew:
             maildir_train(h, os.path.join(path, "new"), is_spam, force,
-                          removetrained)
+                          removetrained, jobs)
     elif os.path.isdir(path):
-        mhdir_train(h, path, is_spam, force)
+        mhdir_train(h, path, is_spam, force, jobs)
     else:
         raise ValueError("Unable to determine mailbox type: " + path)
 
@@ -286,7 +361,7 @@ def main():
     global loud
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hfqnrd:p:g:s:o:')
+        opts, args = getopt.getopt(sys.argv[1:], 'hfqnrd:p:g:s:o:j:')
     except getopt.error, msg:
         usage(2, msg)
 
@@ -296,6 +371,7 @@ def main():
     force = False
     trainnew = False
     removetrained = False
+    jobs = 1
     good = []
     spam = []
     for opt, arg in opts:
@@ -315,6 +391,8 @@ def main():
             removetrained = True
         elif opt == '-o':
             options.set_from_cmdline(arg, sys.stderr)
+        elif opt == '-j':
+            jobs = int(arg)
     pck, usedb = storage.database_type(opts)
     if args:
         usage(2, "Positional arguments not allowed")
@@ -330,14 +408,14 @@ def main():
     for g in good:
         if loud:
             print "Training ham (%s):" % g
-        train(h, g, False, force, trainnew, removetrained)
+        train(h, g, False, force, trainnew, removetrained, jobs)
         sys.stdout.flush()
         save = True
 
     for s in spam:
         if loud:
             print "Training spam (%s):" % s
-        train(h, s, True, force, trainnew, removetrained)
+        train(h, s, True, force, trainnew, removetrained, jobs)
         sys.stdout.flush()
         save = True
 
@@ -87,7 +87,7 @@ Gimmicks:
  o NNTP proxy.
 """
 
-import sys, re, getopt, time, socket, email
+import os, sys, re, getopt, time, socket, email, threading, Queue
 from thread import start_new_thread
 
 import spambayes.message
@@ -95,6 +95,7 @@ from spambayes import i18n
 from spambayes import Stats
 from spambayes import Dibbler
 from spambayes import storage
+from spambayes import reviewindex
 from spambayes.FileCorpus import ExpiryFileCorpus
 from spambayes.FileCorpus import FileMessageFactory, GzipFileMessageFactory
 from spambayes.Options import options, get_pathname_option, _
@@ -125,15 +126,20 @@ class ServerLineReader(Dibbler.BrighterAsyncChat):
     """An async socket that reads lines from a remote server and
     simply calls a callback with the data.  The BayesProxy object
     can't connect to the real POP3 server and talk to it
-    synchronously, because that would block the process."""
+    synchronously, because that would block the process.  If
+    readCallback is given, it is called after each batch of lines
+    that arrives together."""
+
+    # Read a good deal at a time: messages can be large.
+    ac_in_buffer_size = 65536
 
     def __init__(self, serverName, serverPort, lineCallback, ssl=False,
-                 map=None):
+                 map=None, readCallback=None):
         Dibbler.BrighterAsyncChat.__init__(self, map=map)
         self.lineCallback = lineCallback
+        self.readCallback = readCallback
         self.handled_exception = False
-        self.request = ''
-        self.set_terminator('\r\n')
+        self.partial = []           # The start of an unfinished line
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         # create_socket creates a non-blocking socket.  This is not great,
         # because then socket.connect() will return errno 10035, because
@@ -212,12 +218,36 @@ class ServerLineReader(Dibbler.BrighterAsyncChat):
             else:
                 raise
 
-    def collect_incoming_data(self, data):
-        self.request = self.request + data
-
-    def found_terminator(self):
-        self.lineCallback(self.request + '\r\n')
-        self.request = ''
+    def handle_read(self):
+        """Asynchat override.  asynchat would collect each line (keeping
+        the rest of what has arrived in a string that is copied for each
+        one); we can split them up all at once."""
+        try:
+            data = self.recv(self.ac_in_buffer_size)
+        except socket.error, why:
+            self.handle_error()
+            return
+        if not data:
+            return
+        partial = self.partial
+        if partial and partial[-1].endswith('\r'):
+            # The line ending might have been split between reads.
+            partial[-1] = partial[-1][:-1]
+            data = '\r' + data
+        lines = data.split('\r\n')
+        if len(lines) == 1:
+            partial.append(data)
+            return
+        partial.append(lines[0])
+        lines[0] = ''.join(partial)
+        if lines[-1]:
+            self.partial = [lines[-1]]
+        else:
+            self.partial = []
+        for line in lines[:-1]:
+            self.lineCallback(line + '\r\n')
+        if self.readCallback is not None:
+            self.readCallback()
 
     def handle_close(self):
         self.lineCallback('')
@@ -239,19 +269,28 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
     can be the verbatim response or a processed version of it.  The
     special command 'KILL' kills it (passing a 'QUIT' command to the
     server).
+
+    If working out the response will take a while, self.onTransaction()
+    can instead call `self.deferResponse()`, return None, and later give
+    the response to `self.sendDeferred()`.  Anything else that would be
+    sent to the email client in the meantime is held back until then.
     """
 
     def __init__(self, clientSocket, serverName, serverPort,
                  ssl=False, map=Dibbler._defaultContext._map):
         Dibbler.BrighterAsyncChat.__init__(self, clientSocket)
         self.request = ''
+        self.requestData = []       # The pieces of the next request
         self.response = ''
+        self.responseLines = []     # The response so far
+        self.echoLines = []         # Lines to pass straight through
         self.set_terminator('\r\n')
         self.command = ''           # The POP3 command being processed...
         self.args = []              # ...and its arguments
         self.isClosing = False      # Has the server closed the socket?
         self.seenAllHeaders = False # For the current RETR or TOP
         self.startTime = 0          # (ditto)
+        self.held = []              # Output waiting for a deferred response
 
         if not self.onIncomingConnection(clientSocket):
             # We must refuse this connection, so pass an error back
@@ -261,7 +300,8 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
             return
 
         self.serverSocket = ServerLineReader(serverName, serverPort,
-                                             self.onServerLine, ssl, map)
+                                             self.onServerLine, ssl, map,
+                                             self.flushEcho)
 
     def onIncomingConnection(self, clientSocket):
         """Checks the security settings."""
@@ -289,8 +329,8 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
 
     def onServerLine(self, line):
         """A line of response has been received from the POP3 server."""
-        isFirstLine = not self.response
-        self.response = self.response + line
+        isFirstLine = not self.responseLines
+        self.responseLines.append(line)
 
         # Is this the line that terminates a set of headers?
         self.seenAllHeaders = self.seenAllHeaders or line in ['\r\n', '\n']
@@ -300,9 +340,11 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
             self.isClosing = True
 
         # If we're not processing a command, just echo the response.
+        # (The lines are sent all together, when the rest of those that
+        # have arrived have been dealt with - see flushEcho().)
         if not self.command:
-            self.push(self.response)
-            self.response = ''
+            self.echoLines.append(line)
+            self.responseLines = []
 
         # Time out after some seconds (30 by default) for message-retrieval
         # commands if all the headers are down.  The rest of the message
@@ -312,12 +354,10 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
            self.seenAllHeaders and time.time() > \
            self.startTime + options["pop3proxy", "retrieval_timeout"]:
             self.onResponse()
-            self.response = ''
         # If that's a complete response, handle it.
         elif not self.isMultiline() or line == '.\r\n' or \
            (isFirstLine and line.startswith('-ERR')):
             self.onResponse()
-            self.response = ''
 
     def isMultiline(self):
         """Returns True if the request should get a multiline
@@ -340,10 +380,12 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
 
     def collect_incoming_data(self, data):
         """Asynchat override."""
-        self.request = self.request + data
+        self.requestData.append(data)
 
     def found_terminator(self):
         """Asynchat override."""
+        self.request = ''.join(self.requestData)
+        self.requestData = []
         verb = self.request.strip().upper()
         if verb == 'KILL':
             self.socket.shutdown(2)
@@ -368,30 +410,159 @@ class POP3ProxyBase(Dibbler.BrighterAsyncChat):
         self.request = ''
 
     def onResponse(self):
+        self.response = ''.join(self.responseLines)
+        self.responseLines = []
+
         # There are some features, tested by clients using CAPA,
         # that we don't support.  We strip them from the CAPA
         # response here, so that the client won't use them.
-        for unsupported in ['PIPELINING', 'STLS', ]:
-            unsupportedLine = r'(?im)^%s[^\n]*\n' % (unsupported,)
-            self.response = re.sub(unsupportedLine, '', self.response)
+        if self.command == 'CAPA':
+            for unsupported in ['PIPELINING', 'STLS', ]:
+                unsupportedLine = r'(?im)^%s[^\n]*\n' % (unsupported,)
+                self.response = re.sub(unsupportedLine, '', self.response)
 
         # Pass the request and the raw response to the subclass and
         # send back the cooked response.
         if self.response:
             cooked = self.onTransaction(self.command, self.args, self.response)
-            self.push(cooked)
+            if cooked is not None:
+                self.pushResponse(cooked)
 
         # If onServerLine() decided that the server has closed its
         # socket, close this one when the response has been sent.
         if self.isClosing:
-            self.close_when_done()
+            self.pushResponse(None)
 
         # Reset.
+        self.response = ''
         self.command = ''
         self.args = []
         self.isClosing = False
         self.seenAllHeaders = False
 
+    def flushEcho(self):
+        """Send the lines that are being passed straight through to the
+        email client."""
+        if self.echoLines:
+            data = ''.join(self.echoLines)
+            self.echoLines = []
+            self._queueResponse(data)
+
+    def pushResponse(self, data):
+        """Send data to the email client, after any deferred responses
+        that it follows.  None means close the connection once everything
+        before it has been sent."""
+        self.flushEcho()
+        self._queueResponse(data)
+
+    def _queueResponse(self, data):
+        if self.held:
+            self.held.append(data)
+        elif data is None:
+            self.close_when_done()
+        else:
+            self.push(data)
+
+    def deferResponse(self):
+        """Returns a DeferredResponse to give to `self.sendDeferred()`
+        when the response to the current command is ready."""
+        deferred = DeferredResponse()
+        self.held.append(deferred)
+        return deferred
+
+    def sendDeferred(self, deferred, response):
+        """Send a deferred response, and whatever was held back behind
+        it.  This must be called from the async loop's thread."""
+        deferred.response = response
+        deferred.ready = True
+        held = self.held
+        while held and not (isinstance(held[0], DeferredResponse) and
+                            not held[0].ready):
+            data = held.pop(0)
+            if isinstance(data, DeferredResponse):
+                data = data.response
+            if self._closed:
+                # The email client has gone away.
+                continue
+            if data is None:
+                self.close_when_done()
+            else:
+                self.push(data)
+
+
+class DeferredResponse:
+    """A place in the output to an email client for a response that
+    isn't ready yet.  See `POP3ProxyBase.deferResponse()`."""
+
+    def __init__(self):
+        self.response = None
+        self.ready = False
+
+
+class ClassifierPool:
+    """A pool of threads that do the slow part of classifying messages
+    for the proxies - parsing and tokenizing them, which can involve
+    looking up hostnames and running OCR on images - so that the async
+    loop can carry on with the other connections in the meantime.
+
+    The results are handed back to the async loop's thread, which does
+    the rest (scoring, and writing to the caches), as the classifier and
+    the caches are shared with the web interface.  The threads are
+    started as they are needed, up to the classify_threads option; if
+    that is zero, each message is handled there and then."""
+
+    def __init__(self, socketMap=Dibbler._defaultContext._map):
+        self.socketMap = socketMap
+        self.trigger = None
+        self.queue = Queue.Queue()
+        self.workers = []
+        self.busy = 0       # Messages that are in the queue or being done
+
+    def _work(self):
+        while True:
+            function, args, callback = self.queue.get()
+            try:
+                result, exc_info = function(*args), None
+            except:
+                result, exc_info = None, sys.exc_info()
+            self.trigger.pull(self._done, callback, result, exc_info)
+            # Don't keep the traceback (and everything it refers to).
+            exc_info = None
+
+    def _done(self, callback, result, exc_info):
+        self.busy -= 1
+        callback(result, exc_info)
+
+    def run(self, function, args, callback):
+        """Call function(*args) in one of the threads, and then, in the
+        async loop's thread, callback(result, exc_info), where exc_info is
+        None, or sys.exc_info() if function raised an exception."""
+        threads = options["pop3proxy", "classify_threads"]
+        if threads <= 0:
+            try:
+                result, exc_info = function(*args), None
+            except:
+                result, exc_info = None, sys.exc_info()
+            callback(result, exc_info)
+            return
+        if self.trigger is None:
+            self.trigger = Dibbler.Trigger(self.socketMap)
+        self.busy += 1
+        if len(self.workers) < min(self.busy, threads):
+            worker = threading.Thread(target=self._work)
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+        self.queue.put((function, args, callback))
+
+
+def _parseMessage(messageText):
+    """Parse and tokenize a message retrieved by the proxy.  This is run
+    in one of the ClassifierPool's threads."""
+    msg = email.message_from_string(messageText,
+              _class=spambayes.message.SBHeaderMessage)
+    return msg, tuple(msg.tokenize())
+
 
 class BayesProxyListener(Dibbler.Listener):
     """Listens for incoming email client connections and spins off
@@ -521,7 +692,8 @@ class BayesProxy(POP3ProxyBase):
 
     def onRetr(self, command, args, response):
         """Adds the judgement header based on the raw headers and body
-        of the message."""
+        of the message.  The message is parsed and tokenized by the
+        classifierPool, and the response is deferred until it has been."""
         # Previously, we used '\n\r?\n' to detect the end of the headers in
         # case of broken emails that don't use the proper line separators,
         # and if we couldn't find it, then we assumed that the response was
@@ -546,13 +718,28 @@ class BayesProxy(POP3ProxyBase):
             # Must be an error response.  Return unproxied.
             return response
 
+        deferred = self.deferResponse()
+        def parsed(result, exc_info):
+            self.sendDeferred(deferred,
+                              self.addHeaders(command, args, ok, messageText,
+                                              terminatingDotPresent,
+                                              result, exc_info))
+        classifierPool.run(_parseMessage, (messageText,), parsed)
+        return None
+
+    def addHeaders(self, command, args, ok, messageText,
+                   terminatingDotPresent, result, exc_info):
+        """Classifies the message, once it has been parsed and tokenized
+        (result is the message and its tokens, or exc_info is the
+        exception that doing that raised), and returns the response
+        to send to the email client, with the judgement header added."""
         try:
-            msg = email.message_from_string(messageText,
-                      _class=spambayes.message.SBHeaderMessage)
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            msg, tokens = result
             msg.setId(state.getNewMessageName())
             # Now find the spam disposition and add the header.
-            (prob, clues) = state.bayes.spamprob(msg.tokenize(),
-                                                 evidence=True)
+            (prob, clues) = state.bayes.spamprob(tokens, evidence=True)
 
             msg.addSBHeaders(prob, clues)
 
@@ -785,6 +972,7 @@ class State:
 
         self.spamCorpus = self.hamCorpus = self.unknownCorpus = None
         self.spamTrainer = self.hamTrainer = None
+        self.reviewIndex = None
 
         self.prepared = False
         close_platform_mutex(self.platform_mutex)
@@ -871,6 +1059,7 @@ class State:
         self.stats = Stats.Stats(options, self.mdb)
 
         self.buildStatusStrings()
+        self.reviewIndex = None
 
         # Don't set up the caches and training objects when running the self-test,
         # so as not to clutter the filesystem.
@@ -886,15 +1075,19 @@ class State:
             else:
                 factory = FileMessageFactory()
             age = options["Storage", "cache_expiry_days"]*24*60*60
+            sharded = options["Storage", "cache_sharded"]
             self.spamCorpus = ExpiryFileCorpus(age, factory, sc,
                                                '[0123456789\-]*',
-                                               cacheSize=20)
+                                               cacheSize=20,
+                                               sharded=sharded)
             self.hamCorpus = ExpiryFileCorpus(age, factory, hc,
                                               '[0123456789\-]*',
-                                              cacheSize=20)
+                                              cacheSize=20,
+                                              sharded=sharded)
             self.unknownCorpus = ExpiryFileCorpus(age, factory, uc,
                                                   '[0123456789\-]*',
-                                                  cacheSize=20)
+                                                  cacheSize=20,
+                                                  sharded=sharded)
 
             # Given that (hopefully) users will get to the stage
             # where they do not need to do any more regular training to
@@ -911,6 +1104,12 @@ class State:
             self.spamCorpus.addObserver(self.spamTrainer)
             self.hamCorpus.addObserver(self.hamTrainer)
 
+            # Keep a summary of each unknown message for the Review page.
+            self.reviewIndex = reviewindex.ReviewIndex(
+                os.path.join(uc, reviewindex.REVIEW_INDEX_NAME),
+                self.unknownCorpus)
+            self.unknownCorpus.addObserver(self.reviewIndex)
+
     def getNewMessageName(self):
         # The message name is the time it arrived, with a uniquifier
         # appended if two arrive within one clock tick of each other.
@@ -960,6 +1159,7 @@ def _addressPortStr((addr, port)):
 
 state = State()
 proxyListeners = []
+classifierPool = ClassifierPool()
 def _createProxies(servers, proxyPorts):
     """Create BayesProxyListeners for all the given servers."""
     for (server, serverPort), proxyPort in zip(servers, proxyPorts):
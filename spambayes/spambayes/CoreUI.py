@@ -46,6 +46,7 @@ User interface improvements:
 __author__ = "Richie Hindle <richie@entrian.com>"
 __credits__ = "Tim Peters, Neale Pickett, Tim Stone, all the Spambayes folk."
 
+import os
 import sys
 import cgi
 import time
@@ -57,6 +58,7 @@ from spambayes.Options import options, load_options, get_pathname_option, _
 ## no i18n yet...
 ##from spambayes import i18n
 from spambayes import storage
+from spambayes import reviewindex
 from spambayes import Stats
 from spambayes.FileCorpus import FileMessageFactory, GzipFileMessageFactory
 from spambayes.FileCorpus import ExpiryFileCorpus
@@ -98,6 +100,7 @@ adv_map = (
     ('Storage',               'persistent_use_database'),
     ('Storage',               'cache_expiry_days'),
     ('Storage',               'cache_use_gzip'),
+    ('Storage',               'cache_sharded'),
     ('Storage',               'ham_cache'),
     ('Storage',               'spam_cache'),
     ('Storage',               'unknown_cache'),
@@ -406,24 +409,22 @@ class CoreUserInterface(UserInterface.UserInterface):
                 key, sourceCorpus = key
             else:
                 sourceCorpus = self.state.unknownCorpus
-            # Parse the message, get the judgement header and build a message
-            # info object for each message.
-            message = sourceCorpus[key]
+            # Get the judgement and build a message info object for each
+            # message, from its summary in the review index if there is
+            # one, so that the message needn't be parsed.
+            if sourceCorpus is self.state.unknownCorpus:
+                index = self.state.review_index
+            else:
+                index = None
             try:
-                message.load()
+                judgement, messageInfo = \
+                           self._reviewMessageInfo(key, sourceCorpus, index)
             except IOError:
                 # Someone has taken this file away from us.  It was
                 # probably a virus protection program, so that's ok.
                 # Don't list it in the review, though.
                 invalid_keys.append(key)
                 continue
-            judgement = message[options["Headers",
-                                        "classification_header_name"]]
-            if judgement is None:
-                judgement = options["Headers", "header_unsure_string"]
-            else:
-                judgement = judgement.split(';')[0].strip()
-            messageInfo = self._makeMessageInfo(message)
             keyedMessageInfo[judgement].append((key, messageInfo))
         for key in invalid_keys:
             keys.remove(key)
@@ -628,6 +629,7 @@ class CoreState:
 
         self.spamCorpus = self.hamCorpus = self.unknownCorpus = None
         self.spam_trainer = self.ham_trainer = None
+        self.review_index = None
 
         self.init()
 
@@ -666,10 +668,12 @@ class CoreState:
                 self.bayes.store()
             self.bayes.close()
             self.bayes = None
+        spambayes.message.Message().message_info_db.close()
         spambayes.message.Message().message_info_db = None
 
         self.spamCorpus = self.hamCorpus = self.unknownCorpus = None
         self.spam_trainer = self.ham_trainer = None
+        self.review_index = None
 
         self.prepared = False
         self.close_platform_mutex()
@@ -765,15 +769,19 @@ class CoreState:
             else:
                 factory = FileMessageFactory()
             age = options["Storage", "cache_expiry_days"]*24*60*60
+            sharded = options["Storage", "cache_sharded"]
             self.spamCorpus = ExpiryFileCorpus(age, factory, sc,
                                                '[0123456789\-]*',
-                                               cacheSize=20)
+                                               cacheSize=20,
+                                               sharded=sharded)
             self.hamCorpus = ExpiryFileCorpus(age, factory, hc,
                                               '[0123456789\-]*',
-                                              cacheSize=20)
+                                              cacheSize=20,
+                                              sharded=sharded)
             self.unknownCorpus = ExpiryFileCorpus(age, factory, uc,
                                                   '[0123456789\-]*',
-                                                  cacheSize=20)
+                                                  cacheSize=20,
+                                                  sharded=sharded)
 
             # Given that (hopefully) users will get to the stage
             # where they do not need to do any more regular training to
@@ -790,6 +798,12 @@ class CoreState:
             self.spamCorpus.addObserver(self.spam_trainer)
             self.hamCorpus.addObserver(self.ham_trainer)
 
+            # Keep a summary of each unknown message for the Review page.
+            self.review_index = reviewindex.ReviewIndex(
+                os.path.join(uc, reviewindex.REVIEW_INDEX_NAME),
+                self.unknownCorpus)
+            self.unknownCorpus.addObserver(self.review_index)
+
     def getNewMessageName(self):
         """The message name is the time it arrived with a uniquifier
         appended if two arrive within one clock tick of each other.
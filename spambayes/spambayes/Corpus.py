@@ -21,8 +21,13 @@ Abstract:
     objects in memory until the corpus instance itself is destroyed.
     In large corpora, this could consume a large amount of memory.  A
     cacheSize operand is implemented on the constructor, which is used
-    to limit the *number* of messages currently loaded into memory.
-    The instance variable that implements this cache is
+    to limit the *number* of messages currently loaded into memory,
+    and a cacheBytes operand, which limits their total size (as given
+    by messageSize()).  When the cache is full, the least recently used
+    message is dropped from memory.  The keysInMemory instance variable
+    is an lrucache.LRUCache that keeps track of the messages that are
+    loaded, and counts cache hits, misses and evictions.
+    The instance variable that holds the messages is
     Corpus.Corpus.msgs, a dictionary.  Access to this variable should
     be through keys(), [key], or using an iterator.  Direct access
     should not be used, as subclasses that manage their cache may use
@@ -45,7 +50,10 @@ Abstract:
     As messages pass their "expiration date," they are eligible for
     removal from the corpus. To remove them properly,
     removeExpiredMessages() should be called.  As messages are removed,
-    observers are notified.
+    observers are notified.  ExpiryCorpus keeps the creation times of
+    the messages in a heap, so that this only needs to look at the
+    messages that have expired (and, the first time, at every message,
+    to build the heap).
 
     ExpiryCorpus function is included into a concrete Corpus through
     multiple inheritance. It must be inherited before any inheritance
@@ -83,8 +91,15 @@ __credits__ = "Richie Hindle, Tim Peters, all the spambayes contributors."
 
 import sys           # for output of docstring
 import time
+import threading
+
+try:
+    from heapq import heappush, heappop, heapify
+except ImportError:
+    from spambayes.compatheapq import heappush, heappop, heapify
 
 from spambayes.Options import options
+from spambayes.lrucache import LRUCache
 
 SPAM = True
 HAM = False
@@ -92,14 +107,15 @@ HAM = False
 class Corpus:
     '''An observable dictionary of Messages'''
 
-    def __init__(self, factory, cacheSize=-1):
+    def __init__(self, factory, cacheSize=-1, cacheBytes=0):
         '''Constructor(MessageFactory)'''
 
         self.msgs = {}            # dict of all messages in corpus
                                   # value is None if msg not currently loaded
-        self.keysInMemory = []    # keys of messages currently loaded
-                                  # this *could* be derived by iterating msgs
+        # keys of messages currently loaded, least recently used first
+        self.keysInMemory = LRUCache(None, on_evict=self._evictMessage)
         self.cacheSize = cacheSize  # max number of messages in memory
+        self.cacheBytes = cacheBytes  # max total size of messages in memory
         self.observers = []       # observers of this corpus
         self.factory = factory    # factory for the correct Message subclass
 
@@ -148,13 +164,21 @@ class Corpus:
 
         self.msgs[key] = message
 
-        # Here is where we manage the in-memory cache size...
-        self.keysInMemory.append(key)
-
-        if self.cacheSize > 0:       # performance optimization
-            if len(self.keysInMemory) > self.cacheSize:
-                keyToFlush = self.keysInMemory[0]
-                self.unCacheMessage(keyToFlush)
+        # Here is where we manage the in-memory cache size; the cache
+        # calls _evictMessage for any messages that no longer fit.
+        cache = self.keysInMemory
+        if self.cacheSize > 0:
+            cache.maxsize = self.cacheSize
+        else:
+            cache.maxsize = None
+        cache.maxbytes = self.cacheBytes
+        # Only measure messages if there is a limit on their total size,
+        # since messageSize() may need to look at the file system.
+        if self.cacheBytes:
+            cache.sizeof = self.messageSize
+        else:
+            cache.sizeof = None
+        cache[key] = message
 
     def unCacheMessage(self, key):
         '''Remove a message from the in-memory cache'''
@@ -163,15 +187,22 @@ class Corpus:
         if options["globals", "verbose"]:
             print 'Flushing %s from corpus cache' % (key,)
 
-        try:
-            ki = self.keysInMemory.index(key)
-        except ValueError:
-            pass
-        else:
-            del self.keysInMemory[ki]
+        if key in self.keysInMemory:
+            del self.keysInMemory[key]
+
+        self.msgs[key] = None
 
+    def _evictMessage(self, key, message):
+        '''Called when the cache drops the least recently used message'''
+        if options["globals", "verbose"]:
+            print 'Flushing %s from corpus cache' % (key,)
         self.msgs[key] = None
 
+    def messageSize(self, message):
+        '''The size of a message, for limiting the size of the cache'''
+        # This method will likely be overridden
+        return 0
+
     def takeMessage(self, key, fromcorpus, fromCache=False):
         '''Move a Message from another corpus to this corpus'''
         msg = fromcorpus[key]
@@ -195,8 +226,12 @@ class Corpus:
             raise KeyError(key)
 
         if amsg is None:
+            self.keysInMemory.misses += 1
             amsg = self.makeMessage(key)     # lazy init, saves memory
             self.cacheMessage(amsg)
+        elif key in self.keysInMemory:
+            # Counts a hit, and makes this the most recently used message.
+            self.keysInMemory[key]
 
         return amsg
 
@@ -236,6 +271,38 @@ class ExpiryCorpus:
         self.expireBefore = expireBefore
         # Only check for expiry after this time.
         self.expiry_due = time.time()
+        # A heap of (creation time, key) for the messages in the corpus,
+        # oldest first, and a dict of the keys in the heap.  Messages
+        # added to the corpus are put in the heap at the next check;
+        # messages removed from the corpus are dropped when they come to
+        # the top.
+        self.expiryHeap = []
+        self.expiryKeys = {}
+        # Held while checking for expired messages; sb_server starts a
+        # thread to check each corpus whenever a client logs in, so two
+        # checks may otherwise run on the heap at once.
+        self.expiryLock = threading.Lock()
+
+    def messageTimestamp(self, key):
+        '''The creation time of the message with this key'''
+        # This method will likely be overridden
+        return self[key].createTimestamp()
+
+    def updateExpiryIndex(self):
+        '''Put any messages that aren't in the expiry heap into it'''
+        heap = self.expiryHeap
+        indexed = self.expiryKeys
+        if not heap:
+            # Building the heap in one go is quicker.
+            heap.extend([(self.messageTimestamp(key), key)
+                         for key in self.keys()])
+            heapify(heap)
+            indexed.update(dict.fromkeys(self.keys(), True))
+            return
+        for key in self.keys():
+            if key not in indexed:
+                indexed[key] = True
+                heappush(heap, (self.messageTimestamp(key), key))
 
     def removeExpiredMessages(self):
         '''Kill expired messages'''
@@ -246,18 +313,41 @@ class ExpiryCorpus:
         # return.
         if time.time() < self.expiry_due:
             return
-
-        self.expiry_due = time.time() + self.expireBefore
-        for key in self.keys()[:]:
+        if not self.expiryLock.acquire(False):
+            # Another thread is already checking.
+            return
+        try:
+            self.expiry_due = time.time() + self.expireBefore
+            self._removeExpiredMessages()
+        finally:
+            self.expiryLock.release()
+
+    def _removeExpiredMessages(self):
+        self.updateExpiryIndex()
+        heap = self.expiryHeap
+        expired = time.time() - self.expireBefore
+        while heap and heap[0][0] < expired:
+            timestamp, key = heappop(heap)
+            if key not in self.msgs:
+                # Already removed.
+                self.expiryKeys.pop(key, None)
+                continue
+            # The message might have been replaced since it was put in
+            # the heap, so check that it really has expired.
+            timestamp = self.messageTimestamp(key)
+            if timestamp >= expired:
+                heappush(heap, (timestamp, key))
+                continue
+            self.expiryKeys.pop(key, None)
             msg = self[key]
-            timestamp = msg.createTimestamp()
-            if timestamp < time.time() - self.expireBefore:
-                if options["globals", "verbose"]:
-                    print 'message %s has expired' % (msg.key(),)
-                from spambayes.storage import NO_TRAINING_FLAG
-                self.removeMessage(msg, observer_flags=NO_TRAINING_FLAG)
-            elif timestamp + self.expireBefore < self.expiry_due:
-                self.expiry_due = timestamp + self.expireBefore
+            if options["globals", "verbose"]:
+                print 'message %s has expired' % (msg.key(),)
+            from spambayes.storage import NO_TRAINING_FLAG
+            self.removeMessage(msg, observer_flags=NO_TRAINING_FLAG)
+        if heap:
+            self.expiry_due = heap[0][0] + self.expireBefore
+        else:
+            self.expiry_due = time.time() + self.expireBefore
 
 
 class MessageFactory(object):
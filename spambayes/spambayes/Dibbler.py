@@ -152,6 +152,23 @@ You can either call `Dibbler.run(context)` to run the async loop, or call
 few more options, like launching the web browser automatically.
 
 
+*Dibbler and threads*
+
+Everything in a Dibbler application happens in the thread that runs the
+async loop, so anything slow holds up every connection.  Slow work can
+be given to other threads, but those mustn't touch the asyncore objects
+themselves; instead they can use a `Dibbler.Trigger` to have a function
+called in the loop's thread:
+
+>>> trigger = Dibbler.Trigger()
+>>> def work(channel):
+>>>     result = slowFunction()
+>>>     trigger.pull(channel.push, result)
+
+The trigger wakes up the async loop, which calls `channel.push(result)`
+as soon as it gets round to it.
+
+
 *Self-test*
 
 Running `Dibbler.py` directly as a script runs the example calendar server
@@ -169,7 +186,7 @@ try:
 except ImportError:
     import StringIO
 
-import sys, re, time, traceback, base64
+import sys, re, time, traceback, base64, threading
 import socket, cgi, urlparse, webbrowser
 
 try:
@@ -191,6 +208,9 @@ class BrighterAsyncChat(asynchat.async_chat):
     flush its output, and will correctly remove itself from a non-default
     socket map on `close()`."""
 
+    # asynchat sends at most this much at a time.
+    ac_out_buffer_size = 65536
+
     def __init__(self, conn=None, map=None):
         """See `asynchat.async_chat`."""
         asynchat.async_chat.__init__(self, conn)
@@ -209,6 +229,18 @@ class BrighterAsyncChat(asynchat.async_chat):
         else:
             asynchat.async_chat.handle_error(self)
 
+    def push(self, data):
+        """See `asynchat.async_chat`.  A large string is queued in pieces
+        the size of the output buffer: asynchat's simple_producer would
+        give it out in 512 byte pieces, copying the rest each time."""
+        size = self.ac_out_buffer_size
+        if len(data) <= size:
+            self.producer_fifo.push(data)
+        else:
+            for start in xrange(0, len(data), size):
+                self.producer_fifo.push(data[start:start+size])
+        self.initiate_send()
+
     def flush(self):
         """Flush everything in the output buffer."""
         # We check self._closed here because of the case where
@@ -240,6 +272,80 @@ class Context:
 _defaultContext = Context()
 
 
+class Trigger(asyncore.dispatcher):
+    """Lets other threads have functions called in the thread that runs
+    the async loop.  See the main documentation for details."""
+
+    def __init__(self, socketMap=_defaultContext._map):
+        # A pair of connected sockets: writing to one wakes up the loop,
+        # which is waiting for something to read from the other.  (A pipe
+        # would do on Unix, but Windows can only select() sockets.)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sender.connect(listener.getsockname())
+        self.sender.setblocking(False)
+        receiver, address = listener.accept()
+        listener.close()
+        asyncore.dispatcher.__init__(self, receiver, socketMap)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def pull(self, function, *args):
+        """Call function(*args) in the async loop's thread, soon.  This
+        may be called from any thread."""
+        self.lock.acquire()
+        try:
+            self.calls.append((function, args))
+        finally:
+            self.lock.release()
+        try:
+            self.sender.send('x')
+        except socket.error:
+            # The socket's buffer is full, so the loop is going to wake
+            # up anyway.
+            pass
+
+    def readable(self):
+        """Asyncore override."""
+        return True
+
+    def writable(self):
+        """Asyncore override."""
+        return False
+
+    def handle_connect(self):
+        """Suppresses the asyncore "unhandled connect event" warning."""
+        pass
+
+    def handle_read(self):
+        """Asyncore override."""
+        try:
+            self.recv(8192)
+        except socket.error:
+            pass
+        self.lock.acquire()
+        try:
+            calls = self.calls
+            self.calls = []
+        finally:
+            self.lock.release()
+        for function, args in calls:
+            # An exception in one call shouldn't stop the others, or
+            # close the trigger (which is what asyncore would do).
+            try:
+                function(*args)
+            except SystemExit:
+                raise
+            except:
+                traceback.print_exc()
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self.sender.close()
+
+
 class Listener(asyncore.dispatcher):
     """Generic listener class used by all the different types of server.
     Listens for incoming socket connections and calls a factory function
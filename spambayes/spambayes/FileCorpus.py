@@ -14,7 +14,16 @@ Abstract:
     These classes are concrete implementations of the Corpus framework.
 
     FileCorpus is designed to manage corpora that are directories of
-    message files.
+    message files.  With a large corpus, a single directory is slow to
+    list and to work with, so a FileCorpus can instead be "sharded": the
+    messages are spread over (up to 256) subdirectories, named by the
+    first two hex digits of the md5 digest of the key, and a manifest
+    file in the corpus directory lists the key, size, creation time and
+    classification of every message.  Opening a sharded corpus just
+    reads the manifest.  A flat directory is sharded (and a sharded one
+    flattened again) automatically when it is opened.
+
+    Manifest is the log of the messages in a sharded corpus.
 
     ExpiryFileCorpus is an ExpiryCorpus of file messages.
 
@@ -50,17 +59,119 @@ from spambayes import Corpus
 from spambayes import message
 import os, gzip, fnmatch, time, stat
 from spambayes.Options import options
+from spambayes.port import md5
+
+MANIFEST_NAME = "manifest.txt"
+
+class Manifest(object):
+    '''The messages in a sharded corpus directory'''
+
+    # The manifest file is a log: a line is added for each message that
+    # is added ("+", key, size, timestamp, classification, tab
+    # separated) or removed ("-", key).  When more than half the lines
+    # are out of date, the file is rewritten when it is next opened.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}   # key -> (size, timestamp, classification)
+        self.stale = 0      # number of out of date lines in the file
+        if os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        '''Read the manifest file'''
+        entries = self.entries
+        fp = open(self.filename, "rb")
+        lines = 0
+        for line in fp:
+            lines += 1
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "+" and len(fields) == 5:
+                try:
+                    entries[fields[1]] = (int(fields[2]), float(fields[3]),
+                                          fields[4])
+                except ValueError:
+                    pass
+            elif fields[0] == "-" and len(fields) == 2:
+                entries.pop(fields[1], None)
+            # Anything else is a line that wasn't finished (perhaps the
+            # machine crashed), and is ignored.
+        fp.close()
+        self.stale = lines - len(entries)
+        if self.stale > len(entries):
+            self.compact()
+
+    def compact(self):
+        '''Rewrite the manifest file without the out of date lines'''
+        tmp = self.filename + ".tmp"
+        fp = open(tmp, "wb")
+        for key, entry in self.entries.iteritems():
+            fp.write(self._addLine(key, entry))
+        fp.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmp, self.filename)
+        self.stale = 0
+
+    def _addLine(self, key, entry):
+        size, timestamp, classification = entry
+        return "+\t%s\t%d\t%r\t%s\n" % (key, size, timestamp,
+                                        classification)
+
+    def _append(self, line):
+        fp = open(self.filename, "ab")
+        fp.write(line)
+        fp.close()
+
+    def add(self, key, size, timestamp, classification=""):
+        '''Record a message'''
+        # Tabs and line breaks would break the file.
+        classification = " ".join((classification or "").split())
+        if key in self.entries:
+            self.stale += 1
+        self.entries[key] = (size, timestamp, classification)
+        self._append(self._addLine(key, self.entries[key]))
+
+    def remove(self, key):
+        '''Forget a message'''
+        if self.entries.pop(key, None) is not None:
+            self.stale += 2
+            self._append("-\t%s\n" % (key,))
+
+def shard_name(key):
+    '''The subdirectory of a sharded corpus that holds a message'''
+    return md5(key).hexdigest()[:2]
+
+def _is_shard_name(name):
+    if len(name) != 2:
+        return False
+    for c in name:
+        if c not in "0123456789abcdef":
+            return False
+    return True
 
 class FileCorpus(Corpus.Corpus):
 
-    def __init__(self, factory, directory, filter='*', cacheSize=250):
+    def __init__(self, factory, directory, filter='*', cacheSize=250,
+                 cacheBytes=0, sharded=False):
         '''Constructor(FileMessageFactory, corpus directory name, fnmatch
 filter'''
 
-        Corpus.Corpus.__init__(self, factory, cacheSize)
+        Corpus.Corpus.__init__(self, factory, cacheSize, cacheBytes)
 
         self.directory = directory
         self.filter = filter
+        self.sharded = sharded
+        self.manifest = None
+
+        manifest_name = os.path.join(directory, MANIFEST_NAME)
+        if sharded:
+            self._shard(not os.path.exists(manifest_name))
+            for key in fnmatch.filter(self.manifest.entries.keys(), filter):
+                self.msgs[key] = None
+            return
+        if os.path.exists(manifest_name):
+            self._unshard()
 
         # This assumes that the directory exists.  A horrible death occurs
         # otherwise. We *could* simply create it, but that will likely only
@@ -81,11 +192,104 @@ filter'''
             if fnmatch.fnmatch(filename, filter):
                 self.msgs[filename] = None
 
+    def _shard(self, rebuild):
+        '''Open the manifest, moving any messages in the corpus directory
+        itself into their shards.  If rebuild is true, there is no
+        manifest yet, so one is made from the messages in the shards.'''
+        manifest_name = os.path.join(self.directory, MANIFEST_NAME)
+        if rebuild:
+            # Build the manifest under a temporary name, so that if this
+            # is interrupted it will be started again next time.
+            if options["globals", "verbose"]:
+                print 'sharding', self.directory
+            if os.path.exists(manifest_name + ".new"):
+                os.remove(manifest_name + ".new")
+            self.manifest = Manifest(manifest_name + ".new")
+        else:
+            self.manifest = Manifest(manifest_name)
+        # Once a directory is sharded, this is quick, as the only things
+        # in the corpus directory are the shards and the manifest.
+        for name in os.listdir(self.directory):
+            pathname = os.path.join(self.directory, name)
+            if os.path.isdir(pathname):
+                if rebuild and _is_shard_name(name):
+                    for key in os.listdir(pathname):
+                        if fnmatch.fnmatch(key, self.filter):
+                            self._addToManifest(key)
+            elif fnmatch.fnmatch(name, self.filter) and \
+                 not name.startswith(MANIFEST_NAME):
+                # Keep the original creation time, which the move would
+                # lose.
+                timestamp = os.stat(pathname)[stat.ST_CTIME]
+                self._ensureShard(name)
+                os.rename(pathname, os.path.join(self.messageDirectory(name),
+                                                 name))
+                self._addToManifest(name, timestamp)
+        if rebuild:
+            self.manifest.compact()
+            os.rename(self.manifest.filename, manifest_name)
+            self.manifest.filename = manifest_name
+
+    def _unshard(self):
+        '''Move the messages of a sharded corpus directory back into the
+        directory itself, and remove the manifest'''
+        if options["globals", "verbose"]:
+            print 'unsharding', self.directory
+        for name in os.listdir(self.directory):
+            pathname = os.path.join(self.directory, name)
+            if os.path.isdir(pathname) and _is_shard_name(name):
+                for key in os.listdir(pathname):
+                    os.rename(os.path.join(pathname, key),
+                              os.path.join(self.directory, key))
+                os.rmdir(pathname)
+        os.remove(os.path.join(self.directory, MANIFEST_NAME))
+
+    def _addToManifest(self, key, timestamp=None):
+        '''Add an entry for the message file with this key to the
+        manifest'''
+        msg = self.makeMessage(key)
+        try:
+            msg.load()
+        except IOError:
+            classification = ""
+        else:
+            classification = msg[options["Headers",
+                                         "classification_header_name"]]
+        stats = os.stat(msg.pathname())
+        if timestamp is None:
+            timestamp = stats[stat.ST_CTIME]
+        self.manifest.add(key, stats[stat.ST_SIZE], timestamp,
+                          classification)
+
+    def messageDirectory(self, key):
+        '''The directory that the message with this key is kept in'''
+        if self.sharded:
+            return os.path.join(self.directory, shard_name(key))
+        return self.directory
+
+    def _ensureShard(self, key):
+        directory = self.messageDirectory(key)
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+
     def makeMessage(self, key, content=None):
         '''Ask our factory to make a Message'''
-        msg = self.factory.create(key, self.directory, content)
+        msg = self.factory.create(key, self.messageDirectory(key), content)
         return msg
 
+    def messageSize(self, message):
+        '''The size of a message, for limiting the size of the cache'''
+        if self.manifest is not None:
+            entry = self.manifest.entries.get(message.key())
+            if entry is not None:
+                return entry[0]
+        # The size of the file is near enough, and doesn't need the
+        # message to be loaded.
+        try:
+            return os.path.getsize(message.pathname())
+        except OSError:
+            return 0
+
     def addMessage(self, message, observer_flags=0):
         '''Add a Message to this corpus'''
         if not fnmatch.fnmatch(message.key(), self.filter):
@@ -94,8 +298,19 @@ filter'''
         if options["globals", "verbose"]:
             print 'adding', message.key(), 'to corpus'
 
-        message.directory = self.directory
+        key = message.key()
+        message.directory = self.messageDirectory(key)
+        if self.sharded:
+            self._ensureShard(key)
         message.store()
+        if self.manifest is not None:
+            try:
+                size = os.path.getsize(message.pathname())
+            except OSError:
+                size = 0
+            self.manifest.add(key, size, time.time(),
+                              message[options["Headers",
+                                              "classification_header_name"]])
         # superclass processing *MUST* be done
         # perform superclass processing *LAST!*
         Corpus.Corpus.addMessage(self, message, observer_flags)
@@ -106,6 +321,8 @@ filter'''
             print 'removing', message.key(), 'from corpus'
 
         message.remove()
+        if self.manifest is not None:
+            self.manifest.remove(message.key())
 
         # superclass processing *MUST* be done
         # perform superclass processing *LAST!*
@@ -135,12 +352,28 @@ filter'''
 class ExpiryFileCorpus(Corpus.ExpiryCorpus, FileCorpus):
     '''FileCorpus of "young" file system artifacts'''
 
-    def __init__(self, expireBefore, factory, directory, filter='*', cacheSize=250):
+    def __init__(self, expireBefore, factory, directory, filter='*',
+                 cacheSize=250, cacheBytes=0, sharded=False):
         '''Constructor(FileMessageFactory, corpus directory name, fnmatch
 filter'''
 
         Corpus.ExpiryCorpus.__init__(self, expireBefore)
-        FileCorpus.__init__(self, factory, directory, filter, cacheSize)
+        FileCorpus.__init__(self, factory, directory, filter, cacheSize,
+                            cacheBytes, sharded)
+
+    def messageTimestamp(self, key):
+        '''The creation time of the message with this key'''
+        if self.manifest is not None:
+            entry = self.manifest.entries.get(key)
+            if entry is not None:
+                return entry[1]
+        # This is FileMessage.createTimestamp(), without having to make
+        # (and cache) a message.
+        try:
+            return os.stat(os.path.join(self.messageDirectory(key),
+                                        key))[stat.ST_CTIME]
+        except OSError:
+            return time.time()
 
 
 class FileMessage(object):
@@ -6,9 +6,12 @@ from __future__ import division
 
 import sys
 import os
-import tempfile
 import math
+import time
+import Queue
 import atexit
+import threading
+import subprocess
 try:
     import cStringIO as StringIO
 except ImportError:
@@ -87,15 +90,6 @@ def imconcatlr(left, right):
     result.paste(right, (w1, 0))
     return result
 
-def imconcattb(upper, lower):
-    """Concatenate two images top to bottom."""
-    w1, h1 = upper.size
-    w2, h2 = lower.size
-    result = Image.new("RGB", (max(w1, w2), h1 + h2))
-    result.paste(upper, (0, 0))
-    result.paste(lower, (0, h1))
-    return result
-
 def PIL_decode_parts(parts):
     """Decode and assemble a bunch of images using PIL."""
     tokens = set()
@@ -175,16 +169,38 @@ def PIL_decode_parts(parts):
     if not rows:
         return [], tokens
 
-    # now concatenate the resulting row images top-to-bottom
-    full_image, rows = rows[0], rows[1:]
+    # Each row is OCRed separately (and at the same time, see
+    # ImageStripper.extract_ocr_info), top to bottom.
+    images = []
     for image in rows:
-        full_image = imconcattb(full_image, image)
-
-    fd, pnmfile = tempfile.mkstemp('-spambayes-image')
-    os.close(fd)
-    full_image.save(open(pnmfile, "wb"), "PPM")
-
-    return [pnmfile], tokens
+        pnm = StringIO.StringIO()
+        image.save(pnm, "PPM")
+        images.append(pnm.getvalue())
+
+    return images, tokens
+
+def parts_key(engine_name, parts):
+    """Return the key for the OCR information for these image parts in the
+    cache, which can be found without decoding the images."""
+    key = md5(repr((engine_name, options["Tokenizer", "max_image_size"],
+                    options["Tokenizer", "ocrad_scale"],
+                    options["Tokenizer", "ocrad_charset"])))
+    for part in parts:
+        key.update(part.get_content_type())
+        nbytes = getattr(part, image_large_size_attribute, None)
+        if nbytes is not None:
+            key.update("large:%d" % (nbytes,))
+            continue
+        try:
+            payload = part.get_payload(decode=True)
+        except:
+            payload = None
+        if payload is None:
+            key.update("invalid")
+        else:
+            key.update("%d:" % (len(payload),))
+            key.update(payload)
+    return key.hexdigest()
 
 class OCREngine(object):
     """Base class for an OCR "engine" that extracts text.  Ideally would
@@ -204,8 +220,15 @@ class OCREngine(object):
         """
         raise NotImplementedError
 
-    def extract_text(self, pnmfiles):
-        """Extract the text as an unprocessed stream (but as a string).
+    def start(self):
+        """Start extracting text from a PNM image, which will be written to
+           the standard input of the returned subprocess.Popen object.
+        """
+        raise NotImplementedError
+
+    def extract_text(self, process, data):
+        """Extract the text from the PNM image data, using a process
+           returned by start(), as an unprocessed stream (but as a string).
            Typically this will be the raw output from the OCR engine.
         """
         raise NotImplementedError
@@ -232,13 +255,20 @@ class OCRExecutableEngine(OCREngine):
     def get_command_line(self, pnmfile):
         raise NotImplementedError, "base classes must override"
 
-    def extract_text(self, pnmfile):
+    def start(self):
+        # The image is read from stdin.
+        cmdline = self.get_command_line("-")
+        if sys.platform != "win32":
+            # Replace the shell, so that the engine can be killed.
+            cmdline = "exec " + cmdline
+        return subprocess.Popen(cmdline, shell=True, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+
+    def extract_text(self, process, data):
         # Generically reads output from stdout.
         assert self.is_enabled(), "I'm not working!"
-        cmdline = self.get_command_line(pnmfile)
-        ocr = os.popen(cmdline)
-        ret = ocr.read()
-        exit_code = ocr.close()
+        ret = process.communicate(data)[0]
+        exit_code = process.returncode
         if exit_code:
             raise SystemError, ("%s failed with exit code %s" %
                                 (self.engine_name, exit_code))
@@ -283,6 +313,58 @@ def get_engine(engine_name):
             return engine
     return None
 
+class OCRJob:
+    """Running the OCR engine on one image, in one of the ImageStripper's
+    worker threads."""
+    def __init__(self, engine, data, done):
+        self.engine = engine
+        self.data = data
+        self.done = done        # Queue to put the finished job on
+        self.process = None
+        self.cancelled = False
+        self.timed_out = False
+        self.text = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        self.lock.acquire()
+        try:
+            if self.cancelled:
+                return
+            try:
+                self.process = self.engine.start()
+            except OSError, msg:
+                self.error = msg
+        finally:
+            self.lock.release()
+        if self.process is not None:
+            try:
+                self.text = self.engine.extract_text(self.process, self.data)
+            except (SystemError, OSError, IOError), msg:
+                self.error = msg
+        self.done.put(self)
+
+    def cancel(self):
+        """Stop the job, if it hasn't finished, and mark it as timed out
+        (whatever text or error it ends up with is not to be used)."""
+        self.lock.acquire()
+        try:
+            self.cancelled = True
+            self.timed_out = True
+            process = self.process
+        finally:
+            self.lock.release()
+        if process is not None and process.returncode is None:
+            try:
+                if hasattr(process, "kill"):
+                    process.kill()
+                elif hasattr(os, "kill"):
+                    os.kill(process.pid, 15)
+            except OSError:
+                # It has just finished.
+                pass
+
 class ImageStripper:
     def __init__(self, cachefile=""):
         self.cachefile = os.path.expanduser(cachefile)
@@ -294,52 +376,113 @@ class ImageStripper:
         if self.cachefile:
             atexit.register(self.close)
         self.engine = None
-    
-    def extract_ocr_info(self, pnmfiles):
+        # The OCR engine is run in worker threads, started as they are
+        # needed, so that all the images in a message (and the images in
+        # messages being tokenized in other threads) are done at once.
+        self.queue = Queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def _work(self):
+        while True:
+            self.queue.get().run()
+
+    def _start_workers(self, njobs):
+        self.lock.acquire()
+        try:
+            while len(self.workers) < \
+                  min(njobs, options["Tokenizer", "ocr_threads"]):
+                worker = threading.Thread(target=self._work)
+                worker.setDaemon(True)
+                worker.start()
+                self.workers.append(worker)
+        finally:
+            self.lock.release()
+
+    def run_ocr(self, images):
+        """Run the OCR engine on each of the images (PNM image data), at
+        the same time, and return the OCRJob for each.  Jobs that haven't
+        finished within the ocr_timeout are cancelled, and marked as
+        timed out."""
+        done = Queue.Queue()
+        jobs = [OCRJob(self.engine, data, done) for data in images]
+        self._start_workers(len(jobs))
+        for job in jobs:
+            self.queue.put(job)
+        deadline = time.time() + options["Tokenizer", "ocr_timeout"]
+        finished = {}
+        while len(finished) < len(jobs):
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                job = done.get(True, timeout)
+            except Queue.Empty:
+                break
+            finished[id(job)] = True
+        for job in jobs:
+            if id(job) not in finished:
+                job.cancel()
+        return jobs
+
+    def extract_ocr_info(self, images):
         assert self.engine, "must have an engine!"
-        textbits = []
-        tokens = set()
-        for pnmfile in pnmfiles:
-            preserve = False
-            fhash = md5(open(pnmfile).read()).hexdigest()
+        results = [None] * len(images)
+        misses = []
+        jobs = []
+        for i, data in enumerate(images):
+            fhash = md5(data).hexdigest()
             if fhash in self.cache:
                 self.hits += 1
-                ctext, ctokens = self.cache[fhash]
+                results[i] = self.cache[fhash]
             else:
                 self.misses += 1
-                if self.engine.program:
-                    try:
-                        ctext = self.engine.extract_text(pnmfile).lower()
-                    except SystemError, msg:
-                        print >> sys.stderr, msg
-                        preserve = True
-                        ctext = ""
-                else:
-                    # We should not get here if no OCR is enabled.  If it
-                    # is enabled and we have no program, its OK to spew lots
-                    # of warnings - they should either disable OCR (it is by
-                    # default), or fix their config.
-                    print >> sys.stderr, \
-                          "No OCR program '%s' available - can't get text!" \
-                          % (self.engine.engine_name,)
-                    ctext = ""
-                ctokens = set()
-                if not ctext.strip():
-                    # Lots of spam now contains images in which it is
-                    # difficult or impossible (using ocrad) to find any
-                    # text.  Make a note of that.
-                    ctokens.add("image-text:no text found")
-                else:
-                    nlines = len(ctext.strip().split("\n"))
-                    if nlines:
-                        ctokens.add("image-text-lines:%d" % int(log2(nlines)))
-                self.cache[fhash] = (ctext, ctokens)
+                misses.append((i, fhash, data))
+        if misses and not self.engine.program:
+            # We should not get here if no OCR is enabled.  If it
+            # is enabled and we have no program, its OK to spew lots
+            # of warnings - they should either disable OCR (it is by
+            # default), or fix their config.
+            print >> sys.stderr, \
+                  "No OCR program '%s' available - can't get text!" \
+                  % (self.engine.engine_name,)
+            jobs = [None] * len(misses)
+        elif misses:
+            jobs = self.run_ocr([data for i, fhash, data in misses])
+
+        complete = True
+        for (i, fhash, data), job in zip(misses, jobs):
+            ctext = ""
+            if job is not None:
+                if job.timed_out:
+                    # It took too long; perhaps it won't next time.
+                    print >> sys.stderr, "%s timed out" % \
+                          (self.engine.engine_name,)
+                    complete = False
+                    results[i] = ("", set())
+                    continue
+                elif job.error is not None:
+                    print >> sys.stderr, job.error
+                elif job.text is not None:
+                    ctext = job.text.lower()
+            ctokens = set()
+            if not ctext.strip():
+                # Lots of spam now contains images in which it is
+                # difficult or impossible (using ocrad) to find any
+                # text.  Make a note of that.
+                ctokens.add("image-text:no text found")
+            else:
+                nlines = len(ctext.strip().split("\n"))
+                if nlines:
+                    ctokens.add("image-text-lines:%d" % int(log2(nlines)))
+            self.cache[fhash] = results[i] = (ctext, ctokens)
+
+        textbits = []
+        tokens = set()
+        for ctext, ctokens in results:
             textbits.append(ctext)
             tokens |= ctokens
-            if not preserve:
-                os.unlink(pnmfile)
-
-        return "\n".join(textbits), tokens
+        return "\n".join(textbits), tokens, complete
 
     def analyze(self, engine_name, parts):
         # check engine hasn't changed...
@@ -357,16 +500,25 @@ class ImageStripper:
         if not parts:
             return "", set()
 
-        if Image is not None:
-            pnmfiles, tokens = PIL_decode_parts(parts)
-        else:
+        if Image is None:
             return "", set()
 
-        if pnmfiles:
-            text, new_tokens = self.extract_ocr_info(pnmfiles)
-            return text, tokens | new_tokens
-
-        return "", tokens
+        # Decoding the images is slow, too, so look for all of them in
+        # the cache first.
+        key = parts_key(self.engine.engine_name, parts)
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        images, tokens = PIL_decode_parts(parts)
+        text = ""
+        complete = True
+        if images:
+            text, new_tokens, complete = self.extract_ocr_info(images)
+            tokens = tokens | new_tokens
+        if complete:
+            self.cache[key] = (text, tokens)
+        return text, tokens
 
 
     def close(self):
@@ -113,6 +113,42 @@ defaults = {
      dbm is untested, hence the default)."""),
      PATH, RESTORE),
 
+    ("x-lookup_ip_budget", _("Time to wait for IP address lookups"), 2.0,
+     _("""(EXPERIMENTAL) Before a message is tokenized, the hostnames
+     that will need to be looked up (for x-lookup_ip and
+     x-mine_nntp_headers) are all looked up at once.  This is the most
+     time, in seconds, to wait for the answers; any that haven't arrived
+     by then are treated as failed lookups."""),
+     REAL, RESTORE),
+
+    ("x-lookup_ip_threads", _("Number of IP address lookups at once"), 10,
+     _("""(EXPERIMENTAL) The most hostname lookups to make at the same
+     time before a message is tokenized."""),
+     INTEGER, RESTORE),
+
+    ("x-part_byte_budget", _("Most bytes to tokenize in each part"), 0,
+     _("""(EXPERIMENTAL) The most bytes of each text part of a message's
+     body to tokenize; the rest of a larger part is ignored, and a
+     "control: part truncated" token is generated instead.  Huge
+     messages can then be classified in little more time than small
+     ones.  0 means that there is no limit."""),
+     INTEGER, RESTORE),
+
+    ("x-body_byte_budget", _("Most bytes to tokenize in the body"), 0,
+     _("""(EXPERIMENTAL) The most bytes of a message's text parts, all
+     together, to tokenize; once this many have been, the rest of the
+     body is ignored, and a "control: body truncated" token is generated
+     instead.  The headers are always tokenized.  0 means that there is
+     no limit."""),
+     INTEGER, RESTORE),
+
+    ("x-token_budget", _("Most tokens to generate for a message"), 0,
+     _("""(EXPERIMENTAL) The most tokens to generate for a message
+     (counting those from its headers, which come first); once this many
+     have been, tokenizing stops, and a "control: tokens truncated" token
+     is generated instead.  0 means that there is no limit."""),
+     INTEGER, RESTORE),
+
     ("image_size", _("Generate image size tokens"), False,
      _("""If true, generate tokens based on the sizes of
      embedded images."""),
@@ -140,6 +176,42 @@ defaults = {
      at start and to which to save that info at exit."""),
      PATH, RESTORE),
 
+    ("ocr_threads", _("OCR engines to run at once"), 4,
+     _("""When crack_images is enabled, the images in a message are each
+     given to a separate run of the OCR engine, and up to this many of
+     these are run at the same time."""),
+     INTEGER, RESTORE),
+
+    ("ocr_timeout", _("Seconds to wait for OCR"), 10.0,
+     _("""When crack_images is enabled, the longest time to wait for the
+     OCR engine to find the text in the images in a message.  Any that
+     it hasn't finished by then are given up on (but tried again if the
+     message is seen again)."""),
+     REAL, RESTORE),
+
+    ("token_cache_size", _("Number of messages to cache tokens for"), 0,
+     _("""If greater than zero, the tokens generated for this many of the
+     most recently seen messages are kept in memory, so that scoring and
+     then training on the same message (or training on it several
+     times) only tokenizes it once.  The default (zero) disables the
+     token cache."""),
+     INTEGER, RESTORE),
+
+    ("token_cache", _("Token cache file location"), "",
+     _("""If non-empty (and token_cache_size is greater than zero), names
+     a dbm file in which the tokens of the messages seen are also kept,
+     so that they can be reused by later runs (of sb_filter.py, for
+     example).  See also token_cache_file_size."""),
+     PATH, RESTORE),
+
+    ("token_cache_file_size", _("Number of messages in the token cache file"),
+     10000,
+     _("""The token cache file (see token_cache) keeps the tokens of at
+     most about this many messages; the ones that haven't been used for
+     longest are removed as new ones are added.  Zero means that the file
+     is never trimmed (so it should be removed from time to time)."""),
+     INTEGER, RESTORE),
+
     ("ocrad_scale", _("Scale factor to use with ocrad."), 2,
      _("""Specifies the scale factor to apply when running ocrad.  While
      you can specify a negative scale it probably won't help.  Scaling up
@@ -530,6 +602,13 @@ defaults = {
      tests.  0.1 appeared to work well across all corpora."""),
      REAL, RESTORE),
 
+    ("probability_cache_size", _("Probability cache size"), 100000,
+     _("""The maximum number of word probabilities that are remembered
+     between messages.  The cache is emptied when it is full, and
+     whenever training (or a change to the unknown word options) changes
+     the probabilities."""),
+     INTEGER, RESTORE),
+
     ("use_chi_squared_combining", _("Use chi-squared combining"), True,
      _("""For vectors of random, uniformly distributed probabilities,
      -2*sum(ln(p_i)) follows the chi-squared distribution with 2*n degrees
@@ -603,9 +682,12 @@ defaults = {
     ("persistent_use_database", _("Database backend"), DB_TYPE[0],
      _("""SpamBayes can use either a ZODB or dbm database (quick to score
      one message) or a pickle (quick to train on huge amounts of messages).
-     There is also (experimental) ability to use a mySQL or PostgresSQL
-     database."""),
-     ("zeo", "zodb", "cdb", "mysql", "pgsql", "dbm", "pickle"), RESTORE),
+     A binary snapshot or a memory mapped CDB database (mmapcdb) is
+     quicker to open than any of these, but (like a pickle) is only saved
+     as a whole.  There is also (experimental) ability to use a mySQL or
+     PostgresSQL database."""),
+     ("zeo", "zodb", "cdb", "mysql", "pgsql", "dbm", "pickle", "snapshot",
+      "mmapcdb"), RESTORE),
 
     ("persistent_storage_file", _("Storage file name"), DB_TYPE[1],
      _("""Spambayes builds a database of information that it gathers
@@ -626,10 +708,70 @@ defaults = {
      of the most recent configuration file loaded."""),
      FILE_WITH_PATH, DO_NOT_RESTORE),
 
+    ("dbm_write_batch_size", _("Words to buffer before writing"), 1000,
+     _("""When training a dbm database, words that have only been seen
+     once, and the message counts, are not written to the database as
+     they change, but are buffered and written together, which is much
+     faster.  The buffer is written once it holds this many words (or see
+     dbm_write_interval).  If SpamBayes is stopped abnormally, the
+     buffered writes are lost.  Set this to 1 to write after every
+     message."""),
+     INTEGER, RESTORE),
+
+    ("dbm_write_interval", _("Seconds between writes"), 60.0,
+     _("""Buffered writes to a dbm database (see dbm_write_batch_size)
+     are also made when a message is trained this many seconds after the
+     last write, however few of them there are."""),
+     REAL, RESTORE),
+
+    ("messageinfo_write_batch_size", _("Message changes to buffer"), 100,
+     _("""The message information database (see messageinfo_storage_file)
+     changes as each message is classified or trained.  Rather than
+     storing it after every change, which gets slower as the database
+     grows, changes to a dbm database are stored together once there are
+     this many of them (or see messageinfo_write_interval), and when
+     SpamBayes stops; if it is stopped abnormally, the changes that
+     haven't been stored are lost.  Set this to 1 to store after every
+     change.  (A pickle keeps a journal of the changes, so none are lost,
+     and is only rewritten when the journal has more changes in it than
+     this, and than there are messages in the database.)"""),
+     INTEGER, RESTORE),
+
+    ("messageinfo_write_interval", _("Seconds between message writes"), 60.0,
+     _("""Changes to a dbm message information database are also stored
+     when a change is made this many seconds after they were last stored,
+     however few of them there are."""),
+     REAL, RESTORE),
+
+    ("sql_single_transaction", _("Train each message in one transaction"),
+     False,
+     _("""With a SQL database (pgsql or mysql), write all the changes from
+     training on a message, along with the message counts, in a single
+     transaction, so that the database is always consistent.  Otherwise
+     each batch of changed words is committed separately, and the message
+     counts are only saved when the database is stored."""),
+     BOOLEAN, RESTORE),
+
+    ("compact_wordinfo", _("Compact in-memory word database"), False,
+     _("""When the whole word database is held in memory (the pickle and
+     cdb backends), keep the word counts in compact arrays rather than
+     one Python object per word.  This uses much less memory, and large
+     pickles load much faster, but looking a word up is a little slower.
+     Pickles saved with this option on can't be read by older versions
+     of SpamBayes."""),
+     BOOLEAN, RESTORE),
+
     ("cache_use_gzip", _("Use gzip"), False,
      _("""Use gzip to compress the cache."""),
      BOOLEAN, RESTORE),
 
+    ("cache_sharded", _("Use subdirectories"), False,
+     _("""Spread the cached messages over subdirectories of each cache
+     directory, and keep a manifest of them, so that large caches are
+     quicker to open and to work with.  Existing caches are moved to (or
+     from) this layout when they are next opened."""),
+     BOOLEAN, RESTORE),
+
     ("cache_expiry_days", _("Days before cached messages expire"), 7,
      _("""Messages will be expired from the cache after this many days.
      After this time, you will no longer be able to train on these messages
@@ -889,6 +1031,14 @@ defaults = {
      used for classifications (i.e. results may be effected)."""),
      REAL, RESTORE),
 
+    ("classify_threads", _("Classification threads"), 4,
+     _("""The number of messages that the proxy may parse and tokenize at
+     the same time, each in a thread of its own, while it carries on
+     talking to other email clients and serving the web interface.  If
+     this is zero, the proxy does nothing else while a message is being
+     classified."""),
+     INTEGER, RESTORE),
+
     ("use_ssl", "Connect via a secure socket layer", False,
      """Use SSL to connect to the server. This allows spambayes to connect
      without sending data in plain text.
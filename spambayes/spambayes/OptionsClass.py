@@ -21,6 +21,18 @@ The OptionsClass class provides facility for a collection of Options.
 It is expected that manipulation of the options will be carried out
 via an instance of this class.
 
+Looking up an option (options["Classifier", "max_discriminators"]) takes
+several method calls, which add up in code that runs for every token.
+Such code can read the compiled attribute of an OptionsClass instead: a
+read-only snapshot of every option's value, with an attribute for each
+section, which has an attribute for each of its options (with characters
+that can't be in a name, like '-' and ' ', changed to '_'), e.g.
+
+    options.compiled.Tokenizer.x_short_runs
+
+The snapshot is made when it is first used, and made again after any
+option is changed with set() (or a restore point is reverted to).
+
 Experimental or deprecated options are prefixed with 'x-', borrowing the
 practice from RFC-822 mail.  If the user sets an option like:
 
@@ -388,6 +400,40 @@ class Option(object):
             return False
 
 
+class OptionValues(object):
+    """A read-only snapshot of some option values, as attributes.  Each
+    kind of snapshot is a subclass, with a slot for each value."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("compiled options can't be changed; set "
+                             "the option instead")
+
+    def __delattr__(self, name):
+        raise AttributeError("compiled options can't be changed; set "
+                             "the option instead")
+
+# The OptionValues subclass for each set of attribute names.
+_value_classes = {}
+
+def _attribute_name(name):
+    """Return the attribute name for an option or section name."""
+    return re.sub(r"\W", "_", name)
+
+def _option_values(items):
+    """Return an OptionValues snapshot with the given (attribute name,
+    value) items."""
+    items.sort()
+    names = tuple([name for name, value in items])
+    klass = _value_classes.get(names)
+    if klass is None:
+        klass = type("OptionValues", (OptionValues,), {"__slots__" : names})
+        _value_classes[names] = klass
+    values = klass()
+    for name, value in items:
+        object.__setattr__(values, name, value)
+    return values
+
 class OptionsClass(object):
     def __init__(self):
         self.verbose = None
@@ -412,6 +458,30 @@ class OptionsClass(object):
         r'(?P<value>.*)$'                     # everything up to EOL
         )
 
+    def __getattr__(self, name):
+        # This is only called if there is no such attribute, so for the
+        # compiled options, only when they have been forgotten.
+        if name == "compiled":
+            self.compiled = self._compile()
+            return self.compiled
+        raise AttributeError(name)
+
+    def _compile(self):
+        '''Return a snapshot of the current option values.'''
+        sections = {}
+        for (sect, opt), opt_obj in self._options.iteritems():
+            sections.setdefault(sect, []).append((_attribute_name(opt),
+                                                  opt_obj.get()))
+        return _option_values([(_attribute_name(sect), _option_values(items))
+                               for sect, items in sections.iteritems()])
+
+    def invalidate_compiled(self):
+        '''Forget the compiled options, so that they are made again,
+        with the current option values, when they are next used.  set()
+        does this; call it after changing an option's value some other
+        way.'''
+        self.__dict__.pop("compiled", None)
+
     def update_file(self, filename):
         '''Update the specified configuration file.'''
         sectname = None
@@ -530,6 +600,7 @@ class OptionsClass(object):
 
                 o = klass(*args)
                 self._options[section, o.name] = o
+        self.invalidate_compiled()
 
     def set_restore_point(self):
         '''Remember what the option values are right now, to
@@ -552,6 +623,7 @@ class OptionsClass(object):
         '''
         for key, value in self.restore_point.iteritems():
             self._options[key].set(value)
+        self.invalidate_compiled()
 
     def merge_files(self, file_list):
         for f in file_list:
@@ -663,9 +735,11 @@ class OptionsClass(object):
         # goodness sake!
         if sect == "Headers" and opt in ("notate_to", "notate_subject"):
             self._options[sect, opt.lower()].set(val)
+            self.invalidate_compiled()
             return
         if self.is_valid(sect, opt, val):
             self._options[sect, opt.lower()].set(val)
+            self.invalidate_compiled()
         else:
             print >> sys.stderr, ("Attempted to set [%s] %s with "
                                   "invalid value %s (%s)" %
@@ -109,6 +109,7 @@ adv_map = (
     ('Storage',               'persistent_use_database'),
     ('Storage',               'cache_expiry_days'),
     ('Storage',               'cache_use_gzip'),
+    ('Storage',               'cache_sharded'),
     ('Storage',               'ham_cache'),
     ('Storage',               'spam_cache'),
     ('Storage',               'unknown_cache'),
@@ -420,24 +421,22 @@ class ProxyUserInterface(UserInterface.UserInterface):
                 key, sourceCorpus = key
             else:
                 sourceCorpus = state.unknownCorpus
-            # Parse the message, get the judgement header and build a message
-            # info object for each message.
-            message = sourceCorpus[key]
+            # Get the judgement and build a message info object for each
+            # message, from its summary in the review index if there is
+            # one, so that the message needn't be parsed.
+            if sourceCorpus is state.unknownCorpus:
+                index = state.reviewIndex
+            else:
+                index = None
             try:
-                message.load()
+                judgement, messageInfo = \
+                           self._reviewMessageInfo(key, sourceCorpus, index)
             except IOError:
                 # Someone has taken this file away from us.  It was
                 # probably a virus protection program, so that's ok.
                 # Don't list it in the review, though.
                 invalid_keys.append(key)
                 continue
-            judgement = message[options["Headers",
-                                        "classification_header_name"]]
-            if judgement is None:
-                judgement = options["Headers", "header_unsure_string"]
-            else:
-                judgement = judgement.split(';')[0].strip()
-            messageInfo = self._makeMessageInfo(message)
             keyedMessageInfo[judgement].append((key, messageInfo))
         for key in invalid_keys:
             keys.remove(key)
@@ -13,6 +13,11 @@ Abstract:
     retrieved from the messageinfo database, so is as reliable as that
     is <wink>.
 
+    The totals are also kept for each day (and for the part of a day
+    after the statistics were reset), so that the totals since any date
+    can be found by adding up the days, rather than by looking at every
+    message in the messageinfo database.
+
     This class provides information for both the web interface, the
     Outlook plug-in, and sb_pop3dnd.
 
@@ -35,7 +40,7 @@ __credits__ = "Kenny Pitt, Mark Hammond, all the spambayes folk."
 
 import time
 
-from spambayes.message import STATS_START_KEY, STATS_STORAGE_KEY
+from spambayes.message import is_statistics_key
 from spambayes.message import Message
 
 try:
@@ -43,6 +48,12 @@ try:
 except NameError:
     _ = lambda arg: arg
 
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def day_start(when):
+    """Return the start of the (UTC) day that includes the time when."""
+    return when - when % SECONDS_PER_DAY
+
 class Stats(object):
     def __init__(self, options, messageinfo_db):
         self.messageinfo_db = messageinfo_db
@@ -68,23 +79,50 @@ class Stats(object):
             # Reset the date.
             self.from_date = time.time()
             self.messageinfo_db.set_statistics_start_date(self.from_date)
-            self.messageinfo_db.set_persistent_statistics(self.totals)
+            # Start a new period of the daily statistics, so that the
+            # totals can be worked out exactly from now on.
+            day_stats = self.day_stats[self.from_date] = {}
+            self.days.append(self.from_date)
+            self.messageinfo_db.set_persistent_statistics(
+                self.totals, self.from_date, day_stats, self.days)
+
+    def _AddToTotals(self, stats):
+        """Add one to each of the named totals, and to the statistics for
+        today, and store them."""
+        now = time.time()
+        day = day_start(now)
+        if self.from_date and day < self.from_date <= now:
+            # The statistics were reset today, so count the rest of the
+            # day separately, so that the totals since then can be
+            # worked out exactly.
+            day = self.from_date
+        days = None     # the list of days only needs storing if it grows
+        day_stats = self.day_stats.get(day)
+        if day_stats is None:
+            day_stats = self.day_stats[day] = \
+                        self.messageinfo_db.get_day_statistics(day)
+            if day not in self.days:
+                self.days.append(day)
+                days = self.days
+        for stat in stats:
+            self.totals[stat] += 1
+            day_stats[stat] = day_stats.get(stat, 0) + 1
+        # We have to record the updated totals every time or else the
+        # persistent statistics will get out of sync.
+        self.messageinfo_db.set_persistent_statistics(self.totals, day,
+                                                      day_stats, days)
 
     def RecordClassification(self, score):
         """Record that a message has been classified this session."""
-        totals = self.totals
         if score >= self.options["Categorization", "spam_cutoff"]:
             self.num_spam += 1
-            totals["num_spam"] += 1
+            self._AddToTotals(("num_spam",))
         elif score >= self.options["Categorization", "ham_cutoff"]:
             self.num_unsure += 1
-            totals["num_unsure"] += 1
+            self._AddToTotals(("num_unsure",))
         else:
             self.num_ham += 1
-            totals["num_ham"] += 1
-        # We have to record the updated totals every time or else the
-        # persistent statistics will get out of sync.
-        self.messageinfo_db.set_persistent_statistics(self.totals)
+            self._AddToTotals(("num_ham",))
 
     def RecordTraining(self, as_ham, old_score=None, old_class=None):
         """Record that a message has been trained this session.
@@ -97,62 +135,87 @@ class Stats(object):
         """
         # XXX Why, oh why, does this function have as_ham, when every
         # XXX other function has isSpam???
-        totals = self.totals
         if as_ham:
             self.num_trained_ham += 1
-            totals["num_trained_ham"] += 1
+            stats = ["num_trained_ham"]
             # If we are recovering an item that is in the "spam" threshold,
             # then record it as a "false positive"
             if old_score is not None and \
                old_score > self.options["Categorization", "spam_cutoff"]:
                 self.num_trained_ham_fp += 1
-                totals["num_trained_ham_fp"] += 1
+                stats.append("num_trained_ham_fp")
             elif old_class == self.options["Headers", "header_spam_string"]:
                 self.num_trained_ham_fp += 1
-                totals["num_trained_ham_fp"] += 1
+                stats.append("num_trained_ham_fp")
         else:
             self.num_trained_spam += 1
-            totals["num_trained_spam"] += 1
+            stats = ["num_trained_spam"]
             # If we are deleting as Spam an item that was in our "good"
             # range, then record it as a false negative.
             if old_score is not None and \
                old_score < self.options["Categorization", "ham_cutoff"]:
                 self.num_trained_spam_fn += 1
-                totals["num_trained_spam_fn"] += 1
+                stats.append("num_trained_spam_fn")
             elif old_class == self.options["Headers", "header_ham_string"]:
                 self.num_trained_spam_fn += 1
-                totals["num_trained_spam_fn"] += 1
-        # We have to record the updated totals every time or else the
-        # persistent statistics will get out of sync.
-        self.messageinfo_db.set_persistent_statistics(self.totals)
+                stats.append("num_trained_spam_fn")
+        self._AddToTotals(stats)
 
     def LoadPersistentStats(self):
         """Load the persistent statistics from the messageinfo db.
-        
-        If the persistent statistics have not yet been stored in the db
-        then we need to recalculate them by iterating through all the
+
+        If the daily statistics have not yet been stored in the db
+        then we need to work them out by iterating through all the
         messages.  This will result in a one-time performance hit, but
         will greatly improve the startup time in the future."""
+        self.day_stats = {}     # the statistics for the days used so far
+        self.days = self.messageinfo_db.get_statistics_days()
         self.totals = self.messageinfo_db.get_persistent_statistics()
+        if self.days is None:
+            daily_stats = self.CountMessages()
+            self.days = daily_stats.keys()
+            self.days.sort()
+            self.messageinfo_db.set_daily_statistics(daily_stats)
         if self.totals is None:
             self.CalculatePersistentStats()
 
     def CalculatePersistentStats(self):
         """Calculate the statistics totals (i.e. not this session).
 
-        This is done by running through the messageinfo database and
-        adding up the various information.  This could get quite time
-        consuming if the messageinfo database gets very large, so
-        it should only be done if the statistics start date is reset
-        to an arbitrary point in the past.
+        This is done by adding up the statistics for each day since the
+        start date (including the whole of the day the start date is
+        in, unless that is the day the statistics were reset).
         """
         self.ResetTotal()
         totals = self.totals
+        start = self.from_date or 0
+        # The day is counted from the latest start of a period of
+        # statistics that isn't after the start date.
+        first = [day for day in self.days
+                 if day_start(start) <= day <= start]
+        if first:
+            first = max(first)
+        else:
+            first = start
+        for day in self.days:
+            if day < first:
+                continue
+            for stat, count in \
+                    self.messageinfo_db.get_day_statistics(day).items():
+                totals[stat] += count
+        self.messageinfo_db.set_persistent_statistics(totals)
+
+    def CountMessages(self):
+        """Return the statistics for each day, worked out from the
+        classification and training of each message in the messageinfo
+        database.  This could get quite time consuming if the
+        messageinfo database gets very large, so it is only done if the
+        daily statistics haven't been kept.
+        """
+        daily_stats = {}
         for msg_id in self.messageinfo_db.keys():
             # Skip the date and persistent statistics keys.
-            if msg_id == STATS_START_KEY:
-                continue
-            if msg_id == STATS_STORAGE_KEY:
+            if is_statistics_key(msg_id):
                 continue
 
             m = Message(msg_id)
@@ -162,37 +225,39 @@ class Stats(object):
             if m.date_modified is None:
                 continue
 
-            # Skip ones that are too old.
-            if self.from_date and m.date_modified < self.from_date:
-                continue
-
             classification = m.GetClassification()
             trained = m.GetTrained()
-            
+            stats = []
+
             if classification == self.options["Headers",
                                               "header_spam_string"]:
                 # Classified as spam.
-                totals["num_spam"] += 1
+                stats.append("num_spam")
                 if trained == False:
                     # False positive (classified as spam, trained as ham)
-                    totals["num_trained_ham_fp"] += 1
+                    stats.append("num_trained_ham_fp")
             elif classification == self.options["Headers",
                                                 "header_ham_string"]:
                 # Classified as ham.
-                totals["num_ham"] += 1
+                stats.append("num_ham")
                 if trained == True:
                     # False negative (classified as ham, trained as spam)
-                    totals["num_trained_spam_fn"] += 1
+                    stats.append("num_trained_spam_fn")
             elif classification == self.options["Headers",
                                                 "header_unsure_string"]:
                 # Classified as unsure.
-                totals["num_unsure"] += 1
+                stats.append("num_unsure")
                 if trained == False:
-                    totals["num_trained_ham"] += 1
+                    stats.append("num_trained_ham")
                 elif trained == True:
-                    totals["num_trained_spam"] += 1
-
-        self.messageinfo_db.set_persistent_statistics(totals)
+                    stats.append("num_trained_spam")
+
+            if stats:
+                day_stats = daily_stats.setdefault(
+                    day_start(m.date_modified), {})
+                for stat in stats:
+                    day_stats[stat] = day_stats.get(stat, 0) + 1
+        return daily_stats
 
     def _CalculateAdditional(self, data):
         data["perc_ham"] = 100.0 * data["num_ham"] / data["num_seen"]
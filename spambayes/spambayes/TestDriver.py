@@ -125,13 +125,17 @@ def printmsg(msg, prob, clues):
 
 class Driver:
 
-    def __init__(self):
+    # If jobs is more than one, messages are tokenized in that many
+    # processes at once.
+    def __init__(self, jobs=1):
+        self.jobs = jobs
         self.falsepos = set()
         self.falseneg = set()
         self.unsure = set()
         self.global_ham_hist = Hist()
         self.global_spam_hist = Hist()
         self.ntimes_finishtest_called = 0
+        self.tester = Tester.Test(self.jobs)
         self.new_classifier()
         from spambayes import CostCounter
         self.cc = CostCounter.default()
@@ -143,8 +147,8 @@ class Driver:
     def set_classifier(self, classifier):
         """Specify a classifier to be used for further testing."""
         self.classifier = classifier
-        self.tester = Tester.Test()
         self.tester.set_classifier(classifier)
+        self.tester.reset_test_results()
         self.trained_ham_hist = Hist()
         self.trained_spam_hist = Hist()
 
@@ -199,6 +203,12 @@ class Driver:
         print "-> <stat> all runs false positive %:", (nfp * 1e2 / nham)
         print "-> <stat> all runs false negative %:", (nfn * 1e2 / nspam)
         print "-> <stat> all runs unsure %:", (nun * 1e2 / (nham + nspam))
+        t = self.tester
+        print "-> <stat> all runs tokenizing seconds: %.3f" % t.tokenize_time
+        print "-> <stat> all runs tokenizing ms per message: %.3f" % (
+              t.tokenize_time * 1e3 / (t.ntokenized or 1))
+        print "-> <stat> all runs truncated %:", (t.ntruncated * 1e2 /
+                                                  (t.ntokenized or 1))
         print "-> <stat> all runs cost: $%.2f" % (
               nfp * options["TestDriver", "best_cutoff_fp_weight"] +
               nfn * options["TestDriver", "best_cutoff_fn_weight"] +
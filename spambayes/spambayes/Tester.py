@@ -1,4 +1,8 @@
+import time
+
 from spambayes.Options import options
+from spambayes import tokenpool
+from spambayes import tokenizer
 
 class Test:
     # Pass a classifier instance (an instance of Bayes).
@@ -20,9 +24,39 @@ class Test:
     #             false_negative_rate(), false_positive_rate(),
     #             false_negatives(), and false_positives()
 
-    def __init__(self):
+    # If jobs is more than one, the examples are tokenized in that many
+    # processes at once (see tokenpool.py); an example's tokens are found
+    # by iterating over it.
+    #
+    # The time spent reading and tokenizing examples, the number of
+    # examples, and how many of those were cut short by the tokenizing
+    # budget (see the x-token_budget option and friends) are kept for
+    # all the examples this tester sees, in tokenize_time, ntokenized and
+    # ntruncated.
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.tokenize_time = 0.0
+        self.ntokenized = 0
+        self.ntruncated = 0
         self.reset_test_results()
 
+    def _tokenized(self, stream):
+        examples = tokenpool.tokenize_many(stream, self.jobs, tokenize=iter)
+        while True:
+            start = time.time()
+            try:
+                example, tokens = examples.next()
+            except StopIteration:
+                break
+            tokens = tuple(tokens)
+            self.tokenize_time += time.time() - start
+            self.ntokenized += 1
+            for token in tokenizer.TRUNCATED_TOKENS:
+                if token in tokens:
+                    self.ntruncated += 1
+                    break
+            yield example, tokens
+
     # Tell the tester which classifier to use.
     def set_classifier(self, classifier):
         self.classifier = classifier
@@ -50,11 +84,11 @@ class Test:
         self.reset_test_results()
         learn = self.classifier.learn
         if hamstream is not None:
-            for example in hamstream:
-                learn(example, False)
+            for example, tokens in self._tokenized(hamstream):
+                learn(tokens, False)
         if spamstream is not None:
-            for example in spamstream:
-                learn(example, True)
+            for example, tokens in self._tokenized(spamstream):
+                learn(tokens, True)
 
     # Untrain the classifier on streams of ham and spam.  Updates
     # probabilities before returning, and resets test results.
@@ -62,11 +96,11 @@ class Test:
         self.reset_test_results()
         unlearn = self.classifier.unlearn
         if hamstream is not None:
-            for example in hamstream:
-                unlearn(example, False)
+            for example, tokens in self._tokenized(hamstream):
+                unlearn(tokens, False)
         if spamstream is not None:
-            for example in spamstream:
-                unlearn(example, True)
+            for example, tokens in self._tokenized(spamstream):
+                unlearn(tokens, True)
 
     # Run prediction on each sample in stream.  You're swearing that stream
     # is entirely composed of spam (is_spam True), or of ham (is_spam False).
@@ -80,8 +114,8 @@ class Test:
     # msg in the stream, after the spam probability is computed.
     def predict(self, stream, is_spam, callback=None):
         guess = self.classifier.spamprob
-        for example in stream:
-            prob = guess(example)
+        for example, tokens in self._tokenized(stream):
+            prob = guess(tokens)
             if callback:
                 callback(example, prob)
             is_ham_guessed  = prob <  options["Categorization", "ham_cutoff"]
@@ -183,6 +217,9 @@ _easy_test = """
     []
     >>> t.unsure_rate()
     0.0
+
+    >>> t.ntokenized, t.ntruncated
+    (9, 0)
 """
 
 __test__ = {'easy': _easy_test}
@@ -73,7 +73,6 @@ import cgi
 import mailbox
 import types
 import StringIO
-from email.Iterators import typed_subpart_iterator
 from textwrap import wrap
 
 from spambayes import oe_mailbox
@@ -84,12 +83,17 @@ from spambayes import tokenizer
 from spambayes import Version
 from spambayes import storage
 from spambayes import FileCorpus
+from spambayes import reviewindex
 from spambayes.Options import options, optionsPathname, defaults, \
      OptionsClass, _
 
 IMAGES = ('helmet', 'status', 'config', 'help',
           'message', 'train', 'classify', 'query')
 
+# A word query looks at no more than this many words, so that a pattern
+# that doesn't start with literal text doesn't hold up the server.
+WORD_QUERY_MAX_SCANNED = 100000
+
 experimental_ini_map = (
     ('Experimental Options', None),
 )
@@ -419,27 +423,47 @@ class UserInterface(BaseUserInterface):
             flags = 0
             if ignore_case:
                 flags = re.IGNORECASE
-            r = re.compile(word, flags)
 
-            reached_limit = False
-            for w in self.classifier._wordinfokeys():
-                if not reached_limit and len(stats) >= max_results:
+            # The index finds the words that start with any literal text
+            # at the start of the pattern without looking at the others,
+            # and we stop as soon as we know there are too many matches,
+            # or have looked at too many words, so that a query doesn't
+            # hold up the server for long.  The index itself is built in
+            # another thread the first time it's needed.
+            index = self.classifier.word_index(wait=False)
+            reached_limit = cut_off = False
+            if index is None:
+                words = []
+            else:
+                words = index.search(word, flags, WORD_QUERY_MAX_SCANNED)
+            for w in words:
+                if w is None:
+                    cut_off = True
+                    break
+                if len(stats) >= max_results:
                     reached_limit = True
-                    over_limit = 0
-                if r.match(w):
-                    if reached_limit:
-                        over_limit += 1
-                    else:
-                        wordinfo = self.classifier._wordinfoget(w)
-                        stat = (w, wordinfo.spamcount, wordinfo.hamcount,
-                                self.classifier.probability(wordinfo))
-                        stats.append(stat)
-            if len(stats) == 0 and max_results > 0:
+                    break
+                wordinfo = self.classifier._wordinfoget(w)
+                if wordinfo is not None:
+                    stat = (w, wordinfo.spamcount, wordinfo.hamcount,
+                            self.classifier.probability(wordinfo))
+                    stats.append(stat)
+            if index is None:
+                stat = _("The list of words in the database is still " \
+                         "being read; please try again shortly.")
+                stats.append(stat)
+            elif cut_off:
+                stat = _("The search was stopped after looking at %d " \
+                         "words; there may be more matches.  Start the " \
+                         "pattern with some literal text to search " \
+                         "more quickly.") % (WORD_QUERY_MAX_SCANNED,)
+                stats.append(stat)
+            elif len(stats) == 0 and max_results > 0:
                 stat = _("There are no words that begin with '%s' " \
                          "in the database.") % (word,)
                 stats.append(stat)
             elif reached_limit:
-                stat = _("Additional tokens not shown: %d") % (over_limit,)
+                stat = _("Additional tokens not shown.")
                 stats.append(stat)
 
         self._writePreamble(_("Word query"))
@@ -531,8 +555,10 @@ class UserInterface(BaseUserInterface):
                 else:
                     factory = FileCorpus.FileMessageFactory()
                 age = options["Storage", "cache_expiry_days"]*24*60*60
+                sharded = options["Storage", "cache_sharded"]
                 corpus = FileCorpus.ExpiryFileCorpus(age, factory, fn,
-                                          '[0123456789\-]*', cacheSize=20)
+                                          '[0123456789\-]*', cacheSize=20,
+                                          sharded=sharded)
                 setattr(self, desired_corpus, corpus)
                 # We need a function to create a new name for the message
                 # as sb_imapfilter doesn't have one.
@@ -1363,60 +1389,39 @@ class UserInterface(BaseUserInterface):
         are passed into appendMessages by onReview - passing email.Message
         objects directly uses too much memory.
         """
-        # Remove notations before displaying - see:
-        # [ 848365 ] Remove subject annotations from message review page
-        message.delNotations()
-        subjectHeader = message["Subject"] or "(none)"
-        headers = {"subject" : subjectHeader}
-        for header in options["html_ui", "display_headers"]:
-            headers[header.lower()] = (message[header] or "(none)")
-        score = message[options["Headers", "score_header_name"]]
-        if score:
-            # the score might have the log info at the end
-            op = score.find('(')
-            if op >= 0:
-                score = score[:op]
-            try:
-                score = float(score) * 100
-            except ValueError:
-                # Hmm.  The score header should only contain a floating
-                # point number.  What's going on here, then?
-                score = "Err"  # Let the user know something is wrong.
-        else:
-            # If the lookup fails, this means that the "include_score"
-            # option isn't activated. We have the choice here to either
-            # calculate it now, which is pretty inefficient, since we have
-            # already done so, or to admit that we don't know what it is.
-            # We'll go with the latter.
-            score = "?"
-        try:
-            part = typed_subpart_iterator(message, 'text', 'plain').next()
-            text = part.get_payload()
-        except StopIteration:
-            try:
-                part = typed_subpart_iterator(message, 'text', 'html').next()
-                text = part.get_payload()
-                text, unused = tokenizer.crack_html_style(text)
-                text, unused = tokenizer.crack_html_comment(text)
-                text = tokenizer.html_re.sub(' ', text)
-                text = _('(this message only has an HTML body)\n') + text
-            except StopIteration:
-                text = _('(this message has no text body)')
-        if type(text) == type([]):  # gotta be a 'right' way to do this
-            text = _("(this message is a digest of %s messages)") % (len(text))
-        elif text is None:
-            text = _("(this message has no body)")
-        else:
-            text = text.replace('&nbsp;', ' ')      # Else they'll be quoted
-            text = re.sub(r'(\s)\s+', r'\1', text)  # Eg. multiple blank lines
-            text = text.strip()
+        return self._makeSummaryInfo(reviewindex.summarize(message, 0))
 
+    def _makeSummaryInfo(self, summary):
+        """Given a summary from reviewindex.summarize(), return the
+        object that _makeMessageInfo would for the message."""
         class _MessageInfo:
             pass
         messageInfo = _MessageInfo()
-        for headerName, headerValue in headers.items():
+        for headerName, headerValue in summary["headers"].items():
             headerValue = self._trimHeader(headerValue, 45, True)
             setattr(messageInfo, "%sHeader" % (headerName,), headerValue)
-        messageInfo.score = score
-        messageInfo.bodySummary = self._trimHeader(text, 200)
+        messageInfo.score = summary["score"]
+        messageInfo.bodySummary = self._trimHeader(summary["body"], 200)
         return messageInfo
+
+    def _reviewMessageInfo(self, key, corpus, index=None):
+        """Return the classification of the message with this key and
+        the object that _makeMessageInfo would for it, from its summary
+        in the index (a reviewindex.ReviewIndex) if there is one.
+        Otherwise the message is loaded (which raises IOError if it has
+        gone) and its summary added to the index."""
+        summary = None
+        if index is not None:
+            summary = index.get(key)
+            if summary is not None and \
+               not reviewindex.has_display_headers(summary):
+                summary = None
+        if summary is None:
+            message = corpus[key]
+            message.load()
+            summary = reviewindex.summarize(message,
+                                            corpus.messageSize(message) or
+                                            None)
+            if index is not None:
+                index.add(key, summary)
+        return summary["classification"], self._makeSummaryInfo(summary)
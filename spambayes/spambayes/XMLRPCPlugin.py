@@ -131,9 +131,11 @@ class XMLRPCPlugin(Plugin):
                 else:
                     factory = FileCorpus.FileMessageFactory()
                 age = options["Storage", "cache_expiry_days"]*24*60*60
+                sharded = options["Storage", "cache_sharded"]
                 corpus = FileCorpus.ExpiryFileCorpus(age, factory, fn,
                                                      '[0123456789\-]*',
-                                                     cacheSize=20)
+                                                     cacheSize=20,
+                                                     sharded=sharded)
                 setattr(self, desired_corpus, corpus)
                 class UniqueNamer(object):
                     count = -1
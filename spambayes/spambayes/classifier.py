@@ -38,6 +38,14 @@ from __future__ import generators
 # This implementation is due to Tim Peters et alia.
 
 import math
+import time
+import bisect
+import threading
+import sre_parse
+import sre_constants
+from array import array
+from itertools import izip
+from operator import itemgetter
 
 # XXX At time of writing, these are only necessary for the
 # XXX experimental url retrieving/slurping code.  If that
@@ -55,12 +63,21 @@ HTTP_ERROR_RE = re.compile(r"HTTP Error ([\d]+)")
 URL_KEY_RE = re.compile(r"[\W]")
 # XXX ---- ends ----
 
+try:
+    from heapq import heappush, heapreplace
+except ImportError:
+    from spambayes.compatheapq import heappush, heapreplace
+
 from spambayes.Options import options
-from spambayes.chi2 import chi2Q
+from spambayes.chi2 import chi2Q, judge_array, load_numpy
 from spambayes.safepickle import pickle_read, pickle_write
 
 LN2 = math.log(2)       # used frequently by chi-combining
 
+# When NumPy is available, batches of at least this many messages are
+# chi-combined with array operations rather than one message at a time.
+NUMPY_MINIMUM_BATCH = 50
+
 slurp_wordstream = None
 
 PICKLE_VERSION = 5
@@ -89,6 +106,231 @@ class WordInfo(object):
     def __setstate__(self, t):
         self.spamcount, self.hamcount = t
 
+class WordInfoTable(object):
+    # A compact alternative to a dict mapping words to WordInfo records,
+    # for classifiers that hold the whole database in memory.  A dict of
+    # WordInfo objects costs a Python object per word on top of the dict
+    # entry, and unpickling it means calling WordInfo.__setstate__ once
+    # per word.  Here the counts live in two parallel array('i') columns,
+    # and a dict maps each word to its slot in the columns; the pickled
+    # form is just the list of words and the two columns as strings.
+    #
+    # get() and [] return a fresh WordInfo record holding a copy of the
+    # counts, so changing a record has no effect until it's stored back
+    # (which is what Classifier._wordinfoset does).
+    __slots__ = '_slots', '_spam', '_ham', '_free'
+
+    # The class of the records handed out.
+    WordInfoClass = WordInfo
+
+    def __init__(self, items=()):
+        self._slots = {}
+        self._spam = array('i')
+        self._ham = array('i')
+        self._free = []         # slots of deleted words, for reuse
+        for word, record in items:
+            self[word] = record
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, word):
+        return word in self._slots
+
+    has_key = __contains__
+
+    def get(self, word, default=None):
+        try:
+            slot = self._slots[word]
+        except KeyError:
+            return default
+        record = self.WordInfoClass()
+        record.__setstate__((self._spam[slot], self._ham[slot]))
+        return record
+
+    def __getitem__(self, word):
+        record = self.get(word)
+        if record is None:
+            raise KeyError(word)
+        return record
+
+    def __setitem__(self, word, record):
+        slot = self._slots.get(word)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._spam)
+                self._spam.append(0)
+                self._ham.append(0)
+            self._slots[word] = slot
+        self._spam[slot] = record.spamcount
+        self._ham[slot] = record.hamcount
+
+    def __delitem__(self, word):
+        slot = self._slots.pop(word)
+        self._spam[slot] = self._ham[slot] = 0
+        self._free.append(slot)
+
+    def keys(self):
+        return self._slots.keys()
+
+    def iterkeys(self):
+        return self._slots.iterkeys()
+
+    __iter__ = iterkeys
+
+    def iteritems(self):
+        for word in self._slots:
+            yield word, self.get(word)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        if isinstance(other, WordInfoTable):
+            other = other.items()
+        elif hasattr(other, "items"):
+            other = other.items()
+        else:
+            return False
+        mine = dict([(word, record.__getstate__())
+                     for word, record in self.iteritems()])
+        return mine == dict([(word, record.__getstate__())
+                             for word, record in other])
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        words = self._slots.keys()
+        slots = [self._slots[word] for word in words]
+        spam = array('i', [self._spam[slot] for slot in slots])
+        ham = array('i', [self._ham[slot] for slot in slots])
+        return (sys.byteorder, words, spam.tostring(), ham.tostring())
+
+    def __setstate__(self, t):
+        byteorder, words, spam, ham = t
+        self._spam = array('i')
+        self._spam.fromstring(spam)
+        self._ham = array('i')
+        self._ham.fromstring(ham)
+        if byteorder != sys.byteorder:
+            self._spam.byteswap()
+            self._ham.byteswap()
+        self._slots = dict(izip(words, xrange(len(words))))
+        self._free = []
+
+    def __repr__(self):
+        return "<WordInfoTable with %d words>" % len(self)
+
+
+def _literal_prefix(r):
+    """Return the text that every string matched by the compiled regular
+    expression r starts with ("" if there's no such text)."""
+    if r.flags & re.IGNORECASE:
+        return ""
+    prefix = []
+    for op, av in sre_parse.parse(r.pattern, r.flags):
+        if op == sre_constants.AT and av == sre_constants.AT_BEGINNING \
+           and not prefix:
+            continue
+        if op != sre_constants.LITERAL or av > 255:
+            break
+        prefix.append(chr(av))
+    return "".join(prefix)
+
+class WordIndex(object):
+    # A sorted list of the words in a database, so that the words that
+    # match a pattern can be found without reading every key of the
+    # database (which, for a dbm database, is very slow).  Words that
+    # start with a given prefix are found by binary search; a regular
+    # expression that starts with literal text is only tried against the
+    # words that start with that text.
+    #
+    # Inserting into the middle of a list of millions of words is slow,
+    # so added and removed words are kept aside until the next search.
+    #
+    # Reading and sorting all the words takes a while for a large
+    # database, so an index can be made empty (with words None) and
+    # filled later, perhaps in another thread.  Until then, ready is
+    # False, and it shouldn't be searched; words added and removed in the
+    # meantime are kept aside as usual.
+
+    def __init__(self, words=()):
+        self._words = []
+        self._added = {}
+        self._removed = {}
+        self.ready = False
+        if words is not None:
+            self.fill(words)
+
+    def fill(self, words):
+        """Put the words (all the words in the database) in the index."""
+        words = list(words)
+        words.sort()
+        self._words = words
+        self.ready = True
+
+    def __len__(self):
+        self._update()
+        return len(self._words)
+
+    def add(self, word):
+        self._removed.pop(word, None)
+        self._added[word] = True
+
+    def discard(self, word):
+        self._added.pop(word, None)
+        self._removed[word] = True
+
+    def _update(self):
+        if self._removed:
+            removed = self._removed
+            self._words = [w for w in self._words if w not in removed]
+            self._removed = {}
+        if self._added:
+            words = self._words
+            added = []
+            for word in self._added:
+                i = bisect.bisect_left(words, word)
+                if i == len(words) or words[i] != word:
+                    added.append(word)
+            added.sort()
+            # The list is now two sorted runs, which sort() merges in
+            # linear time.
+            words.extend(added)
+            words.sort()
+            self._added = {}
+
+    def prefixed(self, prefix):
+        """Generate (in order) the words that start with prefix."""
+        self._update()
+        words = self._words
+        for i in xrange(bisect.bisect_left(words, prefix), len(words)):
+            word = words[i]
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def search(self, pattern, flags=0, max_scanned=None):
+        """Generate (in order) the words that the regular expression
+        pattern matches (at the start of the word).
+
+        A pattern that doesn't start with literal text has to be tried
+        against every word.  If max_scanned is given, at most that many
+        words are tried, and if the search stops because of that, None is
+        generated last, to say that there may be more matches."""
+        r = re.compile(pattern, flags)
+        scanned = 0
+        for word in self.prefixed(_literal_prefix(r)):
+            if scanned == max_scanned:
+                yield None
+                break
+            scanned += 1
+            if r.match(word):
+                yield word
+
 
 class Classifier:
     # Defining __slots__ here made Jeremy's life needlessly difficult when
@@ -105,9 +347,12 @@ class Classifier:
     # allow a subclass to use a different class for WordInfo
     WordInfoClass = WordInfo
 
+    # The WordIndex of the database, if word_index() has built one.
+    _word_index = None
+
     def __init__(self):
-        self.wordinfo = {}
-        self.probcache = {}
+        self.wordinfo = self._new_wordinfo()
+        self._new_probcache()
         self.nspam = self.nham = 0
 
     def __getstate__(self):
@@ -117,7 +362,32 @@ class Classifier:
         if t[0] != PICKLE_VERSION:
             raise ValueError("Can't unpickle -- version %s unknown" % t[0])
         (self.wordinfo, self.nspam, self.nham) = t[1:]
+        if options["Storage", "compact_wordinfo"] and \
+           isinstance(self.wordinfo, dict):
+            self.wordinfo = WordInfoTable(self.wordinfo.iteritems())
+        self._new_probcache()
+        self._word_index = None
+
+    def _new_wordinfo(self):
+        """Return a new, empty, mapping of words to WordInfo records."""
+        if options["Storage", "compact_wordinfo"]:
+            return WordInfoTable()
+        return {}
+
+    def _new_probcache(self, params=None):
+        # The probability() cache, a dict of dicts, keyed first on a
+        # word's spamcount and then on its hamcount.  The probabilities
+        # also depend on nspam, nham and the unknown word options, so
+        # these are kept in _probcache_params, and the cache is emptied
+        # when they change (and when it holds more than
+        # probability_cache_size probabilities).  The probcache_hits and
+        # probcache_misses counts can be used to monitor how well it
+        # works.
         self.probcache = {}
+        self._probcache_params = params
+        self._probcache_size = 0
+        if not hasattr(self, "probcache_hits"):
+            self.probcache_hits = self.probcache_misses = 0
 
     # spamprob() implementations.  One of the following is aliased to
     # spamprob, depending on option settings.
@@ -149,6 +419,91 @@ class Classifier:
         where evidence is a list of (word, probability) pairs.
         """
 
+        return self._chi2_combine(self._getclues(wordstream), evidence)
+
+    def chi2_spamprob_many(self, wordstreams, evidence=False):
+        """Return a list of best-guess probabilities, one per wordstream.
+
+        wordstreams is a sequence of word streams, each representing a
+        message.  The result is identical to calling chi2_spamprob() on
+        each wordstream in turn, but every distinct token in the batch is
+        looked up (and has its spamprob computed) only once.  This is a
+        big win when scoring many similar messages (e.g. a burst of
+        mailing list traffic) that share most of their tokens.
+
+        If optional arg evidence is True, each item of the returned list
+        is a (probability, evidence) pair, as for chi2_spamprob().
+        """
+        wordstreams = [list(wordstream) for wordstream in wordstreams]
+
+        # Gather the distinct tokens in the whole batch (including the
+        # bigrams that _getclues() will ask for), and fetch all of their
+        # records in one go.
+        words = {}
+        use_bigrams = options.compiled.Classifier.use_bigrams
+        for wordstream in wordstreams:
+            if use_bigrams:
+                wordstream = self._enhance_wordstream(wordstream)
+            for word in wordstream:
+                words[word] = 1
+        records = self._wordinfoget_many(words.keys())
+        distances = {}
+        for word, record in records.iteritems():
+            distances[word] = self._worddistance(word, record)
+
+        def distanceget(word):
+            try:
+                return distances[word]
+            except KeyError:
+                # Not gathered above (e.g. a bigram that
+                # _enhance_wordstream() doesn't generate); look it up
+                # the slow way, once.
+                tup = distances[word] = self._worddistanceget(word)
+                return tup
+
+        return self._chi2_combine_many([self._getclues(wordstream,
+                                                       distanceget)
+                                        for wordstream in wordstreams],
+                                       evidence)
+
+    def _chi2_combine_many(self, clue_lists, evidence=False):
+        """Combine each list of clues in clue_lists into a chi-squared
+        score, as _chi2_combine() does.
+
+        If NumPy is available and the batch is large enough, the scores
+        are computed for all the messages at once with array operations
+        (see chi2.judge_array); they match the one-at-a-time results to
+        within 1e-12.
+        """
+        if len(clue_lists) < NUMPY_MINIMUM_BATCH:
+            numpy = None
+        else:
+            numpy = load_numpy()
+        if numpy is None:
+            return [self._chi2_combine(clues, evidence)
+                    for clues in clue_lists]
+
+        # Lay all the probabilities out in one padded 2-d array, a row
+        # per message.  Filling the used part of the array from one flat
+        # list is much quicker than filling it a row at a time.
+        counts = numpy.array([len(clues) for clues in clue_lists])
+        probs = numpy.zeros((len(clue_lists), counts.max()))
+        flat = []
+        for clues in clue_lists:
+            flat.extend(map(itemgetter(0), clues))
+        probs[numpy.arange(probs.shape[1]) < counts[:, numpy.newaxis]] = flat
+        S, H, scores = judge_array(probs, counts)
+        scores = scores.tolist()
+        if not evidence:
+            return scores
+        return [(prob, self._evidence(clues, S, H))
+                for prob, clues, S, H in zip(scores, clue_lists,
+                                             S.tolist(), H.tolist())]
+
+    def _chi2_combine(self, clues, evidence=False):
+        """Combine a list of (prob, word, record) clues, as returned by
+        _getclues(), into a single chi-squared score."""
+
         from math import frexp, log as ln
 
         # We compute two chi-squared statistics, one for ham and one for
@@ -166,7 +521,6 @@ class Classifier:
         H = S = 1.0
         Hexp = Sexp = 0
 
-        clues = self._getclues(wordstream)
         for prob, word, record in clues:
             S *= 1.0 - prob
             H *= prob
@@ -199,28 +553,33 @@ class Classifier:
             prob = 0.5
 
         if evidence:
-            clues = [(w, p) for p, w, _r in clues]
-            clues.sort(lambda a, b: cmp(a[1], b[1]))
-            clues.insert(0, ('*S*', S))
-            clues.insert(0, ('*H*', H))
-            return prob, clues
+            return prob, self._evidence(clues, S, H)
         else:
             return prob
 
+    def _evidence(self, clues, S, H):
+        """Return the evidence list for a scored message: (word, prob)
+        pairs sorted by prob, preceded by the H and S measures."""
+        clues = [(w, p) for p, w, _r in clues]
+        clues.sort(lambda a, b: cmp(a[1], b[1]))
+        clues.insert(0, ('*S*', S))
+        clues.insert(0, ('*H*', H))
+        return clues
+
     def slurping_spamprob(self, wordstream, evidence=False):
         """Do the standard chi-squared spamprob, but if the evidence
         leaves the score in the unsure range, and we have fewer tokens
         than max_discriminators, also generate tokens from the text
         obtained by following http URLs in the message."""
-        h_cut = options["Categorization", "ham_cutoff"]
-        s_cut = options["Categorization", "spam_cutoff"]
+        h_cut = options.compiled.Categorization.ham_cutoff
+        s_cut = options.compiled.Categorization.spam_cutoff
 
         # Get the raw score.
         prob, clues = self.chi2_spamprob(wordstream, True)
 
         # If necessary, enhance it with the tokens from whatever is
         # at the URL's destination.
-        if len(clues) < options["Classifier", "max_discriminators"] and \
+        if len(clues) < options.compiled.Classifier.max_discriminators and \
            prob > h_cut and prob < s_cut and slurp_wordstream:
             slurp_tokens = list(self._generate_slurp())
             slurp_tokens.extend([w for (w, _p) in clues])
@@ -238,6 +597,18 @@ class Classifier:
         else:
             spamprob = chi2_spamprob
 
+    def slurping_spamprob_many(self, wordstreams, evidence=False):
+        """Score each wordstream with slurping_spamprob().  Slurping
+        works on one message at a time, so there is no batch speedup."""
+        return [self.slurping_spamprob(wordstream, evidence)
+                for wordstream in wordstreams]
+
+    if options["Classifier", "use_chi_squared_combining"]:
+        if options["URLRetriever", "x-slurp_urls"]:
+            spamprob_many = slurping_spamprob_many
+        else:
+            spamprob_many = chi2_spamprob_many
+
     def learn(self, wordstream, is_spam):
         """Teach the classifier by example.
 
@@ -245,9 +616,10 @@ class Classifier:
         True, you're telling the classifier this message is definitely spam,
         else that it's definitely not spam.
         """
-        if options["Classifier", "use_bigrams"]:
+        compiled = options.compiled
+        if compiled.Classifier.use_bigrams:
             wordstream = self._enhance_wordstream(wordstream)
-        if options["URLRetriever", "x-slurp_urls"]:
+        if compiled.URLRetriever.x_slurp_urls:
             wordstream = self._add_slurped(wordstream)
         self._add_msg(wordstream, is_spam)
 
@@ -256,9 +628,10 @@ class Classifier:
 
         Pass the same arguments you passed to learn().
         """
-        if options["Classifier", "use_bigrams"]:
+        compiled = options.compiled
+        if compiled.Classifier.use_bigrams:
             wordstream = self._enhance_wordstream(wordstream)
-        if options["URLRetriever", "x-slurp_urls"]:
+        if compiled.URLRetriever.x_slurp_urls:
             wordstream = self._add_slurped(wordstream)
         self._remove_msg(wordstream, is_spam)
 
@@ -274,12 +647,23 @@ class Classifier:
 
         spamcount = record.spamcount
         hamcount = record.hamcount
+        # This is called for every token, so the options are read from
+        # the compiled snapshot.
+        compiled = options.compiled.Classifier
+        S = compiled.unknown_word_strength
+        X = compiled.unknown_word_prob
 
         # Try the cache first
+        params = (self.nspam, self.nham, S, X)
+        if params != self._probcache_params:
+            self._new_probcache(params)
         try:
-            return self.probcache[spamcount][hamcount]
+            prob = self.probcache[spamcount][hamcount]
         except KeyError:
-            pass
+            self.probcache_misses += 1
+        else:
+            self.probcache_hits += 1
+            return prob
 
         nham = float(self.nham or 1)
         nspam = float(self.nspam or 1)
@@ -292,9 +676,7 @@ class Classifier:
 
         prob = spamratio / (hamratio + spamratio)
 
-        S = options["Classifier", "unknown_word_strength"]
-        StimesX = S * options["Classifier", "unknown_word_prob"]
-
+        StimesX = S * X
 
         # Now do Robinson's Bayesian adjustment.
         #
@@ -316,10 +698,13 @@ class Classifier:
         prob = (StimesX + n * prob) / (S + n)
 
         # Update the cache
+        if self._probcache_size >= compiled.probability_cache_size:
+            self._new_probcache(params)
         try:
             self.probcache[spamcount][hamcount] = prob
         except KeyError:
             self.probcache[spamcount] = {hamcount: prob}
+        self._probcache_size += 1
 
         return prob
 
@@ -344,7 +729,6 @@ class Classifier:
     # appears in a msg, but distorting spamprob doesn't appear a correct way
     # to exploit it.
     def _add_msg(self, wordstream, is_spam):
-        self.probcache = {}    # nuke the prob cache
         if is_spam:
             self.nspam += 1
         else:
@@ -354,6 +738,8 @@ class Classifier:
             record = self._wordinfoget(word)
             if record is None:
                 record = self.WordInfoClass()
+                if self._word_index is not None:
+                    self._word_index.add(word)
 
             if is_spam:
                 record.spamcount += 1
@@ -365,7 +751,6 @@ class Classifier:
         self._post_training()
 
     def _remove_msg(self, wordstream, is_spam):
-        self.probcache = {}    # nuke the prob cache
         if is_spam:
             if self.nspam <= 0:
                 raise ValueError("spam count would go negative!")
@@ -386,6 +771,8 @@ class Classifier:
                         record.hamcount -= 1
                 if record.hamcount == 0 == record.spamcount:
                     self._wordinfodel(word)
+                    if self._word_index is not None:
+                        self._word_index.discard(word)
                 else:
                     self._wordinfoset(word, record)
 
@@ -405,10 +792,22 @@ class Classifier:
     # the strongest (farthest from 0.5) spamprobs of all tokens in wordstream.
     # Tokens with spamprobs less than minimum_prob_strength away from 0.5
     # aren't returned.
-    def _getclues(self, wordstream):
-        mindist = options["Classifier", "minimum_prob_strength"]
-
-        if options["Classifier", "use_bigrams"]:
+    #
+    # distanceget is the function used to map a token to its
+    # (distance, prob, word, record) tuple; it defaults to
+    # _worddistanceget, and chi2_spamprob_many() passes a lookup into
+    # the tuples it has already computed for the whole batch.
+    def _getclues(self, wordstream, distanceget=None):
+        if distanceget is None:
+            distanceget = self._worddistanceget
+        compiled = options.compiled.Classifier
+        mindist = compiled.minimum_prob_strength
+        maxdisc = compiled.max_discriminators
+        if maxdisc <= 0:
+            # This has always meant "no limit".
+            maxdisc = sys.maxint
+
+        if compiled.use_bigrams:
             # This scheme mixes single tokens with pairs of adjacent tokens.
             # wordstream is "tiled" into non-overlapping unigrams and
             # bigrams.  Non-overlap is important to prevent a single original
@@ -423,8 +822,20 @@ class Classifier:
             # indices is a 1-tuple for an original token, and a 2-tuple for
             # a synthesized bigram token.  The indices are needed to detect
             # overlap later.
+            #
+            # Only the strongest candidates can make it into the final
+            # clues, so raw is kept as a bounded min-heap rather than a
+            # list of every candidate.  The tiling below examines
+            # candidates from strongest to weakest, and each clue it
+            # accepts can knock out at most 4 others (a bigram at (i, i+1)
+            # overlaps the unigrams at i and i+1 and the bigrams at
+            # (i-1, i) and (i+1, i+2)), so it never looks beyond the
+            # strongest 5*max_discriminators candidates.
+            maxraw = 5 * maxdisc
             raw = []
-            push = raw.append
+            # Candidates weaker than floor can't get into raw.  Once raw
+            # is full, floor is the distance of the weakest one in it.
+            floor = mindist
             pair = None
             # Keep track of which tokens we've already seen.
             # Don't use a set here!  This is an innermost loop, so speed is
@@ -441,9 +852,15 @@ class Classifier:
                 for clue, indices in (token, (i,)), (pair, (i-1, i)):
                     if clue not in seen:    # as always, skip duplicates
                         seen[clue] = 1
-                        tup = self._worddistanceget(clue)
-                        if tup[0] >= mindist:
-                            push((tup, indices))
+                        tup = distanceget(clue)
+                        if tup[0] >= floor:
+                            if len(raw) < maxraw:
+                                heappush(raw, (tup, indices))
+                                if len(raw) == maxraw:
+                                    floor = raw[0][0][0]
+                            elif (tup, indices) > raw[0]:
+                                heapreplace(raw, (tup, indices))
+                                floor = raw[0][0][0]
 
             # Sort raw, strongest to weakest spamprob.
             raw.sort()
@@ -460,29 +877,40 @@ class Classifier:
                     for i in indices:
                         seen[i] = 1
                     push(tup)
+                    if len(clues) == maxdisc:
+                        break
             # Leave sorted from smallest to largest spamprob.
             clues.reverse()
 
         else:
             # The all-unigram scheme just scores the tokens as-is.  A set()
-            # is used to weed out duplicates at high speed.
+            # is used to weed out duplicates at high speed.  Long messages
+            # can have thousands of candidate clues, so rather than sorting
+            # them all, only the strongest max_discriminators are kept, in
+            # a min-heap.
             clues = []
-            push = clues.append
+            floor = mindist
             for word in set(wordstream):
-                tup = self._worddistanceget(word)
-                if tup[0] >= mindist:
-                    push(tup)
+                tup = distanceget(word)
+                if tup[0] >= floor:
+                    if len(clues) < maxdisc:
+                        heappush(clues, tup)
+                        if len(clues) == maxdisc:
+                            floor = clues[0][0]
+                    elif tup > clues[0]:
+                        heapreplace(clues, tup)
+                        floor = clues[0][0]
             clues.sort()
 
-        if len(clues) > options["Classifier", "max_discriminators"]:
-            del clues[0 : -options["Classifier", "max_discriminators"]]
         # Return (prob, word, record).
         return [t[1:] for t in clues]
 
     def _worddistanceget(self, word):
-        record = self._wordinfoget(word)
+        return self._worddistance(word, self._wordinfoget(word))
+
+    def _worddistance(self, word, record):
         if record is None:
-            prob = options["Classifier", "unknown_word_prob"]
+            prob = options.compiled.Classifier.unknown_word_prob
         else:
             prob = self.probability(record)
         distance = abs(prob - 0.5)
@@ -491,6 +919,13 @@ class Classifier:
     def _wordinfoget(self, word):
         return self.wordinfo.get(word)
 
+    def _wordinfoget_many(self, words):
+        """Return a dict mapping each word in words to its record (or
+        None).  Storage classes that can fetch many words more cheaply
+        than one at a time should override this."""
+        wordinfoget = self._wordinfoget
+        return dict([(word, wordinfoget(word)) for word in words])
+
     def _wordinfoset(self, word, record):
         self.wordinfo[word] = record
 
@@ -783,5 +1218,43 @@ class Classifier:
     def _wordinfokeys(self):
         return self.wordinfo.keys()
 
+    def word_index(self, wait=True):
+        """Return a WordIndex of the words in the database.  This is
+        built (which means reading all the keys) the first time it is
+        needed, and then kept up to date by training.
+
+        If wait is false, the index is built in another thread, and None
+        is returned until it is ready, so that a server isn't held up
+        while a large database is read."""
+        index = self._word_index
+        if index is None:
+            # Training keeps the index up to date while it is built.
+            index = self._word_index = WordIndex(None)
+            if wait:
+                index.fill(self._wordinfokeys())
+            else:
+                thread = threading.Thread(target=self._fill_word_index,
+                                          args=(index,))
+                thread.setDaemon(True)
+                thread.start()
+        elif wait:
+            # Wait for the thread building it (and if that fails, build
+            # it here after all).
+            while not index.ready and self._word_index is index:
+                time.sleep(0.05)
+            if not index.ready:
+                return self.word_index()
+        if not index.ready:
+            return None
+        return index
+
+    def _fill_word_index(self, index):
+        try:
+            index.fill(self._wordinfokeys())
+        except Exception, detail:
+            print >> sys.stderr, "Failed to build the word index:", detail
+            if self._word_index is index:
+                self._word_index = None
+
 
 Bayes = Classifier
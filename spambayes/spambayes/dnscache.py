@@ -5,6 +5,7 @@
 
 # Version 0.1 2004 06 27
 # Version 0.11 2004 07 06 Fixed zero division error in __del__
+# Version 0.12 Added prefetch(), to look up many questions at once
 
 # From http://sourceforge.net/projects/pydns/
 import DNS
@@ -15,6 +16,8 @@ import operator
 import time
 import types
 import socket
+import threading
+import Queue
 
 from spambayes.Options import options
 from spambayes.safepickle import pickle_read, pickle_write
@@ -89,6 +92,9 @@ class cache:
         # How long to wait for the server
         self.dnsTimeout=10
 
+        # How many questions prefetch() may have asked at once
+        self.maxThreads=10
+
         # end of user-settable attributes
 
         self.cachefile = os.path.expanduser(cachefile)
@@ -116,18 +122,37 @@ class cache:
         self.misses=0
         self.pruneTicker=0
 
+        # The arguments for DnsRequest.  Each thread that asks questions
+        # (the prefetch() threads, and any thread that calls lookup())
+        # needs its own request object, as they aren't thread-safe.
         if dnsServer == None:
             DNS.DiscoverNameServers()
-            self.queryObj = DNS.DnsRequest()
+            self.queryArgs = {}
         else:
-            self.queryObj = DNS.DnsRequest(server=dnsServer)
+            self.queryArgs = {"server": dnsServer}
+        self.local = threading.local()
+
+        # The cache, the statistics and the pending questions are used by
+        # the prefetch() threads, and by lookup() and prefetch(), which
+        # may be called from several threads at once (when messages are
+        # tokenized in threads).
+        self.lock = threading.Lock()
+        self.queue = Queue.Queue()
+        self.workers = []
+        # (question, qType) -> Event, set when the answer is stored,
+        # for the questions being asked.
+        self.pending = {}
         return None
 
     def close(self):
         if self.printStatsAtEnd:
             self.printStats()
         if self.cachefile:
-            pickle_write(self.cachefile, self.caches)
+            self.lock.acquire()
+            try:
+                pickle_write(self.cachefile, self.caches)
+            finally:
+                self.lock.release()
 
     def printStats(self):
         for key,val in self.caches.items():
@@ -147,6 +172,13 @@ class cache:
         # I want this to be as fast as reasonably possible.
         # If I didn't, I'd probably do various things differently
         # Is there a faster way to do this?
+        self.lock.acquire()
+        try:
+            self._prune(now)
+        finally:
+            self.lock.release()
+
+    def _prune(self, now):
         allAnswers = []
         for cache in self.caches.values():
             for val in cache.values():
@@ -197,6 +229,14 @@ class cache:
         return [ obj.answer for obj in listOfObjs ]
 
 
+    def queryObj(self):
+        """Return this thread's DnsRequest object."""
+        try:
+            return self.local.queryObj
+        except AttributeError:
+            queryObj = self.local.queryObj = DNS.DnsRequest(**self.queryArgs)
+            return queryObj
+
     def lookup(self,question,qType="A"):
         qType = qType.upper()
         if qType not in ("A","PTR"):
@@ -204,42 +244,85 @@ class cache:
 
         now = int(time.time())
 
-        # Finding the len() of a dictionary isn't an expensive operation
-        # but doing it twice for every lookup isn't necessary.
-        self.pruneTicker += 1
-        if self.pruneTicker == kCheckForPruneEvery:
-            self.pruneTicker = 0
-            if len(self.caches["A"])+len(self.caches["PTR"])>kPruneThreshold:
-                self.prune(now)
+        self.lock.acquire()
+        try:
+            # Finding the len() of a dictionary isn't an expensive
+            # operation but doing it twice for every lookup isn't
+            # necessary.
+            self.pruneTicker += 1
+            if self.pruneTicker == kCheckForPruneEvery:
+                self.pruneTicker = 0
+                if len(self.caches["A"]) + \
+                   len(self.caches["PTR"]) > kPruneThreshold:
+                    self._prune(now)
+
+            answers = self._cached(question, qType, now)
+            if answers is not None:
+                self.hits += 1
+            else:
+                # Not in cache or we just expired it
+                self.misses += 1
+        finally:
+            self.lock.release()
+        if answers is not None:
+            return self.formatForReturn(answers)
+        return self.formatForReturn(self.query(self.queryObj(), question,
+                                               qType))
+
+    def cached(self, question, qType, now):
+        """Return the unexpired answers to the question in the cache,
+        or None if there are none."""
+        self.lock.acquire()
+        try:
+            return self._cached(question, qType, now)
+        finally:
+            self.lock.release()
 
+    def _cached(self, question, qType, now):
+        # The lock must be held.  A copy of the answers is returned, as
+        # other threads may change the cached list.
         cacheToLookIn = self.caches[qType]
 
         try:
             answers = cacheToLookIn[question]
         except KeyError:
-            pass
+            return None
+
+        if answers:
+            ind = 0
+            # No guarantee that expire has already been done
+            while ind<len(answers):
+                thisAnswer = answers[ind]
+                if thisAnswer.expiresAt<now:
+                    del answers[ind]
+                else:
+                    thisAnswer.lastUsed = now
+                    ind += 1
         else:
-            if answers:
-                ind = 0
-                # No guarantee that expire has already been done
-                while ind<len(answers):
-                    thisAnswer = answers[ind]
-                    if thisAnswer.expiresAt<now:
-                        del answers[ind]
-                    else:
-                        thisAnswer.lastUsed = now
-                        ind += 1
-            else:
-                print >> sys.stderr, "lookup failure:", question
+            print >> sys.stderr, "lookup failure:", question
 
-            if not answers:
-                del cacheToLookIn[question]
-            else:
-                self.hits += 1
-                return self.formatForReturn(answers)
+        if not answers:
+            cacheToLookIn.pop(question, None)
+            return None
+        return answers[:]
 
-        # Not in cache or we just expired it
-        self.misses += 1
+    def store(self, question, qType, objs):
+        """Put the answers to the question in the cache, and return
+        them."""
+        self.lock.acquire()
+        try:
+            self.caches[qType][question] = objs
+            event = self.pending.pop((question, qType), None)
+            if event is not None:
+                event.set()
+        finally:
+            self.lock.release()
+        return objs
+
+    def query(self, queryObj, question, qType):
+        """Ask the server the question, using the DnsRequest object,
+        and put the answers (which may be an error) in the cache."""
+        now = int(time.time())
 
         if qType == "PTR":
             qList = question.split(".")
@@ -250,8 +333,8 @@ class cache:
 
         # where do we get NXDOMAIN?
         try:
-            reply = self.queryObj.req(queryQuestion, qtype=qType,
-                                      timeout=self.dnsTimeout)
+            reply = queryObj.req(queryQuestion, qtype=qType,
+                                 timeout=self.dnsTimeout)
         except DNS.Base.DNSError,detail:
             if detail.args[0] not in ("Timeout", "nothing to lookup"):
                 print >> sys.stderr, detail.args[0]
@@ -261,11 +344,13 @@ class cache:
                 print >> sys.stderr, "Type was", qType
             objs = [lookupResult(qType, None, question,
                                  self.cacheErrorSecs+now, now)]
-            cacheToLookIn[question] = objs # Add to format for return?
-            return self.formatForReturn(objs)
+            return self.store(question, qType, objs)
         except socket.gaierror,detail:
-            print >> sys.stderr, "DNS connection failure:", self.queryObj.ns, detail
+            print >> sys.stderr, "DNS connection failure:", queryObj.ns, detail
             print >> sys.stderr, "Defaults:", DNS.defaults
+            objs = [lookupResult(qType, None, question,
+                                 self.cacheErrorSecs+now, now)]
+            return self.store(question, qType, objs)
 
         objs = []
         for answer in reply.answers:
@@ -287,15 +372,13 @@ class cache:
                     objs.append(item)
 
         if objs:
-            cacheToLookIn[question] = objs
-            return self.formatForReturn(objs)
+            return self.store(question, qType, objs)
 
         # Probably SERVFAIL or the like
         if not reply.authority:
             objs = [lookupResult(qType, None, question,
                                  self.cacheErrorSecs+now, now)]
-            cacheToLookIn[question] = objs
-            return self.formatForReturn(objs)
+            return self.store(question, qType, objs)
 
 
         # No such host
@@ -315,9 +398,89 @@ class cache:
         else:
             cacheNeg = auTTL
         objs = [lookupResult(qType, None, question, cacheNeg+now, now)]
+        return self.store(question, qType, objs)
+
+    def prefetch(self, questions, budget=None):
+        """Ask all the (question, qType) pairs that aren't already in the
+        cache at once, so that looking them up afterwards is quick.
+
+        This waits until they have all been answered, or for at most
+        budget seconds.  Any still unanswered then are cached as errors
+        (until their answers arrive), so that lookup() won't wait for
+        them either.  Questions that another thread is already asking
+        aren't asked again, but their answers are waited for in the
+        same way."""
+        now = int(time.time())
+        done = Queue.Queue()
+        asked = []
+        others = []
+        self.lock.acquire()
+        try:
+            for question, qType in questions:
+                qType = qType.upper()
+                key = (question, qType)
+                if key in self.pending:
+                    others.append((key, self.pending[key]))
+                elif self._cached(question, qType, now) is None:
+                    self.pending[key] = threading.Event()
+                    asked.append(key)
+        finally:
+            self.lock.release()
+        if not asked and not others:
+            return None
+        for question, qType in asked:
+            self.queue.put((question, qType, done))
+        while len(self.workers) < min(self.maxThreads, len(asked)):
+            worker = threading.Thread(target=self._work)
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+
+        if budget is None:
+            deadline = None
+        else:
+            deadline = time.time() + budget
+        for _count in xrange(len(asked)):
+            try:
+                if deadline is None:
+                    done.get()
+                else:
+                    done.get(True, max(deadline - time.time(), 0))
+            except Queue.Empty:
+                break
+        for key, event in others:
+            if deadline is None:
+                event.wait()
+            else:
+                event.wait(max(deadline - time.time(), 0))
+
+        self.lock.acquire()
+        try:
+            for key in asked + [key for key, event in others]:
+                if key in self.pending:
+                    question, qType = key
+                    self.caches[qType][question] = \
+                        [lookupResult(qType, None, question,
+                                      self.cacheErrorSecs+now, now)]
+        finally:
+            self.lock.release()
+        return None
 
-        cacheToLookIn[question] = objs
-        return self.formatForReturn(objs)
+    def _work(self):
+        queryObj = DNS.DnsRequest(**self.queryArgs)
+        while True:
+            question, qType, done = self.queue.get()
+            try:
+                try:
+                    self.query(queryObj, question, qType)
+                except Exception, detail:
+                    print >> sys.stderr, "DNS prefetch failure:", detail
+                    now = int(time.time())
+                    self.store(question, qType,
+                               [lookupResult(qType, None, question,
+                                             self.cacheErrorSecs+now, now)])
+            finally:
+                done.put((question, qType))
 
 
 def main():
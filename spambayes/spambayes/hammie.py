@@ -5,7 +5,7 @@ import math
 from spambayes import mboxutils
 from spambayes import storage
 from spambayes.Options import options
-from spambayes.tokenizer import tokenize
+from spambayes.tokencache import tokenize
 
 class Hammie:
     """A spambayes mail filter.
@@ -56,6 +56,27 @@ class Hammie:
 
         return self._scoremsg(msg, evidence)
 
+    def score_many(self, msgs, evidence=False, tokens=None):
+        """Score (judge) a batch of messages.
+
+        msgs is a sequence of messages, each of which can be a string, a
+        file object, or a Message object.
+
+        Returns a list with one result per message, each as score()
+        would return it.  Tokens shared between the messages are only
+        looked up in the database once, so this is faster than calling
+        score() for each message.
+
+        If tokens is given, it is a list of the tokens of each message
+        (from tokenpool.tokenize_many, for example), and the messages
+        aren't tokenized again.
+
+        """
+
+        if tokens is None:
+            tokens = [tokenize(msg) for msg in msgs]
+        return self.bayes.spamprob_many(tokens, evidence)
+
     def score_and_filter(self, msg, header=None, spam_cutoff=None,
                          ham_cutoff=None, debugheader=None,
                          debug=None, train=None):
@@ -102,6 +123,51 @@ class Hammie:
         if train:
             self.untrain_from_header(msg)
         prob, clues = self._scoremsg(msg, True)
+        return prob, self._add_disposition(msg, prob, clues, header,
+                                           spam_cutoff, ham_cutoff,
+                                           debugheader, debug, train)
+
+    def score_and_filter_many(self, msgs, header=None, spam_cutoff=None,
+                              ham_cutoff=None, debugheader=None,
+                              debug=None):
+        """Score (judge) a batch of messages and add disposition headers.
+
+        This is score_and_filter() for a sequence of messages, using
+        score_many() so that the database is only consulted once per
+        distinct token.  Training on the result isn't supported, since
+        that would change the scores of later messages in the batch.
+
+        Returns a list of (score, message) pairs.
+        """
+
+        if header == None:
+            header = options["Headers", "classification_header_name"]
+        if spam_cutoff == None:
+            spam_cutoff = options["Categorization", "spam_cutoff"]
+        if ham_cutoff == None:
+            ham_cutoff = options["Categorization", "ham_cutoff"]
+        if debugheader == None:
+            debugheader = options["Headers", "evidence_header_name"]
+        if debug == None:
+            debug = options["Headers", "include_evidence"]
+
+        msgs = [mboxutils.get_message(msg) for msg in msgs]
+        for msg in msgs:
+            del msg[header]
+        results = []
+        for msg, (prob, clues) in zip(msgs, self.score_many(msgs, True)):
+            results.append((prob,
+                            self._add_disposition(msg, prob, clues, header,
+                                                  spam_cutoff, ham_cutoff,
+                                                  debugheader, debug,
+                                                  False)))
+        return results
+
+    def _add_disposition(self, msg, prob, clues, header, spam_cutoff,
+                         ham_cutoff, debugheader, debug, train):
+        """Add the disposition (and, optionally, evidence) headers for
+        an already scored message, training on it if train is true, and
+        return the message as a string."""
         if prob < ham_cutoff:
             is_spam = False
             disp = options["Headers", "header_ham_string"]
@@ -137,9 +203,8 @@ class Hammie:
             disp = self.formatclues(clues)
             del msg[debugheader]
             msg.add_header(debugheader, disp)
-        result = mboxutils.as_string(msg, unixfrom=(msg.get_unixfrom()
-                                                    is not None))
-        return prob, result
+        return mboxutils.as_string(msg, unixfrom=(msg.get_unixfrom()
+                                                  is not None))
 
     def filter(self, msg, header=None, spam_cutoff=None,
                ham_cutoff=None, debugheader=None,
@@ -149,7 +214,12 @@ class Hammie:
             debug, train)
         return result
 
-    def train(self, msg, is_spam, add_header=False):
+    def filter_many(self, msgs, header=None, spam_cutoff=None,
+                    ham_cutoff=None, debugheader=None, debug=None):
+        return [result for _prob, result in self.score_and_filter_many(
+            msgs, header, spam_cutoff, ham_cutoff, debugheader, debug)]
+
+    def train(self, msg, is_spam, add_header=False, tokens=None):
         """Train bayes with a message.
 
         msg can be a string, a file object, or a Message object.
@@ -159,9 +229,14 @@ class Hammie:
         If add_header is True, add a header with how it was trained (in
         case we need to untrain later)
 
+        If tokens is given, they are the message's tokens, and it isn't
+        tokenized again.
+
         """
 
-        self.bayes.learn(tokenize(msg), is_spam)
+        if tokens is None:
+            tokens = tokenize(msg)
+        self.bayes.learn(tokens, is_spam)
         if add_header:
             if is_spam:
                 trained = options["Headers", "header_spam_string"]
@@ -170,16 +245,21 @@ class Hammie:
             del msg[options["Headers", "trained_header_name"]]
             msg.add_header(options["Headers", "trained_header_name"], trained)
 
-    def untrain(self, msg, is_spam):
+    def untrain(self, msg, is_spam, tokens=None):
         """Untrain bayes with a message.
 
         msg can be a string, a file object, or a Message object.
 
         is_spam should be True if the message is spam, False if not.
 
+        If tokens is given, they are the message's tokens, and it isn't
+        tokenized again.
+
         """
 
-        self.bayes.unlearn(tokenize(msg), is_spam)
+        if tokens is None:
+            tokens = tokenize(msg)
+        self.bayes.unlearn(tokens, is_spam)
 
     def untrain_from_header(self, msg):
         """Untrain bayes based on X-Spambayes-Trained header.
@@ -35,6 +35,9 @@ Where:
     -r
         reverse the meaning of the check (report ham instead of spam).
         Only meaningful with the -u option.
+    -j N
+        parse and tokenize the messages in N processes at once (for -g,
+        -s and -u).
 """
 
 import sys
@@ -42,7 +45,7 @@ import os
 import getopt
 
 from spambayes.Options import options, get_pathname_option
-from spambayes import mboxutils, hammie, Corpus, storage
+from spambayes import mboxutils, hammie, Corpus, storage, tokenpool
 
 Corpus.Verbose = True
 
@@ -64,43 +67,75 @@ SPAM_THRESHOLD = options["Categorization", "spam_cutoff"]
 HAM_THRESHOLD = options["Categorization", "ham_cutoff"]
 
 
-def train(h, msgs, is_spam):
+def _getmbox(msgs, jobs):
+    """Return the messages in a mailbox, with their tokens (see
+    tokenpool.tokenize_many)."""
+    if jobs > 1:
+        # Leave parsing the messages to the workers.
+        mbox = mboxutils.getmbox(msgs, mboxutils.get_text)
+    else:
+        mbox = mboxutils.getmbox(msgs)
+    return tokenpool.tokenize_many(mbox, jobs)
+
+def train(h, msgs, is_spam, jobs=1):
     """Train bayes with all messages from a mailbox."""
-    mbox = mboxutils.getmbox(msgs)
     i = 0
-    for msg in mbox:
+    for msg, tokens in _getmbox(msgs, jobs):
         i += 1
         if i % 10 == 0:
             sys.stdout.write("\r%6d" % i)
             sys.stdout.flush()
-        h.train(msg, is_spam)
+        h.train(msg, is_spam, tokens=tokens)
     sys.stdout.write("\r%6d" % i)
     sys.stdout.flush()
     print
 
-def untrain(h, msgs, is_spam):
+def untrain(h, msgs, is_spam, jobs=1):
     """Untrain bayes with all messages from a mailbox."""
-    mbox = mboxutils.getmbox(msgs)
     i = 0
-    for msg in mbox:
+    for msg, tokens in _getmbox(msgs, jobs):
         i += 1
         if i % 10 == 0:
             sys.stdout.write("\r%6d" % i)
             sys.stdout.flush()
-        h.untrain(msg, is_spam)
+        h.untrain(msg, is_spam, tokens)
     sys.stdout.write("\r%6d" % i)
     sys.stdout.flush()
     print
 
-def score(h, msgs, reverse=0):
+# Number of messages scored together by score(); see Hammie.score_many.
+SCORE_BATCH_SIZE = 100
+
+def score(h, msgs, reverse=0, jobs=1):
     """Score (judge) all messages from a mailbox."""
     # XXX The reporting needs work!
-    mbox = mboxutils.getmbox(msgs)
     i = 0
     spams = hams = unsures = 0
-    for msg in mbox:
+    batch = []
+    for msg_tokens in _getmbox(msgs, jobs):
+        batch.append(msg_tokens)
+        if len(batch) < SCORE_BATCH_SIZE:
+            continue
+        i, s, g, u = _score_batch(h, batch, i, reverse)
+        spams += s
+        hams += g
+        unsures += u
+        batch = []
+    if batch:
+        i, s, g, u = _score_batch(h, batch, i, reverse)
+        spams += s
+        hams += g
+        unsures += u
+    return (spams, hams, unsures)
+
+def _score_batch(h, batch, i, reverse):
+    """Score and report on a list of (message, tokens), numbered from
+    i+1."""
+    spams = hams = unsures = 0
+    msgs = [msg for msg, tokens in batch]
+    tokens = [tokens for msg, tokens in batch]
+    for msg, (prob, clues) in zip(msgs, h.score_many(msgs, True, tokens)):
         i += 1
-        prob, clues = h.score(msg, True)
         if hasattr(msg, '_mh_msgno'):
             msgno = msg._mh_msgno
         else:
@@ -121,7 +156,7 @@ def score(h, msgs, reverse=0):
             unsures += 1
             print "%6s %4.2f U" % (msgno, prob),
             print h.formatclues(clues)
-    return (spams, hams, unsures)
+    return i, spams, hams, unsures
 
 def usage(code, msg=''):
     """Print usage message and sys.exit(code)."""
@@ -134,7 +169,7 @@ def usage(code, msg=''):
 def main():
     """Main program; parse options and go."""
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hd:Ufg:s:p:u:r')
+        opts, args = getopt.getopt(sys.argv[1:], 'hd:Ufg:s:p:u:rj:')
     except getopt.error, msg:
         usage(2, msg)
 
@@ -150,6 +185,7 @@ def main():
     do_filter = False
     usedb = None
     mode = 'r'
+    jobs = 1
     for opt, arg in opts:
         if opt == '-h':
             usage(0)
@@ -167,6 +203,8 @@ def main():
             untrain_mode = 1
         elif opt == '-r':
             reverse = 1
+        elif opt == '-j':
+            jobs = int(arg)
     pck, usedb = storage.database_type(opts)
     if args:
         usage(2, "Positional arguments not allowed")
@@ -181,22 +219,22 @@ def main():
     if not untrain_mode:
         for g in good:
             print "Training ham (%s):" % g
-            train(h, g, False)
+            train(h, g, False, jobs)
             save = True
 
         for s in spam:
             print "Training spam (%s):" % s
-            train(h, s, True)
+            train(h, s, True, jobs)
             save = True
     else:
         for g in good:
             print "Untraining ham (%s):" % g
-            untrain(h, g, False)
+            untrain(h, g, False, jobs)
             save = True
 
         for s in spam:
             print "Untraining spam (%s):" % s
-            untrain(h, s, True)
+            untrain(h, s, True, jobs)
             save = True
 
     if save:
@@ -212,7 +250,7 @@ def main():
         for u in unknown:
             if len(unknown) > 1:
                 print "Scoring", u
-            s, g, u = score(h, u, reverse)
+            s, g, u = score(h, u, reverse, jobs)
             spams += s
             hams += g
             unsures += u
@@ -0,0 +1,148 @@
+"""A bounded mapping that evicts the least recently used entries.
+
+LRUCache behaves like a (small) dictionary with a maximum size.  Looking
+an entry up marks it as the most recently used one; once the cache is
+full, storing a new entry throws away the least recently used one.  All
+operations are O(1).
+
+The size can be limited by the number of entries, by the total size of
+the values (as measured by a function given to the constructor), or
+both.  A function can also be given that is called with the key and
+value of every entry that is thrown away.
+
+The number of hits, misses and evictions is counted, so that users of a
+cache can report how well it is working.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+# Offsets into the [prev, next, key, value, size] lists that make up the
+# circular doubly-linked list of entries.
+_PREV, _NEXT, _KEY, _VALUE, _SIZE = 0, 1, 2, 3, 4
+
+class LRUCache(object):
+    def __init__(self, maxsize, maxbytes=0, sizeof=None, on_evict=None):
+        '''Constructor(maximum number of entries (None for no limit),
+        maximum total size of the values (0 for no limit),
+        function returning the size of a value,
+        function to call with the key and value of each evicted entry)'''
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = self.misses = self.evictions = 0
+        self.clear()
+
+    def clear(self):
+        '''Remove all entries (the statistics are kept).'''
+        self._map = {}
+        self.nbytes = 0
+        # The root of the list is a sentinel entry; root[_NEXT] is the
+        # least recently used entry, and root[_PREV] the most recently
+        # used one.
+        root = []
+        root[:] = [root, root, None, None, 0]
+        self._root = root
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        # Deliberately neither counted nor treated as a use.
+        return key in self._map
+
+    has_key = __contains__
+
+    def __getitem__(self, key):
+        try:
+            link = self._map[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._move_to_end(link)
+        return link[_VALUE]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if self.sizeof is None:
+            size = 0
+        else:
+            size = self.sizeof(value)
+        link = self._map.get(key)
+        if link is not None:
+            link[_VALUE] = value
+            self.nbytes += size - link[_SIZE]
+            link[_SIZE] = size
+            self._move_to_end(link)
+        else:
+            root = self._root
+            last = root[_PREV]
+            link = [last, root, key, value, size]
+            last[_NEXT] = root[_PREV] = self._map[key] = link
+            self.nbytes += size
+        maxsize = self.maxsize
+        while self._map and ((maxsize is not None and
+                              len(self._map) > maxsize) or
+                             (self.maxbytes and self.nbytes > self.maxbytes)):
+            self._evict()
+
+    def __delitem__(self, key):
+        link = self._map.pop(key)
+        self.nbytes -= link[_SIZE]
+        self._unlink(link)
+
+    def keys(self):
+        '''Return the keys, from least to most recently used.'''
+        keys = []
+        root = self._root
+        link = root[_NEXT]
+        while link is not root:
+            keys.append(link[_KEY])
+            link = link[_NEXT]
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def _evict(self):
+        oldest = self._root[_NEXT]
+        key, value = oldest[_KEY], oldest[_VALUE]
+        del self._map[key]
+        self.nbytes -= oldest[_SIZE]
+        self._unlink(oldest)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def _unlink(self, link):
+        prev, next = link[_PREV], link[_NEXT]
+        prev[_NEXT] = next
+        next[_PREV] = prev
+        # Break the reference cycle.
+        del link[:]
+
+    def _move_to_end(self, link):
+        prev, next = link[_PREV], link[_NEXT]
+        prev[_NEXT] = next
+        next[_PREV] = prev
+        root = self._root
+        last = root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = root
+        last[_NEXT] = root[_PREV] = link
+
+    def __repr__(self):
+        return "<LRUCache %d/%s entries, %d bytes, %d hits, %d misses, " \
+               "%d evictions>" % (len(self), self.maxsize, self.nbytes,
+                                  self.hits, self.misses, self.evictions)
@@ -78,11 +78,17 @@ def _cat(seqs):
         for item in seq:
             yield item
 
-def getmbox(name):
-    """Return an mbox iterator given a file/directory/folder name."""
+def getmbox(name, factory=None):
+    """Return an mbox iterator given a file/directory/folder name.
+
+    The messages are made by factory (get_message by default), from a
+    file or string, except for IMAP folders."""
+
+    if factory is None:
+        factory = get_message
 
     if name == "-":
-        return [get_message(sys.stdin)]
+        return [factory(sys.stdin)]
 
     if name.startswith("+"):
         # MH folder name: +folder, +f1,f2,f2, or +ALL
@@ -99,7 +105,7 @@ def getmbox(name):
         mhpath = mh.getpath()
         for name in names:
             filename = os.path.join(mhpath, name)
-            mbox = mailbox.MHMailbox(filename, get_message)
+            mbox = mailbox.MHMailbox(filename, factory)
             mboxes.append(mbox)
         if len(mboxes) == 1:
             return iter(mboxes[0])
@@ -142,16 +148,27 @@ def getmbox(name):
         # XXX Bogus: use a Maildir if /cur is a subdirectory, else a MHMailbox
         # if the pathname contains /Mail/, else a DirOfTxtFileMailbox.
         if os.path.exists(os.path.join(name, 'cur')):
-            mbox = mailbox.Maildir(name, get_message)
+            mbox = mailbox.Maildir(name, factory)
         elif name.find("/Mail/") >= 0:
-            mbox = mailbox.MHMailbox(name, get_message)
+            mbox = mailbox.MHMailbox(name, factory)
         else:
-            mbox = DirOfTxtFileMailbox(name, get_message)
+            mbox = DirOfTxtFileMailbox(name, factory)
     else:
         fp = open(name, "rb")
-        mbox = mailbox.PortableUnixMailbox(fp, get_message)
+        mbox = mailbox.PortableUnixMailbox(fp, factory)
     return iter(mbox)
 
+def get_text(obj):
+    """Return the text of a message, from a string or file-like object.
+
+    This is a getmbox() factory for when the messages will be parsed
+    later (in another process, for example).
+    """
+
+    if hasattr(obj, "read"):
+        obj = obj.read()
+    return obj
+
 def get_message(obj):
     """Return an email Message object.
 
@@ -73,6 +73,7 @@ from __future__ import generators
 __author__ = "Tim Stone <tim@fourstonesExpressions.com>"
 __credits__ = "Mark Hammond, Tony Meyer, all the spambayes contributors."
 
+import os
 import sys
 import types
 import time
@@ -82,6 +83,7 @@ import errno
 import shelve
 import warnings
 import cPickle as pickle
+import atexit
 import traceback
 
 import email.Message
@@ -91,7 +93,7 @@ import email.Generator
 
 from spambayes import storage
 from spambayes import dbmstorage
-from spambayes.tokenizer import tokenize
+from spambayes.tokencache import tokenize
 from spambayes.Options import options
 from spambayes.safepickle import pickle_read, pickle_write
 
@@ -104,13 +106,27 @@ CRLF_RE = re.compile(r'\r\n|\r|\n')
 
 STATS_START_KEY = "Statistics start date"
 STATS_STORAGE_KEY = "Persistent statistics"
+STATS_DAYS_KEY = "Daily statistics"
 PERSISTENT_HAM_STRING = 'h'
 PERSISTENT_SPAM_STRING = 's'
 PERSISTENT_UNSURE_STRING = 'u'
 
+def _day_key(day):
+    return "%s %r" % (STATS_DAYS_KEY, day)
+
+def is_statistics_key(key):
+    """Return true if the messageinfo key is used for statistics, not a
+    message."""
+    return key in (STATS_START_KEY, STATS_STORAGE_KEY) or \
+           key.startswith(STATS_DAYS_KEY)
+
 class MessageInfoBase(object):
     def __init__(self, db_name=None):
         self.db_name = db_name
+        # Changes are stored together (see _changed); this is how many
+        # have been made since they were last stored, and when that was.
+        self.changes = 0
+        self.last_store = time.time()
 
     def __len__(self):
         return len(self.keys())
@@ -123,7 +139,7 @@ class MessageInfoBase(object):
 
     def set_statistics_start_date(self, date):
         self.db[STATS_START_KEY] = date
-        self.store()
+        self._changed(STATS_START_KEY)
 
     def get_persistent_statistics(self):
         if self.db.has_key(STATS_STORAGE_KEY):
@@ -131,9 +147,48 @@ class MessageInfoBase(object):
         else:
             return None
             
-    def set_persistent_statistics(self, stats):
+    def set_persistent_statistics(self, stats, day=None, day_stats=None,
+                                  days=None):
+        """Store the statistics totals.  If day is given, also store the
+        statistics for the day that starts then, and if days is given,
+        the list of all the days that there are statistics for."""
         self.db[STATS_STORAGE_KEY] = stats
-        self.store()
+        keys = [STATS_STORAGE_KEY]
+        if day is not None:
+            self.db[_day_key(day)] = day_stats
+            keys.append(_day_key(day))
+        if days is not None:
+            self.db[STATS_DAYS_KEY] = days
+            keys.append(STATS_DAYS_KEY)
+        self._changed(*keys)
+
+    def get_statistics_days(self):
+        """Return the list of the days that there are statistics for,
+        or None if daily statistics haven't been kept."""
+        if self.db.has_key(STATS_DAYS_KEY):
+            return self.db[STATS_DAYS_KEY]
+        else:
+            return None
+
+    def get_day_statistics(self, day):
+        key = _day_key(day)
+        if self.db.has_key(key):
+            return self.db[key]
+        else:
+            return {}
+
+    def set_daily_statistics(self, daily_stats):
+        """Store the statistics for many days at once (a dictionary of
+        the statistics for each day, by the time it starts)."""
+        days = daily_stats.keys()
+        days.sort()
+        keys = []
+        for day in days:
+            self.db[_day_key(day)] = daily_stats[day]
+            keys.append(_day_key(day))
+        self.db[STATS_DAYS_KEY] = days
+        keys.append(STATS_DAYS_KEY)
+        self._changed(*keys)
 
     def __getstate__(self):
         return self.db
@@ -190,20 +245,56 @@ class MessageInfoBase(object):
             key = msg.getDBKey()
             assert key is not None, "None is not a valid key."
             self.db[key] = attributes
-            self.store()
+            self._changed(key)
 
     def remove_msg(self, msg):
         if self.db is not None:
-            del self.db[msg.getDBKey()]
-            self.store()
+            key = msg.getDBKey()
+            del self.db[key]
+            self._changed(key)
 
     def keys(self):
         return self.db.keys()
 
+    def _changed(self, *keys):
+        """This is called after the values of keys are changed.  Storing
+        the database after every message is slow (a dbm database is
+        synced), so changes are stored together, once there are enough
+        of them, or enough time has passed, and when the database is
+        closed.  A crash loses at most the changes that haven't been
+        stored."""
+        self.changes += 1
+        if self.changes >= \
+           options["Storage", "messageinfo_write_batch_size"] or \
+           time.time() - self.last_store >= \
+           options["Storage", "messageinfo_write_interval"]:
+            self.store()
+
+    def _stored(self):
+        """Subclasses call this when all the changes have been stored."""
+        self.changes = 0
+        self.last_store = time.time()
+
+    def flush(self):
+        """Store any changes that haven't been stored yet."""
+        if self.changes:
+            self.store()
+
 class MessageInfoPickle(MessageInfoBase):
+    # Rewriting the whole pickle takes longer the more messages there
+    # are, so each change is also appended to a journal (a file of
+    # pickled (key, value) records, or (key,) for a key that has been
+    # removed), which is read after the pickle when loading.  Storing
+    # writes the pickle and empties the journal.  As the journal keeps
+    # every change safe, the pickle is only rewritten when the journal
+    # has more records than there are messages in the database (so that
+    # the cost of the rewrites, for each change, doesn't grow with the
+    # database) and than messageinfo_write_batch_size, and when the
+    # database is closed.
     def __init__(self, db_name, pickle_type=1):
         MessageInfoBase.__init__(self, db_name)
         self.mode = pickle_type
+        self.journal_name = db_name + ".journal"
         self.load()
 
     def load(self):
@@ -215,13 +306,68 @@ class MessageInfoPickle(MessageInfoBase):
                 self.db = {}
             else:
                 raise
+        self._stored()
+        try:
+            fp = open(self.journal_name, "rb")
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return
+        size = os.path.getsize(self.journal_name)
+        try:
+            while fp.tell() < size:
+                try:
+                    record = pickle.load(fp)
+                except (EOFError, pickle.UnpicklingError, ValueError,
+                        IndexError, KeyError, TypeError):
+                    # A record that wasn't finished (perhaps the machine
+                    # crashed).  Anything appended after it couldn't be
+                    # read, so start a new journal now.
+                    self.changes += 1
+                    fp.close()
+                    self.store()
+                    return
+                if len(record) == 1:
+                    self.db.pop(record[0], None)
+                else:
+                    self.db[record[0]] = record[1]
+                self.changes += 1
+        finally:
+            fp.close()
 
     def close(self):
-        # we keep no resources open - nothing to do
+        # We keep no resources open, but the journal is folded into the
+        # pickle, so that it is quick to load next time.
+        if self.changes:
+            self.store()
+
+    def flush(self):
+        # Every change is already in the journal.
         pass
 
+    def _changed(self, *keys):
+        fp = open(self.journal_name, "ab")
+        try:
+            for key in keys:
+                if key in self.db:
+                    pickle.dump((key, self.db[key]), fp, self.mode)
+                else:
+                    pickle.dump((key,), fp, self.mode)
+        finally:
+            fp.close()
+        self.changes += len(keys)
+        if self.changes > max(len(self.db), options["Storage",
+                                   "messageinfo_write_batch_size"]):
+            self.store()
+
     def store(self):
         pickle_write(self.db_name, self.db, self.mode)
+        try:
+            os.remove(self.journal_name)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        self._stored()
 
 class MessageInfoDB(MessageInfoBase):
     def __init__(self, db_name, mode='c'):
@@ -251,10 +397,13 @@ class MessageInfoDB(MessageInfoBase):
             pass
         getattr(self.db, "close", noop)()
         getattr(self.dbm, "close", noop)()
+        # Closing the shelf syncs it.
+        self._stored()
 
     def store(self):
         if self.db is not None:
             self.db.sync()
+        self._stored()
 
 # If ZODB isn't available, then this class won't be useable, but we
 # still need to be able to import this module.  So we pretend that all
@@ -271,6 +420,13 @@ class _PersistentMessageInfo(MessageInfoBase, Persistent):
         MessageInfoBase.__init__(self)
         self.db = OOBTree()
 
+    def _changed(self, *keys):
+        # Each change is committed in its own transaction.
+        self.store()
+
+    def flush(self):
+        pass
+
 class MessageInfoZODB(storage.ZODBClassifier):
     ClassifierClass = _PersistentMessageInfo
     def __init__(self, db_name, mode='c'):
@@ -347,6 +503,7 @@ class Message(object, email.Message.Message):
         if klass._message_info_db is None:
             nm, typ = database_type()
             klass._message_info_db = open_storage(nm, typ)
+            atexit.register(klass._message_info_db.flush)
         return klass._message_info_db
     _get_class_message_info_db = classmethod(_get_class_message_info_db)
     def _set_class_message_info_db(klass, value):
@@ -402,6 +559,9 @@ class Message(object, email.Message.Message):
         if id == STATS_STORAGE_KEY:
             raise ValueError, "MsgId must not be " + STATS_STORAGE_KEY
 
+        if id.startswith(STATS_DAYS_KEY):
+            raise ValueError, "MsgId must not start with " + STATS_DAYS_KEY
+
         self.id = id
         self.message_info_db.load_msg(self)
 
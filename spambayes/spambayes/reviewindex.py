@@ -0,0 +1,211 @@
+"""A summary of each message in the Unknown cache, for the Review page.
+
+The Review page shows, for each message received on a day, a few headers,
+the score, the classification and the start of the body.  Getting these
+from the messages themselves means opening and parsing every one of them
+each time the page is displayed, which is slow with a large cache.
+
+So when a message is added to the cache, a compact summary of it is
+recorded in a ReviewIndex (which observes the corpus, like the Trainers),
+and the page is built from those.  The whole message is only loaded when
+it is needed: to show its clues, or to train on it.
+
+The index is kept in a file in the cache directory, which is only ever
+appended to (so that adding a message is cheap) and is rewritten when
+more than half of it is out of date.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import os
+import re
+import marshal
+
+from email.Iterators import typed_subpart_iterator
+
+from spambayes import tokenizer
+from spambayes.Options import options, _
+
+REVIEW_INDEX_NAME = "review_index.dat"
+
+# The Review page shows at most 200 characters of the body; keep enough
+# that the summary is the same however the text is decoded.
+MAX_BODY = 1000
+
+def _body_text(message):
+    """Return the text of the body of the message, as it is shown on the
+    Review page."""
+    try:
+        part = typed_subpart_iterator(message, 'text', 'plain').next()
+        text = part.get_payload()
+    except StopIteration:
+        try:
+            part = typed_subpart_iterator(message, 'text', 'html').next()
+            text = part.get_payload()
+            text, unused = tokenizer.crack_html_style(text)
+            text, unused = tokenizer.crack_html_comment(text)
+            text = tokenizer.html_re.sub(' ', text)
+            text = _('(this message only has an HTML body)\n') + text
+        except StopIteration:
+            text = _('(this message has no text body)')
+    if type(text) == type([]):  # gotta be a 'right' way to do this
+        text = _("(this message is a digest of %s messages)") % (len(text))
+    elif text is None:
+        text = _("(this message has no body)")
+    else:
+        text = text.replace('&nbsp;', ' ')      # Else they'll be quoted
+        text = re.sub(r'(\s)\s+', r'\1', text)  # Eg. multiple blank lines
+        text = text.strip()
+    return text[:MAX_BODY]
+
+def summarize(message, size=None):
+    """Return a dictionary summarising the message for the Review page:
+    'headers' (a dictionary of the subject and the display_headers,
+    keyed by lowercase name), 'score' (as a percentage, or "Err" or "?"
+    if it is bad or not known), 'classification', 'body' and 'size'."""
+    # Remove notations before displaying - see:
+    # [ 848365 ] Remove subject annotations from message review page
+    message.delNotations()
+    headers = {"subject" : message["Subject"] or "(none)"}
+    for header in options["html_ui", "display_headers"]:
+        headers[header.lower()] = (message[header] or "(none)")
+    score = message[options["Headers", "score_header_name"]]
+    if score:
+        # the score might have the log info at the end
+        op = score.find('(')
+        if op >= 0:
+            score = score[:op]
+        try:
+            score = float(score) * 100
+        except ValueError:
+            # Hmm.  The score header should only contain a floating
+            # point number.  What's going on here, then?
+            score = "Err"  # Let the user know something is wrong.
+    else:
+        # If the lookup fails, this means that the "include_score"
+        # option isn't activated. We have the choice here to either
+        # calculate it now, which is pretty inefficient, since we have
+        # already done so, or to admit that we don't know what it is.
+        # We'll go with the latter.
+        score = "?"
+    judgement = message[options["Headers", "classification_header_name"]]
+    if judgement is None:
+        judgement = options["Headers", "header_unsure_string"]
+    else:
+        judgement = judgement.split(';')[0].strip()
+    if size is None:
+        size = len(message.as_string())
+    # Header values may be Header objects, which marshal can't store.
+    for name, value in headers.items():
+        headers[name] = str(value)
+    return {"headers" : headers,
+            "score" : score,
+            "classification" : str(judgement),
+            "body" : _body_text(message),
+            "size" : size,
+            }
+
+def has_display_headers(summary):
+    """Return true if the summary includes all the headers that the
+    Review page currently displays (the display_headers option might
+    have changed since it was made)."""
+    headers = summary["headers"]
+    for header in options["html_ui", "display_headers"]:
+        if header.lower() not in headers:
+            return False
+    return True
+
+class ReviewIndex(object):
+    '''The summaries of the messages in a corpus'''
+
+    # The index file is a log of marshalled (key, summary) records, with
+    # a summary of None for a message that has been removed.
+
+    def __init__(self, filename, corpus=None):
+        '''Constructor(name of index file, corpus to index).  The
+        summaries of messages that are no longer in the corpus are
+        dropped when the index is loaded.'''
+        self.filename = filename
+        self.corpus = corpus
+        self.summaries = {}
+        self.stale = 0      # number of out of date records in the file
+        if os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        '''Read the index file'''
+        summaries = self.summaries
+        fp = open(self.filename, "rb")
+        records = 0
+        while True:
+            try:
+                key, summary = marshal.load(fp)
+            except (EOFError, ValueError, TypeError):
+                # The end of the file, or a record that wasn't finished
+                # (perhaps the machine crashed).
+                break
+            records += 1
+            if summary is None:
+                summaries.pop(key, None)
+            else:
+                summaries[key] = summary
+        fp.close()
+        if self.corpus is not None:
+            # Messages might have been expired or removed while the index
+            # wasn't being watched.
+            present = dict.fromkeys(self.corpus.keys())
+            for key in summaries.keys():
+                if key not in present:
+                    del summaries[key]
+        self.stale = records - len(summaries)
+        if self.stale > len(summaries):
+            self.compact()
+
+    def compact(self):
+        '''Rewrite the index file without the out of date records'''
+        tmp = self.filename + ".tmp"
+        fp = open(tmp, "wb")
+        for record in self.summaries.iteritems():
+            marshal.dump(record, fp)
+        fp.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmp, self.filename)
+        self.stale = 0
+
+    def _append(self, record):
+        fp = open(self.filename, "ab")
+        marshal.dump(record, fp)
+        fp.close()
+
+    def get(self, key):
+        '''Return the summary of the message with this key, or None'''
+        return self.summaries.get(key)
+
+    def add(self, key, summary):
+        '''Record the summary of a message'''
+        if key in self.summaries:
+            self.stale += 1
+        self.summaries[key] = summary
+        self._append((key, summary))
+
+    def remove(self, key):
+        '''Forget a message'''
+        if self.summaries.pop(key, None) is not None:
+            self.stale += 2
+            self._append((key, None))
+
+    # Corpus observer interface.
+
+    def onAddMessage(self, message, flags=0):
+        size = None
+        if self.corpus is not None:
+            # The corpus usually knows this without the message having to
+            # be generated again (a plain Corpus says 0).
+            size = self.corpus.messageSize(message) or None
+        self.add(message.key(), summarize(message, size))
+
+    def onRemoveMessage(self, message, flags=0):
+        self.remove(message.key())
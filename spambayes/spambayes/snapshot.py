@@ -0,0 +1,172 @@
+"""Binary snapshots of a word database.
+
+A snapshot is a single file holding the ham and spam message counts and
+the spam and ham counts of every word, laid out so that it can be memory
+mapped and searched in place: opening a snapshot doesn't read the words
+at all, so it takes the same (very short) time however large the
+database is.  Writing one is a straight dump of a few strings, which is
+much quicker than pickling a dictionary of WordInfo objects.
+
+The file is made up of (all integers are unsigned, 32 bits, little-endian)
+
+    header   magic ("SBSNAP"), format version (16 bits), nspam, nham,
+             number of words
+    offsets  number of words + 1 offsets into the word data; word i is
+             data[offsets[i]:offsets[i+1]]
+    spam     the spamcount of each word
+    ham      the hamcount of each word
+    data     the words, one after another
+
+The words are sorted (as byte strings), so a word is found by binary
+search.  Words are stored as byte strings; unicode words should be
+encoded as utf-8 first.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+import lockfile
+
+MAGIC = "SBSNAP"
+VERSION = 1
+
+_HEADER = "<6sHIII"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+def _to_string(a):
+    """Return the little-endian string form of an array('I')."""
+    if sys.byteorder == "big":
+        a = array('I', a)
+        a.byteswap()
+    return a.tostring()
+
+def _from_string(s):
+    """Return the array('I') for a little-endian string."""
+    a = array('I')
+    a.fromstring(s)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+class Snapshot(object):
+    """A read-only, memory mapped, snapshot file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        f = open(filename, "rb")
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER_SIZE:
+                raise ValueError("%s is not a snapshot (too short)" %
+                                 (filename,))
+            self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        magic, version, self.nspam, self.nham, self.nwords = \
+               struct.unpack(_HEADER, self._map[:_HEADER_SIZE])
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a snapshot" % (filename,))
+        if version != VERSION:
+            self.close()
+            raise ValueError("Can't read snapshot -- version %s unknown" %
+                             (version,))
+        n = self.nwords
+        self._offsets = _HEADER_SIZE
+        self._spam = self._offsets + 4 * (n + 1)
+        self._ham = self._spam + 4 * n
+        self._data = self._ham + 4 * n
+        if size < self._data or size != self._data + \
+           struct.unpack("<I", self._map[self._spam-4:self._spam])[0]:
+            self.close()
+            raise ValueError("%s is truncated" % (filename,))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return self.nwords
+
+    def _word(self, i):
+        pos = self._offsets + 4 * i
+        start, end = struct.unpack("<II", self._map[pos:pos+8])
+        return self._map[self._data+start:self._data+end]
+
+    def get(self, word):
+        """Return (spamcount, hamcount) for word, or None if it isn't
+        in the snapshot."""
+        lo, hi = 0, self.nwords
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.nwords or self._word(lo) != word:
+            return None
+        spam = self._spam + 4 * lo
+        ham = self._ham + 4 * lo
+        return (struct.unpack("<I", self._map[spam:spam+4])[0],
+                struct.unpack("<I", self._map[ham:ham+4])[0])
+
+    def words(self):
+        """Return a (sorted) list of all the words."""
+        offsets = _from_string(self._map[self._offsets:self._spam])
+        data = self._map[self._data:self._data+offsets[-1]]
+        return [data[offsets[i]:offsets[i+1]] for i in xrange(self.nwords)]
+
+    def counts(self):
+        """Return the spam and ham counts of all the words, in the same
+        order as words(), as two arrays."""
+        return (_from_string(self._map[self._spam:self._ham]),
+                _from_string(self._map[self._ham:self._data]))
+
+def write(filename, nspam, nham, words, spamcounts, hamcounts):
+    """Write a snapshot.  The words must be sorted byte strings, and the
+    counts sequences of the same length.
+
+    As with pickles, the snapshot is written to a temporary file that
+    then replaces the old one, so readers always see a complete file.
+    """
+    n = len(words)
+    assert len(spamcounts) == len(hamcounts) == n
+    offsets = array('I', [0])
+    pos = 0
+    for word in words:
+        pos += len(word)
+        offsets.append(pos)
+
+    lock = lockfile.FileLock(filename)
+    lock.acquire(timeout=20)
+    try:
+        tmp = filename + '.tmp'
+        fp = open(tmp, 'wb')
+        try:
+            fp.write(struct.pack(_HEADER, MAGIC, VERSION, nspam, nham, n))
+            fp.write(_to_string(offsets))
+            fp.write(_to_string(array('I', spamcounts)))
+            fp.write(_to_string(array('I', hamcounts)))
+            fp.write("".join(words))
+            fp.close()
+        except:
+            fp.close()
+            os.remove(tmp)
+            raise
+        # See safepickle.pickle_write for why this isn't just a rename.
+        try:
+            os.rename(tmp, filename)
+        except OSError:
+            os.rename(filename, filename + '.bak')
+            os.rename(tmp, filename)
+            os.remove(filename + '.bak')
+    finally:
+        lock.release()
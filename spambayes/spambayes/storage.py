@@ -8,6 +8,8 @@ Classes:
     PGClassifier - Classifier that uses postgres
     mySQLClassifier - Classifier that uses mySQL
     CBDClassifier - Classifier that uses CDB
+    MappedCDBClassifier - Classifier that uses a memory mapped CDB
+    SnapshotClassifier - Classifier that uses a binary snapshot
     ZODBClassifier - Classifier that uses ZODB
     ZEOClassifier - Classifier that uses ZEO
     Trainer - Classifier training observer
@@ -59,11 +61,13 @@ import sys
 import time
 import types
 import tempfile
+from bisect import bisect_left
 from spambayes import classifier
 from spambayes.Options import options, get_pathname_option
 import errno
 import shelve
 from spambayes import cdb
+from spambayes import snapshot
 from spambayes import dbmstorage
 from spambayes.safepickle import pickle_write, pickle_read
 
@@ -119,7 +123,7 @@ class PickledClassifier(classifier.Classifier):
             # new pickle
             if options["globals", "verbose"]:
                 print >> sys.stderr, self.db_name,'is a new pickle'
-            self.wordinfo = {}
+            self.wordinfo = self._new_wordinfo()
             self.nham = 0
             self.nspam = 0
 
@@ -154,6 +158,10 @@ class DBDictClassifier(classifier.Classifier):
         self.load()
 
     def close(self):
+        # Write out anything still buffered (but, as always, changes to
+        # the cached words are only saved by store()).
+        if hasattr(self, "db") and (self.pending_words or self.state_changed):
+            self._flush()
         # Close our underlying database.  Better not assume all databases
         # have close functions!
         def noop():
@@ -198,6 +206,11 @@ class DBDictClassifier(classifier.Classifier):
             self.nham = 0
         self.wordinfo = {}
         self.changed_words = {} # value may be one of the WORD_ constants
+        # Singleton words that haven't been written to the database yet
+        # (see _post_training); maps word to the record's state.
+        self.pending_words = {}
+        self.state_changed = False
+        self.last_flush = time.time()
 
     def store(self):
         '''Place state into persistent store'''
@@ -229,18 +242,39 @@ class DBDictClassifier(classifier.Classifier):
         # Reset the changed word list.
         self.changed_words = {}
         # Update the global state, then do the actual save.
-        self._write_state_key()
+        self._flush()
         self.db.sync()
 
+    def _flush(self):
+        """Write the buffered singleton words and the state key."""
+        # Writing in key order helps databases that keep their keys
+        # sorted, and does no harm to the others.
+        words = self.pending_words.keys()
+        words.sort()
+        for word in words:
+            self.db[word] = self.pending_words[word]
+        self.pending_words = {}
+        self._write_state_key()
+        self.state_changed = False
+        self.last_flush = time.time()
+
     def _write_state_key(self):
         self.db[self.statekey] = (classifier.PICKLE_VERSION,
                                   self.nspam, self.nham)
 
     def _post_training(self):
-        """This is called after training on a wordstream.  We ensure that the
-        database is in a consistent state at this point by writing the state
-        key."""
-        self._write_state_key()
+        """This is called after training on a wordstream.  Singleton words
+        (see _wordinfoset) and the state key aren't written as they
+        change, which makes for millions of writes when training on a
+        lot of messages; they are buffered, and written together once
+        enough singletons have built up, or enough time has passed.  A
+        crash loses at most the buffered writes."""
+        self.state_changed = True
+        if len(self.pending_words) >= \
+           options["Storage", "dbm_write_batch_size"] or \
+           time.time() - self.last_flush >= \
+           options["Storage", "dbm_write_interval"]:
+            self._flush()
 
     def _wordinfoget(self, word):
         if isinstance(word, unicode):
@@ -250,7 +284,9 @@ class DBDictClassifier(classifier.Classifier):
         except KeyError:
             ret = None
             if self.changed_words.get(word) is not WORD_DELETED:
-                r = self.db.get(word)
+                r = self.pending_words.get(word)
+                if r is None:
+                    r = self.db.get(word)
                 if r:
                     ret = self.WordInfoClass()
                     ret.__setstate__(r)
@@ -261,7 +297,8 @@ class DBDictClassifier(classifier.Classifier):
         # "Singleton" words (i.e. words that only have a single instance)
         # take up more than 1/2 of the database, but are rarely used
         # so we don't put them into the wordinfo cache, but write them
-        # directly to the database
+        # directly to the database (well, nearly: the writes are batched,
+        # see _post_training)
         # If the word occurs again, then it will be brought back in and
         # never be a singleton again.
         # This seems to reduce the memory footprint of the DBDictClassifier by
@@ -270,7 +307,7 @@ class DBDictClassifier(classifier.Classifier):
         if isinstance(word, unicode):
             word = word.encode("utf-8")
         if record.spamcount + record.hamcount <= 1:
-            self.db[word] = record.__getstate__()
+            self.pending_words[word] = record.__getstate__()
             try:
                 del self.changed_words[word]
             except KeyError:
@@ -286,33 +323,55 @@ class DBDictClassifier(classifier.Classifier):
         else:
             self.wordinfo[word] = record
             self.changed_words[word] = WORD_CHANGED
+            if word in self.pending_words:
+                del self.pending_words[word]
 
     def _wordinfodel(self, word):
         if isinstance(word, unicode):
             word = word.encode("utf-8")
         del self.wordinfo[word]
         self.changed_words[word] = WORD_DELETED
+        if word in self.pending_words:
+            del self.pending_words[word]
 
     def _wordinfokeys(self):
         wordinfokeys = self.db.keys()
-        del wordinfokeys[wordinfokeys.index(self.statekey)]
+        if self.statekey in wordinfokeys:
+            # Not written until the first changes are.
+            wordinfokeys.remove(self.statekey)
+        # (The keys are copied first, as the index of words may be built
+        # in another thread while training changes them.)
+        for word in self.pending_words.keys():
+            if not self.db.has_key(word):
+                wordinfokeys.append(word)
         return wordinfokeys
 
 
 class SQLClassifier(classifier.Classifier):
+    # The parameter marker used by the DB-API module (its paramstyle).
+    # The SQL below is written with "%s" ("format" style), and converted
+    # if this is something else.
+    placeholder = "%s"
+    # The most words to look up or write in a single statement.
+    max_batch = 300
+
     def __init__(self, db_name):
         '''Constructor(database name)'''
 
         classifier.Classifier.__init__(self)
         self.statekey = STATE_KEY
         self.db_name = db_name
+        # The words being trained on, fetched in one go (see _add_msg),
+        # and those changed by training but not yet written.
+        self.records = {}
+        self.changed_words = {} # value may be one of the WORD_ constants
         self.load()
 
     def close(self):
         '''Release all database resources'''
         # As we (presumably) aren't as constrained as we are by file locking,
         # don't force sub-classes to override
-        pass
+        self._flush()
 
     def load(self):
         '''Load state from the database'''
@@ -320,6 +379,7 @@ class SQLClassifier(classifier.Classifier):
 
     def store(self):
         '''Save state to the database'''
+        self._flush()
         self._set_row(self.statekey, self.nspam, self.nham)
 
     def cursor(self):
@@ -334,6 +394,12 @@ class SQLClassifier(classifier.Classifier):
         '''Commit the current transaction - may commit at db or cursor'''
         raise NotImplementedError, "must be implemented in subclass"
 
+    def execute(self, c, statement, args=()):
+        '''Execute statement, which uses %s parameter markers'''
+        if self.placeholder != "%s":
+            statement = statement.replace("%s", self.placeholder)
+        c.execute(statement, args)
+
     def create_bayes(self):
         '''Create a new bayes table'''
         c = self.cursor()
@@ -344,9 +410,9 @@ class SQLClassifier(classifier.Classifier):
         '''Return row matching word'''
         try:
             c = self.cursor()
-            c.execute("select * from bayes"
-                      "  where word=%s",
-                      (word,))
+            self.execute(c, "select * from bayes"
+                            "  where word=%s",
+                         (word,))
         except Exception, e:
             print >> sys.stderr, "error:", (e, word)
             raise
@@ -357,55 +423,177 @@ class SQLClassifier(classifier.Classifier):
         else:
             return {}
 
+    def _get_rows(self, words):
+        '''Return a dict mapping those of words that are in the database
+        to (nspam, nham)'''
+        found = {}
+        c = self.cursor()
+        for i in xrange(0, len(words), self.max_batch):
+            batch = words[i:i+self.max_batch]
+            self.execute(c, "select word, nspam, nham from bayes"
+                            "  where word in (%s)" % \
+                            ",".join(["%s"] * len(batch)),
+                         batch)
+            # Use the plain DB-API fetchall(), as we know the columns.
+            for word, nspam, nham in c.fetchall():
+                if isinstance(word, unicode):
+                    word = word.encode("utf-8")
+                found[str(word)] = (nspam, nham)
+        return found
+
     def _set_row(self, word, nspam, nham):
         c = self.cursor()
         if self._has_key(word):
-            c.execute("update bayes"
-                      "  set nspam=%s,nham=%s"
-                      "  where word=%s",
-                      (nspam, nham, word))
+            self.execute(c, "update bayes"
+                            "  set nspam=%s,nham=%s"
+                            "  where word=%s",
+                         (nspam, nham, word))
         else:
-            c.execute("insert into bayes"
-                      "  (nspam, nham, word)"
-                      "  values (%s, %s, %s)",
-                      (nspam, nham, word))
+            self.execute(c, "insert into bayes"
+                            "  (nspam, nham, word)"
+                            "  values (%s, %s, %s)",
+                         (nspam, nham, word))
         self.commit(c)
 
+    def _set_rows(self, c, rows):
+        '''Insert or update the (word, nspam, nham) rows (at most
+        max_batch of them).  This doesn't commit.'''
+        # Standard SQL has no "insert or update", so delete any old rows
+        # first, and then insert all the rows with one statement.
+        self._delete_rows(c, [row[0] for row in rows])
+        args = []
+        for word, nspam, nham in rows:
+            args.extend((nspam, nham, word))
+        self.execute(c, "insert into bayes"
+                        "  (nspam, nham, word)"
+                        "  values %s" % \
+                        ",".join(["(%s, %s, %s)"] * len(rows)),
+                     args)
+
     def _delete_row(self, word):
         c = self.cursor()
-        c.execute("delete from bayes"
-                  "  where word=%s",
-                  (word,))
+        self.execute(c, "delete from bayes"
+                        "  where word=%s",
+                     (word,))
         self.commit(c)
 
+    def _delete_rows(self, c, words):
+        '''Delete the rows for words (at most max_batch of them).  This
+        doesn't commit.'''
+        self.execute(c, "delete from bayes"
+                        "  where word in (%s)" % \
+                        ",".join(["%s"] * len(words)),
+                     words)
+
     def _has_key(self, key):
         c = self.cursor()
-        c.execute("select word from bayes"
-                  "  where word=%s",
-                  (key,))
+        self.execute(c, "select word from bayes"
+                        "  where word=%s",
+                     (key,))
         return len(self.fetchall(c)) > 0
 
+    def _flush(self):
+        '''Write the words changed by training to the database.'''
+        single = options["Storage", "sql_single_transaction"]
+        if not self.changed_words and not single:
+            return
+        rows = []
+        deleted = []
+        for word, flag in self.changed_words.iteritems():
+            if flag is WORD_CHANGED:
+                record = self.records[word]
+                rows.append((word, record.spamcount, record.hamcount))
+            elif flag is WORD_DELETED:
+                deleted.append(word)
+            else:
+                raise RuntimeError, "Unknown flag value"
+        if single:
+            # Keep the message counts in step with the words.
+            rows.append((self.statekey, self.nspam, self.nham))
+        c = self.cursor()
+        for i in xrange(0, len(deleted), self.max_batch):
+            self._delete_rows(c, deleted[i:i+self.max_batch])
+            if not single:
+                self.commit(c)
+        for i in xrange(0, len(rows), self.max_batch):
+            self._set_rows(c, rows[i:i+self.max_batch])
+            if not single:
+                self.commit(c)
+        if single:
+            self.commit(c)
+        self.changed_words = {}
+
+    def chi2_spamprob(self, wordstream, evidence=False):
+        # Look all the words up at once, rather than with a query each.
+        return self.chi2_spamprob_many([wordstream], evidence)[0]
+
+    if options["Classifier", "use_chi_squared_combining"] and \
+       not options["URLRetriever", "x-slurp_urls"]:
+        spamprob = chi2_spamprob
+
+    def _add_msg(self, wordstream, is_spam):
+        classifier.Classifier._add_msg(self, self._fetch_records(wordstream),
+                                       is_spam)
+
+    def _remove_msg(self, wordstream, is_spam):
+        classifier.Classifier._remove_msg(self,
+                                          self._fetch_records(wordstream),
+                                          is_spam)
+
+    def _fetch_records(self, wordstream):
+        '''Fetch the records of the words in wordstream into self.records
+        with as few queries as possible, and return the words.'''
+        words = {}
+        for word in wordstream:
+            if isinstance(word, unicode):
+                word = word.encode("utf-8")
+            words[word] = 1
+        words = words.keys()
+        self.records.update(self._wordinfoget_many(words))
+        return words
+
+    def _post_training(self):
+        '''Write the changes made by training on a message.'''
+        self._flush()
+        self.records = {}
+
     def _wordinfoget(self, word):
         if isinstance(word, unicode):
             word = word.encode("utf-8")
+        try:
+            return self.records[word]
+        except KeyError:
+            return self._wordinfoget_many([word])[word]
 
-        row = self._get_row(word)
-        if row:
-            item = self.WordInfoClass()
-            item.__setstate__((row["nspam"], row["nham"]))
-            return item
-        else:
-            return self.WordInfoClass()
+    def _wordinfoget_many(self, words):
+        keys = []
+        for word in words:
+            if isinstance(word, unicode):
+                word = word.encode("utf-8")
+            keys.append(word)
+        found = self._get_rows(keys)
+        result = {}
+        for word, key in zip(words, keys):
+            counts = found.get(key)
+            if counts is None:
+                result[word] = None
+            else:
+                item = self.WordInfoClass()
+                item.__setstate__(counts)
+                result[word] = item
+        return result
 
     def _wordinfoset(self, word, record):
         if isinstance(word, unicode):
             word = word.encode("utf-8")
-        self._set_row(word, record.spamcount, record.hamcount)
+        self.records[word] = record
+        self.changed_words[word] = WORD_CHANGED
 
     def _wordinfodel(self, word):
         if isinstance(word, unicode):
             word = word.encode("utf-8")
-        self._delete_row(word)
+        self.records[word] = None
+        self.changed_words[word] = WORD_DELETED
 
     def _wordinfokeys(self):
         c = self.cursor()
@@ -551,17 +739,18 @@ class mySQLClassifier(SQLClassifier):
             self.nspam = 0
             self.nham = 0
 
-    def _wordinfoget(self, word):
-        if isinstance(word, unicode):
-            word = word.encode("utf-8")
-
-        row = self._get_row(word)
-        if row:
-            item = self.WordInfoClass()
-            item.__setstate__((row[1], row[2]))
-            return item
-        else:
-            return None
+    def _set_rows(self, c, rows):
+        # MySQL can insert or update many rows with one statement.
+        args = []
+        for word, nspam, nham in rows:
+            args.extend((nspam, nham, word))
+        self.execute(c, "insert into bayes"
+                        "  (nspam, nham, word)"
+                        "  values %s"
+                        "  on duplicate key update"
+                        "  nspam=values(nspam), nham=values(nham)" % \
+                        ",".join(["(%s, %s, %s)"] * len(rows)),
+                     args)
 
 
 class CDBClassifier(classifier.Classifier):
@@ -608,10 +797,10 @@ class CDBClassifier(classifier.Classifier):
             db.close()
             self.nham, self.nspam = [int(i) for i in \
                                      data[self.statekey].split(',')]
-            self.wordinfo = dict([(self.uunquote(k),
-                                   self._WordInfoFactory(v)) \
-                                  for k, v in data.iteritems() \
-                                      if k != self.statekey])
+            self.wordinfo = self._new_wordinfo()
+            for k, v in data.iteritems():
+                if k != self.statekey:
+                    self.wordinfo[self.uunquote(k)] = self._WordInfoFactory(v)
             if options["globals", "verbose"]:
                 print >> sys.stderr, ('%s is an existing CDB,'
                                       ' with %d ham and %d spam') \
@@ -620,7 +809,7 @@ class CDBClassifier(classifier.Classifier):
         else:
             if options["globals", "verbose"]:
                 print >> sys.stderr, self.db_name, 'is a new CDB'
-            self.wordinfo = {}
+            self.wordinfo = self._new_wordinfo()
             self.nham = 0
             self.nspam = 0
 
@@ -639,6 +828,238 @@ class CDBClassifier(classifier.Classifier):
         pass
 
 
+class MappedCDBClassifier(CDBClassifier):
+    """A classifier that looks words up directly in a memory mapped CDB
+    database.
+
+    CDBClassifier reads the whole database when it is opened; this reads
+    only the state key, and then hashes each word straight into the
+    mapped file when it is needed, so opening takes the same time however
+    large the database is.  That makes it a good choice for filters that
+    start a new process for every message (sb_filter.py run by procmail,
+    for example).  The database format is the same as CDBClassifier's.
+
+    It is meant to be read from: changes are kept in memory, and store()
+    has to write out a complete new database.
+    """
+    def load(self):
+        self.db = self.fp = None
+        if os.path.exists(self.db_name) and os.path.getsize(self.db_name):
+            self.fp = open(self.db_name, "rb")
+            self.db = cdb.Cdb(self.fp)
+            self.nham, self.nspam = [int(i) for i in \
+                                     self.db[self.statekey].split(',')]
+            if options["globals", "verbose"]:
+                print >> sys.stderr, ('%s is an existing CDB,'
+                                      ' with %d ham and %d spam') \
+                                      % (self.db_name, self.nham,
+                                         self.nspam)
+        else:
+            if options["globals", "verbose"]:
+                print >> sys.stderr, self.db_name, 'is a new CDB'
+            self.nham = 0
+            self.nspam = 0
+        # As for DBDictClassifier, wordinfo is a cache of the words that
+        # have been looked up, and changed_words records which of them
+        # need to be written.
+        self.wordinfo = {}
+        self.changed_words = {} # value may be one of the WORD_ constants
+
+    def store(self):
+        items = [(self.statekey, "%d,%d" % (self.nham, self.nspam))]
+        if self.db is not None:
+            for word, counts in self.db.iteritems():
+                if word != self.statekey and word not in self.changed_words:
+                    items.append((word, counts))
+        for word, flag in self.changed_words.iteritems():
+            if flag is WORD_CHANGED:
+                wi = self.wordinfo[word]
+                items.append((word, "%d,%d" % (wi.hamcount, wi.spamcount)))
+        # Write the new database alongside the old one (which is still
+        # being read from), and then replace it.
+        tmp = self.db_name + ".tmp"
+        db = open(tmp, "wb")
+        cdb.cdb_make(db, items)
+        db.close()
+        self.close()
+        try:
+            os.rename(tmp, self.db_name)
+        except OSError:
+            os.remove(self.db_name)
+            os.rename(tmp, self.db_name)
+        self.load()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.fp.close()
+            self.db = self.fp = None
+
+    def _wordinfoget(self, word):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        try:
+            return self.wordinfo[word]
+        except KeyError:
+            ret = None
+            if self.db is not None and \
+               self.changed_words.get(word) is not WORD_DELETED:
+                counts = self.db.get(word)
+                if counts is not None and word != self.statekey:
+                    ret = self._WordInfoFactory(counts)
+                    self.wordinfo[word] = ret
+            return ret
+
+    def _wordinfoset(self, word, record):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        self.wordinfo[word] = record
+        self.changed_words[word] = WORD_CHANGED
+
+    def _wordinfodel(self, word):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        del self.wordinfo[word]
+        self.changed_words[word] = WORD_DELETED
+
+    def _wordinfokeys(self):
+        words = []
+        if self.db is not None:
+            words = [word for word in self.db.iterkeys()
+                     if word != self.statekey and
+                        word not in self.changed_words]
+        words.extend([word for word, flag in self.changed_words.items()
+                      if flag is WORD_CHANGED])
+        return words
+
+
+class SnapshotClassifier(classifier.Classifier):
+    """A classifier that uses a binary snapshot file (see snapshot.py).
+
+    Opening a snapshot just maps the file into memory, and words are
+    looked up in the mapped file as they are needed, so this is quick to
+    start however large the database is; that suits sb_filter.py, which
+    opens the database for every message it filters.  Changes are kept
+    in memory until store() writes a complete new snapshot.
+    """
+    def __init__(self, db_name):
+        classifier.Classifier.__init__(self)
+        self.db_name = db_name
+        self.snapshot = None
+        self.load()
+
+    def load(self):
+        if options["globals", "verbose"]:
+            print >> sys.stderr, 'Loading state from', self.db_name, \
+                  'snapshot'
+        self.close()
+        if os.path.exists(self.db_name):
+            self.snapshot = snapshot.Snapshot(self.db_name)
+            self.nspam = self.snapshot.nspam
+            self.nham = self.snapshot.nham
+            if options["globals", "verbose"]:
+                print >> sys.stderr, ('%s is an existing snapshot,'
+                                      ' with %d ham and %d spam') \
+                      % (self.db_name, self.nham, self.nspam)
+        else:
+            if options["globals", "verbose"]:
+                print >> sys.stderr, self.db_name, 'is a new snapshot'
+            self.nspam = 0
+            self.nham = 0
+        # As for DBDictClassifier, wordinfo is a cache of the words that
+        # have been looked up, and changed_words records which of them
+        # need to be written.
+        self.wordinfo = {}
+        self.changed_words = {} # value may be one of the WORD_ constants
+
+    def store(self):
+        if options["globals", "verbose"]:
+            print >> sys.stderr, 'Persisting', self.db_name, 'as a snapshot'
+        if self.snapshot is None:
+            words = []
+            spam = []
+            ham = []
+        else:
+            words = self.snapshot.words()
+            spam, ham = self.snapshot.counts()
+        added = []
+        deleted = {}
+        for word, flag in self.changed_words.iteritems():
+            i = bisect_left(words, word)
+            present = i < len(words) and words[i] == word
+            if flag is WORD_CHANGED:
+                record = self.wordinfo[word]
+                if present:
+                    spam[i] = record.spamcount
+                    ham[i] = record.hamcount
+                else:
+                    added.append((word, record.spamcount, record.hamcount))
+            elif flag is WORD_DELETED:
+                if present:
+                    deleted[i] = True
+            else:
+                raise RuntimeError, "Unknown flag value"
+        if added or deleted:
+            rows = [row for i, row in enumerate(zip(words, spam, ham))
+                    if i not in deleted]
+            rows.extend(added)
+            rows.sort()
+            words = [row[0] for row in rows]
+            spam = [row[1] for row in rows]
+            ham = [row[2] for row in rows]
+        # Unmap the old snapshot before it is replaced (which Windows
+        # insists on).
+        self.close()
+        snapshot.write(self.db_name, self.nspam, self.nham, words, spam, ham)
+        self.snapshot = snapshot.Snapshot(self.db_name)
+        self.changed_words = {}
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def _wordinfoget(self, word):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        try:
+            return self.wordinfo[word]
+        except KeyError:
+            ret = None
+            if self.snapshot is not None and \
+               self.changed_words.get(word) is not WORD_DELETED:
+                counts = self.snapshot.get(word)
+                if counts is not None:
+                    ret = self.WordInfoClass()
+                    ret.__setstate__(counts)
+                    self.wordinfo[word] = ret
+            return ret
+
+    def _wordinfoset(self, word, record):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        self.wordinfo[word] = record
+        self.changed_words[word] = WORD_CHANGED
+
+    def _wordinfodel(self, word):
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        del self.wordinfo[word]
+        self.changed_words[word] = WORD_DELETED
+
+    def _wordinfokeys(self):
+        if self.snapshot is None:
+            words = []
+        else:
+            words = self.snapshot.words()
+        if self.changed_words:
+            words = [word for word in words if word not in self.changed_words]
+            words.extend([word for word, flag in
+                          self.changed_words.items()
+                          if flag is WORD_CHANGED])
+        return words
+
+
 # If ZODB isn't available, then this class won't be useable, but we
 # still need to be able to import this module.  So we pretend that all
 # is ok.
@@ -979,6 +1400,8 @@ _storage_types = {"dbm" : (DBDictClassifier, True, True),
                   "pgsql" : (PGClassifier, False, False),
                   "mysql" : (mySQLClassifier, False, False),
                   "cdb" : (CDBClassifier, False, True),
+                  "mmapcdb" : (MappedCDBClassifier, False, True),
+                  "snapshot" : (SnapshotClassifier, False, True),
                   "zodb" : (ZODBClassifier, True, True),
                   "zeo" : (ZEOClassifier, False, False),
                   }
@@ -41,7 +41,7 @@ class CorpusTest(unittest.TestCase):
     def test___init__(self):
         self.assertEqual(self.corpus.cacheSize, self.cacheSize)
         self.assertEqual(self.corpus.msgs, {})
-        self.assertEqual(self.corpus.keysInMemory, [])
+        self.assertEqual(self.corpus.keysInMemory.keys(), [])
         self.assertEqual(self.corpus.observers, [])
         self.assertEqual(self.corpus.factory, self.factory)
 
@@ -84,6 +84,38 @@ class CorpusTest(unittest.TestCase):
         self.assert_(1 in self.corpus.keysInMemory)
         self.assert_(0 not in self.corpus.keysInMemory)
 
+    def test_flush_least_recently_used(self):
+        self.corpus.cacheSize = 2
+        for key in range(2):
+            self.corpus.addMessage(simple_msg(key))
+        # Using message 0 means that message 1 is flushed first.
+        self.corpus[0]
+        self.corpus.addMessage(simple_msg(2))
+        self.assertEqual(self.corpus.keysInMemory.keys(), [0, 2])
+        self.assertEqual(self.corpus.msgs[1], None)
+        self.assertEqual(self.corpus.keysInMemory.hits, 1)
+        self.assertEqual(self.corpus.keysInMemory.evictions, 1)
+
+    def test_flush_by_size(self):
+        class SizedCorpus(Corpus):
+            def messageSize(self, message):
+                return 10
+        self.corpus = SizedCorpus(self.factory, self.cacheSize, 25)
+        for key in range(3):
+            self.corpus.addMessage(simple_msg(key))
+        self.assertEqual(self.corpus.keysInMemory.keys(), [1, 2])
+        self.assertEqual(self.corpus.keysInMemory.nbytes, 20)
+        self.assertEqual(self.corpus.msgs[0], None)
+
+    def test_no_size_limit(self):
+        # Without a limit on the total size, messages aren't measured.
+        class SizedCorpus(Corpus):
+            def messageSize(self, message):
+                raise AssertionError("messageSize called")
+        self.corpus = SizedCorpus(self.factory, self.cacheSize)
+        self.corpus.addMessage(simple_msg(0))
+        self.assertEqual(self.corpus.keysInMemory.nbytes, 0)
+
     def test_unCacheMessage(self):
         msg = simple_msg(0)
         self.corpus.cacheMessage(msg)
@@ -197,6 +229,55 @@ class ExpiryCorpusTest(unittest.TestCase):
         # Check that not expired messages are still there.
         for msg in not_expire:
             self.assertEqual(msg in self.corpus, True)
+
+    def test_removeExpiredMessages_indexed(self):
+        looked_at = []
+        def messageTimestamp(key):
+            looked_at.append(key)
+            return self.corpus[key].createTimestamp()
+        self.corpus.messageTimestamp = messageTimestamp
+        old = simple_msg(1)
+        old.creation_time -= 20
+        self.corpus.addMessage(old)
+        self.corpus.addMessage(simple_msg(2))
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(old in self.corpus, False)
+        # Building the index looks at every message, and the expired
+        # message is checked again before it is removed.
+        self.assertEqual(sorted(looked_at), [1, 1, 2])
+        self.assertEqual(self.corpus.expiryHeap,
+                         [(self.corpus[2].createTimestamp(), 2)])
+
+        # Later checks only look at new messages.
+        del looked_at[:]
+        self.corpus.addMessage(simple_msg(3))
+        self.corpus.expiry_due = 0
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(looked_at, [3])
+
+        # Removed messages are dropped from the index when they come to
+        # the top.
+        self.corpus.removeMessage(self.corpus[2])
+        self.corpus.expireBefore = -1
+        self.corpus.expiry_due = 0
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(self.corpus.keys(), [])
+        self.assertEqual(self.corpus.expiryHeap, [])
+        self.assertEqual(self.corpus.expiryKeys, {})
+
+    def test_removeExpiredMessages_busy(self):
+        # Only one thread at a time checks a corpus; the others return.
+        old = simple_msg(1)
+        old.creation_time -= 20
+        self.corpus.addMessage(old)
+        self.corpus.expiryLock.acquire()
+        try:
+            self.corpus.removeExpiredMessages()
+        finally:
+            self.corpus.expiryLock.release()
+        self.assertEqual(old in self.corpus, True)
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(old in self.corpus, False)
         
 
 def suite():
@@ -5,6 +5,7 @@ import sys
 import time
 import gzip
 import errno
+import shutil
 import unittest
 
 import sb_test_support
@@ -14,6 +15,8 @@ from spambayes import storage
 from spambayes.FileCorpus import ExpiryFileCorpus
 from spambayes.FileCorpus import FileCorpus, FileMessage, GzipFileMessage
 from spambayes.FileCorpus import FileMessageFactory, GzipFileMessageFactory
+from spambayes.FileCorpus import Manifest, MANIFEST_NAME, shard_name
+from spambayes.Options import options
 
 # We borrow the test messages that test_sb_server uses.
 from test_sb_server import good1, spam1, malformed1
@@ -77,7 +80,10 @@ class _FileCorpusBaseTest(unittest.TestCase):
         else:
             for filename in flist:
                 fn = os.path.join(dirname, filename)
-                os.unlink(fn)
+                if os.path.isdir(fn):
+                    shutil.rmtree(fn)
+                else:
+                    os.unlink(fn)
         try:
             os.rmdir(dirname)
         except OSError, e:
@@ -310,6 +316,131 @@ class ExpiryFileCorpusTest(FileCorpusTest):
         self.corpus = ExpiryFileCorpus(1.0, self.factory, self.directory,
                                        '?', self.cache_size)
 
+    def test_messageTimestamp(self):
+        self.assertEqual(self.corpus.messageTimestamp(self.msg.key()),
+                         self.msg.createTimestamp())
+        self.assertEqual(self.corpus.msgs[self.msg.key()], None)
+
+    def test_removeExpiredMessages(self):
+        self.corpus.expireBefore = 10
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(len(self.corpus.keys()), 3)
+        self.corpus.expireBefore = -10
+        self.corpus.expiry_due = 0
+        self.corpus.removeExpiredMessages()
+        self.assertEqual(self.corpus.keys(), [])
+        self.assertEqual(os.listdir(self.directory), ["10"])
+
+
+class ShardedFileCorpusTest(FileCorpusTest):
+    def setUp(self):
+        _FileCorpusBaseTest.setUp(self)
+        self.directory = 'fctesthamcorpus'
+        self.cache_size = 100
+        self.factory = FileMessageFactory()
+        self.stuff_corpus()
+        self.corpus = FileCorpus(self.factory, self.directory,
+                                 '?', self.cache_size, sharded=True)
+        self.msg = self.corpus[self.msg.key()]
+
+    def test_migrated(self):
+        names = os.listdir(self.directory)
+        names.sort()
+        expected = ["10", MANIFEST_NAME] + [shard_name(key) for key in "012"]
+        expected.sort()
+        # The message that doesn't match the filter is left alone.
+        self.assertEqual(names, expected)
+        for key in "012":
+            fn = os.path.join(self.directory, shard_name(key), key)
+            self.assertEqual(os.path.exists(fn), True)
+        self.assertEqual(self.corpus.manifest.entries["0"][0],
+                         os.path.getsize(self.corpus["0"].pathname()))
+
+    def test_reopen(self):
+        self.corpus = FileCorpus(self.factory, self.directory,
+                                 '?', self.cache_size, sharded=True)
+        keys = self.corpus.keys()
+        keys.sort()
+        self.assertEqual(keys, ["0", "1", "2"])
+        self.assertEqual(self.corpus["1"].as_string(),
+                         spam1.replace("\n", "\r\n"))
+
+    def test_rebuild_manifest(self):
+        entries = self.corpus.manifest.entries
+        os.remove(os.path.join(self.directory, MANIFEST_NAME))
+        self.corpus = FileCorpus(self.factory, self.directory,
+                                 '?', self.cache_size, sharded=True)
+        self.assertEqual(self.corpus.manifest.entries, entries)
+
+    def test_unshard(self):
+        self.corpus = FileCorpus(self.factory, self.directory,
+                                 '?', self.cache_size)
+        names = os.listdir(self.directory)
+        names.sort()
+        self.assertEqual(names, ["0", "1", "10", "2"])
+        self.assertEqual(len(self.corpus.keys()), 3)
+
+    def test_addMessage(self):
+        msg = self.factory.create("9", 'fctestspamcorpus', good1)
+        msg[options["Headers", "classification_header_name"]] = "spam"
+        self.corpus.addMessage(msg)
+        self.assertEqual(msg.directory,
+                         os.path.join(self.directory, shard_name("9")))
+        self.assertEqual(self.corpus.manifest.entries["9"][2], "spam")
+        self.corpus = FileCorpus(self.factory, self.directory,
+                                 '?', self.cache_size, sharded=True)
+        self.assertEqual(self.corpus.manifest.entries["9"][2], "spam")
+        self.corpus["9"].load()
+        self.assertEqual(self.corpus["9"]["Subject"], msg["Subject"])
+
+    def test_removeMessage(self):
+        FileCorpusTest.test_removeMessage(self)
+        self.assertEqual(self.msg.key() in self.corpus.manifest.entries,
+                         False)
+        manifest = Manifest(self.corpus.manifest.filename)
+        self.assertEqual(manifest.entries, self.corpus.manifest.entries)
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = "fctestmanifest"
+
+    def tearDown(self):
+        for fn in self.filename, self.filename + ".tmp":
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def test_add_and_remove(self):
+        manifest = Manifest(self.filename)
+        manifest.add("a", 10, 1.5, "spam")
+        manifest.add("b", 20, 2.5, None)
+        manifest.add("c", 30, 3.5, "ham\tor\nspam")
+        manifest.remove("b")
+        manifest.remove("x")
+        self.assertEqual(Manifest(self.filename).entries,
+                         {"a" : (10, 1.5, "spam"),
+                          "c" : (30, 3.5, "ham or spam")})
+
+    def test_compact(self):
+        manifest = Manifest(self.filename)
+        for i in range(5):
+            manifest.add(str(i), i, i, "")
+        for i in range(4):
+            manifest.remove(str(i))
+        self.assertEqual(len(open(self.filename).readlines()), 9)
+        manifest = Manifest(self.filename)
+        self.assertEqual(manifest.entries, {"4" : (4, 4.0, "")})
+        self.assertEqual(len(open(self.filename).readlines()), 1)
+
+    def test_partial_line(self):
+        manifest = Manifest(self.filename)
+        manifest.add("a", 10, 1.5, "spam")
+        f = open(self.filename, "ab")
+        f.write("+\tb\t20")
+        f.close()
+        self.assertEqual(Manifest(self.filename).entries,
+                         {"a" : (10, 1.5, "spam")})
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -319,6 +450,8 @@ def suite():
              GzipFileMessageTest,
              FileCorpusTest,
              ExpiryFileCorpusTest,
+             ShardedFileCorpusTest,
+             ManifestTest,
              )
     for cls in clses:
         suite.addTest(unittest.makeSuite(cls))
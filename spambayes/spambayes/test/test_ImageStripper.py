@@ -0,0 +1,156 @@
+# Test the ImageStripper module, with a fake OCR engine.
+
+import sys
+import time
+import email
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from spambayes import ImageStripper
+from spambayes.Options import options
+
+# The "OCR engine": the text in an image is the image, upper-cased, after
+# waiting for as many seconds as its first line says.
+ENGINE_SCRIPT = "import sys, time; " \
+                "data = sys.stdin.read(); " \
+                "time.sleep(float(data.split()[0])); " \
+                "sys.stdout.write(data.upper()); " \
+                "sys.exit(data.startswith('0 fail'))"
+
+class FakeEngine(ImageStripper.OCRExecutableEngine):
+    engine_name = "fake"
+    def __init__(self):
+        ImageStripper.OCRExecutableEngine.__init__(self)
+        self.runs = 0
+
+    def get_program(self):
+        return sys.executable
+    program = property(get_program)
+
+    def get_command_line(self, pnmfile):
+        self.runs += 1
+        return '"%s" -c "%s"' % (self.program, ENGINE_SCRIPT)
+
+class ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.stripper = ImageStripper.ImageStripper()
+        self.stripper.engine = FakeEngine()
+        self.timeout = options["Tokenizer", "ocr_timeout"]
+        self.threads = options["Tokenizer", "ocr_threads"]
+        self.stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+
+    def tearDown(self):
+        options["Tokenizer", "ocr_timeout"] = self.timeout
+        options["Tokenizer", "ocr_threads"] = self.threads
+        sys.stderr = self.stderr
+
+    def test_concurrent(self):
+        images = ["0.5 one\n", "0.5 two\nlines\n", "0.5 three\n"]
+        start = time.time()
+        text, tokens, complete = self.stripper.extract_ocr_info(images)
+        # One after another these take at least 1.5 seconds.
+        self.assert_(time.time() - start < 1.3)
+        self.assert_(complete)
+        self.assertEqual(text, "\n".join(images))
+        self.assertEqual(tokens, set(["image-text-lines:0",
+                                      "image-text-lines:1"]))
+        self.assertEqual(self.stripper.misses, 3)
+
+    def test_cache(self):
+        images = ["0 one\n", "0 two\n"]
+        result = self.stripper.extract_ocr_info(images)
+        self.assertEqual(self.stripper.engine.runs, 2)
+        self.assertEqual(self.stripper.extract_ocr_info(images), result)
+        self.assertEqual(self.stripper.engine.runs, 2)
+        self.assertEqual(self.stripper.hits, 2)
+
+    def test_threads(self):
+        options["Tokenizer", "ocr_threads"] = 1
+        start = time.time()
+        self.stripper.extract_ocr_info(["0.3 one\n", "0.3 two\n"])
+        self.assert_(time.time() - start >= 0.6)
+        self.assertEqual(len(self.stripper.workers), 1)
+
+    def test_timeout(self):
+        options["Tokenizer", "ocr_timeout"] = 0.5
+        images = ["0 fast\n", "5 slow\n"]
+        start = time.time()
+        text, tokens, complete = self.stripper.extract_ocr_info(images)
+        self.assert_(time.time() - start < 1)
+        self.assert_(not complete)
+        self.assertEqual(text, "0 fast\n\n")
+        self.assert_(sys.stderr.getvalue().find("timed out") >= 0)
+        # The slow image is tried again next time.
+        self.assertEqual(len(self.stripper.cache), 1)
+
+    def test_timeout_killed(self):
+        # Once the slow job is killed, its worker records an error; the
+        # job must still count as timed out.
+        options["Tokenizer", "ocr_timeout"] = 0.5
+        fast, slow = self.stripper.run_ocr(["0 fast\n", "5 slow\n"])
+        self.assert_(not fast.timed_out)
+        self.assert_(slow.timed_out)
+        for i in range(50):
+            if slow.error is not None:
+                break
+            time.sleep(0.1)
+        self.assert_(slow.error is not None)
+        self.assert_(slow.timed_out)
+
+    def test_error(self):
+        text, tokens, complete = \
+              self.stripper.extract_ocr_info(["0 fail\n"])
+        self.assert_(complete)
+        self.assertEqual(text, "")
+        self.assertEqual(tokens, set(["image-text:no text found"]))
+        self.assert_(sys.stderr.getvalue().find("exit code") >= 0)
+
+class PartsKeyTest(unittest.TestCase):
+    def parts(self, *payloads):
+        msg = email.message_from_string(
+            "Content-Type: multipart/mixed; boundary=b\n\n" +
+            "".join(["--b\nContent-Type: image/gif\n"
+                     "Content-Transfer-Encoding: base64\n\n%s\n" %
+                     (payload.encode("base64"),) for payload in payloads]) +
+            "--b--\n")
+        return msg.get_payload()
+
+    def test_key(self):
+        key = ImageStripper.parts_key("ocrad", self.parts("GIF89a1"))
+        self.assertEqual(ImageStripper.parts_key("ocrad",
+                                                 self.parts("GIF89a1")),
+                         key)
+        self.assertNotEqual(ImageStripper.parts_key("ocrad",
+                                                    self.parts("GIF89a2")),
+                            key)
+        self.assertNotEqual(ImageStripper.parts_key("gocr",
+                                                    self.parts("GIF89a1")),
+                            key)
+        self.assertNotEqual(ImageStripper.parts_key(
+            "ocrad", self.parts("GIF89a1", "GIF89a1")), key)
+
+    def test_large(self):
+        parts = self.parts("GIF89a1")
+        key = ImageStripper.parts_key("ocrad", parts)
+        setattr(parts[0], ImageStripper.image_large_size_attribute, 200000)
+        self.assertNotEqual(ImageStripper.parts_key("ocrad", parts), key)
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (ExtractTest,
+             PartsKeyTest,
+             )
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
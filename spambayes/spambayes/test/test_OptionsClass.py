@@ -0,0 +1,96 @@
+# Test the OptionsClass module.
+
+import os
+import sys
+import tempfile
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.OptionsClass import OptionsClass, INTEGER, BOOLEAN, RESTORE
+
+defaults = {
+    "Tokenizer" : (
+        ("x-short_runs", "Short runs", False, "Doc.", BOOLEAN, RESTORE),
+        ("skip_max_word_size", "Long words", 12, "Doc.", INTEGER, RESTORE),
+    ),
+    "CV Driver" : (
+        ("runs", "Runs", 10, "Doc.", INTEGER, RESTORE),
+    ),
+}
+
+class CompiledOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.options = OptionsClass()
+        self.options.load_defaults(defaults)
+
+    def test_values(self):
+        compiled = self.options.compiled
+        self.assertEqual(compiled.Tokenizer.x_short_runs, False)
+        self.assertEqual(compiled.Tokenizer.skip_max_word_size, 12)
+        self.assertEqual(compiled.CV_Driver.runs, 10)
+        # Until something changes, the same snapshot is used.
+        self.assert_(self.options.compiled is compiled)
+
+    def test_read_only(self):
+        compiled = self.options.compiled.Tokenizer
+        self.assertRaises(AttributeError, setattr, compiled,
+                          "skip_max_word_size", 20)
+        self.assertRaises(AttributeError, setattr, compiled, "other", 20)
+        self.assertRaises(AttributeError, delattr, compiled, "x_short_runs")
+
+    def test_set(self):
+        compiled = self.options.compiled
+        self.options["Tokenizer", "skip_max_word_size"] = 20
+        self.assertEqual(self.options.compiled.Tokenizer.skip_max_word_size,
+                         20)
+        # The old snapshot is unchanged.
+        self.assertEqual(compiled.Tokenizer.skip_max_word_size, 12)
+
+    def test_invalid_set(self):
+        compiled = self.options.compiled
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, "w")
+        try:
+            self.options["Tokenizer", "skip_max_word_size"] = "twenty"
+        finally:
+            sys.stderr = stderr
+        self.assert_(self.options.compiled is compiled)
+
+    def test_merge_file(self):
+        self.options.compiled
+        name = tempfile.mktemp("test_OptionsClass")
+        f = open(name, "w")
+        f.write("[Tokenizer]\nshort_runs: True\n")
+        f.close()
+        try:
+            self.options.merge_file(name)
+        finally:
+            os.remove(name)
+        self.assertEqual(self.options.compiled.Tokenizer.x_short_runs, True)
+
+    def test_restore_point(self):
+        self.options.set_restore_point()
+        self.options["Tokenizer", "skip_max_word_size"] = 20
+        self.options.compiled
+        self.options.revert_to_restore_point()
+        self.assertEqual(self.options.compiled.Tokenizer.skip_max_word_size,
+                         12)
+
+    def test_invalidate(self):
+        self.options.compiled
+        self.options.get_option("Tokenizer", "skip_max_word_size").set(20)
+        self.options.invalidate_compiled()
+        self.assertEqual(self.options.compiled.Tokenizer.skip_max_word_size,
+                         20)
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (CompiledOptionsTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -29,6 +29,7 @@ def test_basic_import():
     from spambayes import hammie
     from spambayes import hammiebulk
     from spambayes import i18n
+    from spambayes import lrucache
     from spambayes import mboxutils
     from spambayes import message
     from spambayes import msgs
@@ -36,7 +37,11 @@ def test_basic_import():
     from spambayes import optimize
     from spambayes import port
     from spambayes import postfixproxy
+    from spambayes import reviewindex
     from spambayes import safepickle
     from spambayes import smtpproxy
+    from spambayes import snapshot
     from spambayes import storage
+    from spambayes import tokencache
     from spambayes import tokenizer
+    from spambayes import tokenpool
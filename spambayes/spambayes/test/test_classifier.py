@@ -0,0 +1,459 @@
+# Test the scoring machinery of the classifier module.
+
+import os
+import re
+import sys
+import random
+import threading
+import pickle
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.Options import options
+from spambayes import classifier, chi2
+from spambayes.classifier import Classifier, WordInfo, WordInfoTable
+from spambayes.classifier import WordIndex
+from spambayes.tokenizer import tokenize
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1, malformed1
+
+class _ClassifierTestBase(unittest.TestCase):
+    def setUp(self):
+        self.classifier = Classifier()
+        self.classifier.learn(tokenize(good1), False)
+        self.classifier.learn(tokenize(spam1), True)
+        self.classifier.learn(["bulk", "list", "shared"], True)
+        self.classifier.learn(["list", "shared", "friendly"], False)
+        self.msgs = [list(tokenize(good1)),
+                     list(tokenize(spam1)),
+                     list(tokenize(malformed1)),
+                     ["bulk", "list", "shared", "never", "seen"],
+                     ["list", "shared", "friendly", "list"],
+                     [],
+                     ]
+
+class SpamprobManyTest(_ClassifierTestBase):
+    def _check_same_as_loop(self):
+        c = self.classifier
+        expected = [c.chi2_spamprob(msg) for msg in self.msgs]
+        self.assertEqual(c.chi2_spamprob_many(self.msgs), expected)
+        expected = [c.chi2_spamprob(msg, True) for msg in self.msgs]
+        self.assertEqual(c.chi2_spamprob_many(self.msgs, True), expected)
+
+    def test_unigrams(self):
+        self._check_same_as_loop()
+
+    def test_bigrams(self):
+        use_bigrams = options["Classifier", "use_bigrams"]
+        options["Classifier", "use_bigrams"] = True
+        try:
+            self.classifier.learn(["bulk", "", "list"], True)
+            self.msgs.append(["bulk", "", "list", "shared"])
+            self._check_same_as_loop()
+        finally:
+            options["Classifier", "use_bigrams"] = use_bigrams
+
+    def test_generators(self):
+        c = self.classifier
+        expected = [c.chi2_spamprob(msg) for msg in self.msgs]
+        self.assertEqual(c.chi2_spamprob_many([iter(msg)
+                                               for msg in self.msgs]),
+                         expected)
+
+    def test_lookups_shared(self):
+        c = self.classifier
+        looked_up = []
+        wordinfoget = c._wordinfoget
+        def counting_wordinfoget(word):
+            looked_up.append(word)
+            return wordinfoget(word)
+        c._wordinfoget = counting_wordinfoget
+        c.chi2_spamprob_many(self.msgs)
+        distinct = {}
+        for msg in self.msgs:
+            for word in msg:
+                distinct[word] = 1
+        self.assertEqual(len(looked_up), len(distinct))
+
+    def test_empty_batch(self):
+        self.assertEqual(self.classifier.chi2_spamprob_many([]), [])
+
+class ProbabilityCacheTest(_ClassifierTestBase):
+    def test_training_empties(self):
+        c = self.classifier
+        c.spamprob(self.msgs[3])
+        self.assert_(len(c.probcache) > 0)
+        c.learn(["bulk"], True)
+        misses = c.probcache_misses
+        c.spamprob(["bulk"])
+        self.assertEqual(c.probcache_misses, misses + 1)
+        self.assertEqual(c.probcache.keys(),
+                         [c._wordinfoget("bulk").spamcount])
+
+    def test_bounded(self):
+        c = self.classifier
+        size = options["Classifier", "probability_cache_size"]
+        options["Classifier", "probability_cache_size"] = 2
+        try:
+            for msg in self.msgs:
+                c.spamprob(msg)
+                self.assert_(c._probcache_size <= 2)
+        finally:
+            options["Classifier", "probability_cache_size"] = size
+
+    def test_matches_fresh_classifier(self):
+        c = self.classifier
+        for msg in self.msgs:
+            c.spamprob(msg)
+        c.learn(["bulk", "shared"], True)
+        c.unlearn(["list", "shared", "friendly"], False)
+        fresh = Classifier()
+        fresh.__setstate__(c.__getstate__())
+        for msg in self.msgs:
+            self.assertEqual(c.spamprob(msg, True), fresh.spamprob(msg, True))
+
+    def test_option_change(self):
+        c = self.classifier
+        record = c._wordinfoget("bulk")
+        before = c.probability(record)
+        strength = options["Classifier", "unknown_word_strength"]
+        options["Classifier", "unknown_word_strength"] = strength * 2
+        try:
+            self.assertNotEqual(c.probability(record), before)
+        finally:
+            options["Classifier", "unknown_word_strength"] = strength
+        self.assertEqual(c.probability(record), before)
+
+    def test_hits(self):
+        c = self.classifier
+        c._new_probcache()
+        c.probcache_hits = c.probcache_misses = 0
+        c.spamprob(["bulk", "list"])
+        self.assertEqual(c.probcache_misses, 2)
+        c.spamprob(["bulk", "list"])
+        self.assertEqual(c.probcache_hits, 2)
+        self.assertEqual(c.probcache_misses, 2)
+
+class GetcluesTest(unittest.TestCase):
+    # _getclues keeps only the strongest candidates in a bounded heap;
+    # check that it picks exactly what sorting every candidate would.
+    def setUp(self):
+        rand = random.Random(7)
+        self.classifier = c = Classifier()
+        c.nham = c.nspam = 100
+        for i in range(60):
+            c._wordinfoset("w%d" % i, c.WordInfoClass())
+            c._wordinfoget("w%d" % i).__setstate__((rand.randint(0, 20),
+                                                    rand.randint(0, 20)))
+        for i in range(0, 60, 2):
+            c._wordinfoset("bi:w%d w%d" % (i, i+1), c.WordInfoClass())
+            c._wordinfoget("bi:w%d w%d" % (i, i+1)).spamcount = 5
+        self.msgs = [["w%d" % rand.randrange(70) for _j in range(200)]
+                     for _i in range(20)]
+        self.maxdisc = options["Classifier", "max_discriminators"]
+        self.use_bigrams = options["Classifier", "use_bigrams"]
+        options["Classifier", "max_discriminators"] = 7
+
+    def tearDown(self):
+        options["Classifier", "max_discriminators"] = self.maxdisc
+        options["Classifier", "use_bigrams"] = self.use_bigrams
+
+    def _candidates(self, msg):
+        c = self.classifier
+        mindist = options["Classifier", "minimum_prob_strength"]
+        raw = []
+        seen = {}
+        for i, token in enumerate(msg):
+            clues = [(token, (i,))]
+            if i and options["Classifier", "use_bigrams"]:
+                clues.append(("bi:%s %s" % (msg[i-1], token), (i-1, i)))
+            for clue, indices in clues:
+                if clue not in seen:
+                    seen[clue] = 1
+                    tup = c._worddistanceget(clue)
+                    if tup[0] >= mindist:
+                        raw.append((tup, indices))
+        raw.sort()
+        raw.reverse()
+        return raw
+
+    def test_unigrams(self):
+        options["Classifier", "use_bigrams"] = False
+        for msg in self.msgs:
+            expected = [tup[1:] for tup, _i in self._candidates(msg)[:7]]
+            expected.reverse()
+            self.assertEqual(self.classifier._getclues(msg), expected)
+
+    def test_bigrams(self):
+        options["Classifier", "use_bigrams"] = True
+        for msg in self.msgs:
+            expected = []
+            used = {}
+            for tup, indices in self._candidates(msg):
+                if not [i for i in indices if i in used]:
+                    for i in indices:
+                        used[i] = 1
+                    expected.append(tup[1:])
+            expected = expected[:7]
+            expected.reverse()
+            self.assertEqual(self.classifier._getclues(msg), expected)
+
+class LazyNumpyTest(unittest.TestCase):
+    def test_not_imported(self):
+        # Importing the classifier (as every filtering process does)
+        # mustn't import NumPy.
+        parent = os.path.dirname(os.path.dirname(classifier.__file__))
+        code = "import sys; sys.path.insert(0, %r); " \
+               "import spambayes.classifier; " \
+               "sys.exit('numpy' in sys.modules)" % (parent,)
+        self.assertEqual(os.spawnv(os.P_WAIT, sys.executable,
+                                   [sys.executable, "-c", code]), 0)
+
+class NumpyCombiningTest(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(42)
+        self.clue_lists = [[], [(0.5, "x", None)]]
+        for n in range(1, 151) * 2:
+            clues = [(rand.random(), "w%d" % i, None) for i in range(n)]
+            clues.sort()
+            self.clue_lists.append(clues)
+        # Extreme probabilities, to exercise the underflow handling.
+        self.clue_lists.append([(1e-5, "h", None)] * 150)
+        self.clue_lists.append([(1.0 - 1e-5, "s", None)] * 150)
+
+    def test_matches_scalar(self):
+        c = Classifier()
+        expected = [c._chi2_combine(clues, True)
+                    for clues in self.clue_lists]
+        got = c._chi2_combine_many(self.clue_lists, True)
+        self.assertEqual(len(got), len(expected))
+        for (prob, evidence), (eprob, eevidence) in zip(got, expected):
+            self.assert_(abs(prob - eprob) < 1e-12)
+            self.assertEqual([w for w, _p in evidence],
+                             [w for w, _p in eevidence])
+            for (_w, p), (_ew, ep) in zip(evidence, eevidence):
+                self.assert_(abs(p - ep) < 1e-12)
+
+    def test_small_batch_uses_scalar(self):
+        c = Classifier()
+        clue_lists = self.clue_lists[:classifier.NUMPY_MINIMUM_BATCH-1]
+        self.assertEqual(c._chi2_combine_many(clue_lists),
+                         [c._chi2_combine(clues) for clues in clue_lists])
+
+class WordInfoTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = WordInfoTable()
+        for i in range(10):
+            self.table["w%d" % i] = self._record(i, 10 - i)
+
+    def _record(self, spamcount, hamcount):
+        record = WordInfo()
+        record.__setstate__((spamcount, hamcount))
+        return record
+
+    def _counts(self, table):
+        return dict([(word, record.__getstate__())
+                     for word, record in table.iteritems()])
+
+    def test_mapping(self):
+        t = self.table
+        self.assertEqual(len(t), 10)
+        self.assert_("w3" in t)
+        self.assert_(not t.has_key("w10"))
+        self.assertEqual(t["w3"].__getstate__(), (3, 7))
+        self.assertEqual(t.get("w10"), None)
+        self.assertRaises(KeyError, t.__getitem__, "w10")
+        keys = t.keys()
+        keys.sort()
+        self.assertEqual(keys, sorted(["w%d" % i for i in range(10)]))
+        self.assertEqual(sorted(iter(t)), keys)
+
+    def test_records_are_copies(self):
+        record = self.table["w1"]
+        record.spamcount += 5
+        self.assertEqual(self.table["w1"].spamcount, 1)
+        self.table["w1"] = record
+        self.assertEqual(self.table["w1"].spamcount, 6)
+
+    def test_delete_reuses_slots(self):
+        t = self.table
+        del t["w2"]
+        del t["w5"]
+        self.assertEqual(len(t), 8)
+        self.assert_("w5" not in t)
+        self.assertRaises(KeyError, t.__delitem__, "w5")
+        t["new"] = self._record(1, 2)
+        t["newer"] = self._record(3, 4)
+        self.assertEqual(len(t._spam), 10)
+        self.assertEqual(t["new"].__getstate__(), (1, 2))
+        self.assertEqual(t["newer"].__getstate__(), (3, 4))
+
+    def test_pickle(self):
+        t = self.table
+        del t["w4"]
+        for proto in 0, 1, 2:
+            loaded = pickle.loads(pickle.dumps(t, proto))
+            self.assertEqual(self._counts(loaded), self._counts(t))
+            self.assertEqual(len(loaded._spam), 9)
+            self.assertEqual(loaded, t)
+
+    def test_other_byteorder(self):
+        byteorder, words, spam, ham = self.table.__getstate__()
+        from array import array
+        spam = array('i', spam)
+        spam.byteswap()
+        ham = array('i', ham)
+        ham.byteswap()
+        if byteorder == "little":
+            byteorder = "big"
+        else:
+            byteorder = "little"
+        t = WordInfoTable()
+        t.__setstate__((byteorder, words, spam.tostring(), ham.tostring()))
+        self.assertEqual(self._counts(t), self._counts(self.table))
+
+    def test_compare_with_dict(self):
+        d = dict(self.table.items())
+        self.assertEqual(self.table, d)
+        d["w1"] = self._record(0, 0)
+        self.assertNotEqual(self.table, d)
+
+class WordIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = WordIndex(["url:example", "subject:free", "free",
+                                "url:example.com", "url:python", "freedom",
+                                "subject:Free"])
+
+    def test_prefixed(self):
+        self.assertEqual(list(self.index.prefixed("url:ex")),
+                         ["url:example", "url:example.com"])
+        self.assertEqual(list(self.index.prefixed("nothing")), [])
+        self.assertEqual(len(list(self.index.prefixed(""))), 7)
+
+    def test_search(self):
+        self.assertEqual(list(self.index.search("url:.*on")),
+                         ["url:python"])
+        self.assertEqual(list(self.index.search(r"url:example\.")),
+                         ["url:example.com"])
+        self.assertEqual(list(self.index.search("free|url:p")),
+                         ["free", "freedom", "url:python"])
+        self.assertEqual(list(self.index.search("^fre+d")), ["freedom"])
+        self.assertEqual(list(self.index.search("subject:free",
+                                                re.IGNORECASE)),
+                         ["subject:Free", "subject:free"])
+        self.assertEqual(list(self.index.search("(?i)subject:free")),
+                         ["subject:Free", "subject:free"])
+
+    def test_literal_prefix(self):
+        for pattern, prefix in (("abc.*", "abc"), ("ab*", "a"),
+                                ("a|b", ""), ("^ab", "ab"),
+                                (r"url\:x", "url:x"), ("(?i)ab", ""),
+                                ("a{0}b", "")):
+            self.assertEqual(classifier._literal_prefix(re.compile(pattern)),
+                             prefix)
+
+    def test_add_and_discard(self):
+        self.index.add("url:extra")
+        self.index.add("free")
+        self.index.discard("url:example")
+        self.index.discard("url:extra")
+        self.index.add("url:extra")
+        self.index.discard("nothing")
+        self.assertEqual(list(self.index.prefixed("url:ex")),
+                         ["url:example.com", "url:extra"])
+        self.assertEqual(len(self.index), 7)
+
+    def test_kept_up_to_date(self):
+        c = Classifier()
+        c.learn(["a", "b"], True)
+        index = c.word_index()
+        self.assertEqual(list(index.prefixed("")), ["a", "b"])
+        c.learn(["b", "c"], False)
+        c.unlearn(["a", "b"], True)
+        self.assert_(c.word_index() is index)
+        self.assertEqual(list(index.prefixed("")), ["b", "c"])
+
+    def test_max_scanned(self):
+        self.assertEqual(list(self.index.search(".*free", 0, 3)),
+                         ["free", "freedom", None])
+        self.assertEqual(list(self.index.search("url:", 0, 3)),
+                         ["url:example", "url:example.com", "url:python"])
+        self.assertEqual(list(self.index.search("url:", 0, 2)),
+                         ["url:example", "url:example.com", None])
+
+    def test_built_in_thread(self):
+        c = Classifier()
+        c.learn(["a", "b"], True)
+        keys = c._wordinfokeys
+        reading = threading.Event()
+        finish = threading.Event()
+        def slow_keys():
+            reading.set()
+            finish.wait()
+            return keys()
+        c._wordinfokeys = slow_keys
+        self.assert_(c.word_index(wait=False) is None)
+        reading.wait()
+        # Training while the index is built is included.
+        c.learn(["c"], False)
+        self.assert_(c.word_index(wait=False) is None)
+        finish.set()
+        self.assertEqual(list(c.word_index().prefixed("")),
+                         ["a", "b", "c"])
+        self.assert_(c.word_index(wait=False) is not None)
+
+class CompactWordinfoTest(_ClassifierTestBase):
+    def setUp(self):
+        self.compact = options["Storage", "compact_wordinfo"]
+        _ClassifierTestBase.setUp(self)
+        options["Storage", "compact_wordinfo"] = True
+
+    def tearDown(self):
+        options["Storage", "compact_wordinfo"] = self.compact
+
+    def test_same_scores(self):
+        c = Classifier()
+        self.assert_(isinstance(c.wordinfo, WordInfoTable))
+        c.learn(tokenize(good1), False)
+        c.learn(tokenize(spam1), True)
+        c.learn(["bulk", "list", "shared"], True)
+        c.learn(["list", "shared", "friendly"], False)
+        for msg in self.msgs:
+            self.assertEqual(c.spamprob(msg, True),
+                             self.classifier.spamprob(msg, True))
+        c.unlearn(["list", "shared", "friendly"], False)
+        self.classifier.unlearn(["list", "shared", "friendly"], False)
+        self.assertEqual(c.wordinfo, self.classifier.wordinfo)
+        self.assertEqual(c.spamprob_many(self.msgs),
+                         self.classifier.spamprob_many(self.msgs))
+
+    def test_setstate_converts(self):
+        c = Classifier()
+        c.__setstate__(self.classifier.__getstate__())
+        self.assert_(isinstance(c.wordinfo, WordInfoTable))
+        self.assertEqual(c.wordinfo, self.classifier.wordinfo)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (SpamprobManyTest,
+             ProbabilityCacheTest,
+             GetcluesTest,
+             WordInfoTableTest,
+             WordIndexTest,
+             CompactWordinfoTest,
+             LazyNumpyTest,
+             )
+    if chi2.load_numpy() is None:
+        print "Skipping NumPy combining tests, NumPy not available"
+    else:
+        clses += (NumpyCombiningTest,)
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,274 @@
+# Test the dnscache module, with a fake DNS server.
+
+import sys
+import time
+import socket
+import threading
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import tokenizer
+from spambayes.Options import options
+
+try:
+    import DNS
+    from DNS import Lib, Type, Class
+    from spambayes import dnscache
+except ImportError:
+    DNS = None
+
+class FakeDNSServer:
+    """A DNS server on localhost that answers A and PTR questions from a
+    dictionary, after a delay, and says that any other name doesn't
+    exist.  Each question is answered in its own thread, as a real
+    server would not wait for one answer before starting the next."""
+    def __init__(self, records, delays=None):
+        self.records = records      # (name, qtype) -> list of answers
+        self.delays = delays or {}  # name -> seconds to wait
+        self.questions = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self.running = True
+        thread = threading.Thread(target=self.serve)
+        thread.setDaemon(True)
+        thread.start()
+
+    def close(self):
+        self.running = False
+        self.socket.close()
+
+    def serve(self):
+        while self.running:
+            try:
+                request, address = self.socket.recvfrom(512)
+            except socket.error:
+                break
+            thread = threading.Thread(target=self.answer,
+                                      args=(request, address))
+            thread.setDaemon(True)
+            thread.start()
+
+    def answer(self, request, address):
+        u = Lib.Munpacker(request)
+        header = u.getHeader()
+        qname, qtype, qclass = u.getQuestion()
+        self.questions.append((qname, Type.typestr(qtype)))
+        time.sleep(self.delays.get(qname, 0))
+        answers = self.records.get((qname, Type.typestr(qtype)), [])
+        m = Lib.Mpacker()
+        if answers:
+            rcode, nscount = 0, 0
+        else:
+            rcode, nscount = 3, 1   # NXDOMAIN, with an SOA
+        m.addHeader(header[0], 1, 0, 1, 0, header[5], 1, 0, rcode,
+                    1, len(answers), nscount, 0)
+        m.addQuestion(qname, qtype, qclass)
+        for answer in answers:
+            if qtype == Type.A:
+                # (Lib.addA packs the address wrongly on 64 bit machines.)
+                m.addRRheader(qname, Type.A, Class.IN, 3600)
+                m.addbytes(socket.inet_aton(answer))
+                m.endRR()
+            else:
+                m.addPTR(qname, Class.IN, 3600, answer)
+        if nscount:
+            m.addSOA("example.com", Class.IN, 3600, "ns.example.com",
+                     "hostmaster.example.com", 1, 3600, 600, 86400, 60)
+        try:
+            self.socket.sendto(m.getbuf(), address)
+        except socket.error:
+            pass
+
+class DNSCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeDNSServer(
+            {("www.example.com", "A") : ["192.0.2.1"],
+             ("mail.example.com", "A") : ["192.0.2.2", "192.0.2.3"],
+             ("slow.example.com", "A") : ["192.0.2.4"],
+             ("1.2.0.192.in-addr.arpa", "PTR") : ["www.example.com"],
+             },
+            {"slow.example.com" : 1.0,
+             "www.example.com" : 0.3,
+             "mail.example.com" : 0.3,
+             "nowhere.example.com" : 0.3,
+             })
+        self.cache = dnscache.cache(dnsServer="127.0.0.1")
+        self.cache.queryArgs["port"] = self.server.port
+        self.cache.dnsTimeout = 5
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_lookup(self):
+        self.assertEqual(self.cache.lookup("www.example.com"),
+                         ["192.0.2.1"])
+        self.assertEqual(self.cache.lookup("192.0.2.1", qType="PTR"),
+                         "www.example.com")
+        self.assertEqual(self.cache.lookup("www.example.com"),
+                         ["192.0.2.1"])
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(len(self.server.questions), 2)
+
+    def test_negative(self):
+        self.assertEqual(self.cache.lookup("nowhere.example.com"), [])
+        self.assertEqual(self.cache.lookup("nowhere.example.com"), [])
+        self.assertEqual(self.server.questions,
+                         [("nowhere.example.com", "A")])
+        # The SOA's minimum says how long to remember that.
+        answer = self.cache.caches["A"]["nowhere.example.com"][0]
+        self.assert_(answer.expiresAt - time.time() <= 60)
+
+    def test_prefetch_concurrent(self):
+        questions = [("www.example.com", "A"),
+                     ("mail.example.com", "A"),
+                     ("nowhere.example.com", "A"),
+                     ("192.0.2.1", "PTR")]
+        start = time.time()
+        self.cache.prefetch(questions)
+        # One after another these take at least 0.9 seconds.
+        self.assert_(time.time() - start < 0.6)
+        self.assertEqual(len(self.server.questions), 4)
+        self.assertEqual(self.cache.lookup("mail.example.com"),
+                         ["192.0.2.2", "192.0.2.3"])
+        self.assertEqual(self.cache.lookup("nowhere.example.com"), [])
+        self.assertEqual(self.cache.lookup("192.0.2.1", "PTR"),
+                         "www.example.com")
+        self.assertEqual(self.cache.misses, 0)
+        # Asking again doesn't go to the server.
+        self.cache.prefetch(questions)
+        self.assertEqual(len(self.server.questions), 4)
+
+    def test_prefetch_budget(self):
+        start = time.time()
+        self.cache.prefetch([("slow.example.com", "A"),
+                             ("www.example.com", "A")], 0.5)
+        self.assert_(time.time() - start < 0.9)
+        self.assertEqual(self.cache.lookup("www.example.com"),
+                         ["192.0.2.1"])
+        # The slow answer hadn't arrived, so lookup doesn't wait for it.
+        self.assertEqual(self.cache.lookup("slow.example.com"), [])
+        self.assertEqual(self.cache.misses, 0)
+        # But it's used once it does arrive.
+        time.sleep(1.0)
+        self.assertEqual(self.cache.lookup("slow.example.com"),
+                         ["192.0.2.4"])
+        self.assertEqual(len(self.server.questions), 2)
+
+    def test_prefetch_threads(self):
+        self.cache.maxThreads = 1
+        start = time.time()
+        self.cache.prefetch([("www.example.com", "A"),
+                             ("mail.example.com", "A")])
+        self.assert_(time.time() - start >= 0.6)
+        self.assertEqual(len(self.cache.workers), 1)
+
+    def test_prefetch_shared(self):
+        # A question that another thread is asking isn't asked again,
+        # but its answer is waited for.
+        thread = threading.Thread(target=self.cache.prefetch,
+                                  args=([("www.example.com", "A")],))
+        thread.start()
+        time.sleep(0.1)
+        self.cache.prefetch([("www.example.com", "A")])
+        self.assertEqual(self.cache.lookup("www.example.com"),
+                         ["192.0.2.1"])
+        self.assertEqual(self.cache.misses, 0)
+        self.assertEqual(self.server.questions, [("www.example.com", "A")])
+        thread.join()
+
+    def test_lookup_threads(self):
+        # Each thread has its own request object.
+        results = {}
+        def lookup(name):
+            results[name] = self.cache.lookup(name)
+        threads = [threading.Thread(target=lookup, args=(name,))
+                   for name in ("www.example.com", "mail.example.com",
+                                "nowhere.example.com")]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_(time.time() - start < 0.6)
+        self.assertEqual(results, {"www.example.com" : ["192.0.2.1"],
+                                   "mail.example.com" : ["192.0.2.2",
+                                                         "192.0.2.3"],
+                                   "nowhere.example.com" : []})
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_prefetch_tokenize(self):
+        # Tokenizing finds the hosts that were prefetched, whatever case
+        # they are written in, so doesn't have to wait for any answers.
+        saved = (tokenizer.cache, options["Tokenizer", "x-lookup_ip"],
+                 options["Tokenizer", "x-pick_apart_urls"])
+        try:
+            tokenizer.cache = self.cache
+            options["Tokenizer", "x-lookup_ip"] = True
+            options["Tokenizer", "x-pick_apart_urls"] = True
+            msg = tokenizer.get_message("Subject: hosts\n\n"
+                                        "See http://WWW.Example.COM/page\n")
+            tokenizer.prefetch_dns(msg)
+            self.assertEqual(self.server.questions,
+                             [("www.example.com", "A")])
+            misses = self.cache.misses
+            start = time.time()
+            tokens = list(tokenizer.tokenize(msg))
+            self.assert_(time.time() - start < 0.3)
+            self.assertEqual(self.cache.misses, misses)
+            self.assert_("url-ip:192.0.2.1/32" in tokens)
+        finally:
+            (tokenizer.cache, options["Tokenizer", "x-lookup_ip"],
+             options["Tokenizer", "x-pick_apart_urls"]) = saved
+
+class DNSQuestionsTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = {}
+        for opt in ("x-lookup_ip", "x-mine_nntp_headers",
+                    "x-pick_apart_urls"):
+            self.saved[opt] = options["Tokenizer", opt]
+
+    def tearDown(self):
+        for opt, value in self.saved.items():
+            options["Tokenizer", opt] = value
+
+    def questions(self):
+        return tokenizer.dns_questions(tokenizer.get_message(
+            "NNTP-Posting-Host: news.example.com\n"
+            "Subject: hosts\n\n"
+            "See http://www.example.com/page and\n"
+            "http://user@mail.example.com:8080/x today, and\n"
+            "http://WWW.Example.NET/ too.\n"))
+
+    def test_off(self):
+        options["Tokenizer", "x-lookup_ip"] = False
+        options["Tokenizer", "x-mine_nntp_headers"] = False
+        self.assertEqual(self.questions(), [])
+
+    def test_questions(self):
+        options["Tokenizer", "x-lookup_ip"] = True
+        options["Tokenizer", "x-mine_nntp_headers"] = True
+        options["Tokenizer", "x-pick_apart_urls"] = True
+        self.assertEqual(self.questions(),
+                         [("news.example.com", "A"),
+                          ("www.example.com", "A"),
+                          ("user@mail.example.com:8080", "A"),
+                          ("www.example.net", "A")])
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (DNSQuestionsTest,
+             )
+    if DNS is not None:
+        clses += (DNSCacheTest,)
+    else:
+        print "Skipping dnscache tests, PyDNS is not available"
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,102 @@
+# Test the lrucache module.
+
+import sys
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes.lrucache import LRUCache
+
+class LRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(3)
+
+    def test_get_and_set(self):
+        self.cache["a"] = 1
+        self.assertEqual(self.cache["a"], 1)
+        self.assertEqual(self.cache.get("b"), None)
+        self.assertEqual(self.cache.get("b", 2), 2)
+        self.assertRaises(KeyError, self.cache.__getitem__, "b")
+        self.cache["a"] = 3
+        self.assertEqual(self.cache["a"], 3)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_evicts_least_recently_used(self):
+        for key in "abc":
+            self.cache[key] = key
+        # Using "a" makes "b" the oldest entry.
+        self.cache["a"]
+        self.cache["d"] = "d"
+        self.assertEqual(self.cache.keys(), ["c", "a", "d"])
+        self.assertEqual("b" in self.cache, False)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_delete(self):
+        for key in "abc":
+            self.cache[key] = key
+        del self.cache["b"]
+        self.assertEqual(self.cache.keys(), ["a", "c"])
+        self.assertRaises(KeyError, self.cache.__delitem__, "b")
+        self.cache["d"] = "d"
+        self.cache["e"] = "e"
+        self.assertEqual(self.cache.keys(), ["c", "d", "e"])
+
+    def test_stats(self):
+        self.cache["a"] = 1
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("b")
+        "a" in self.cache
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        self.cache.reset_stats()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_no_size_limit(self):
+        self.cache.maxsize = None
+        for key in "abcde":
+            self.cache[key] = key
+        self.assertEqual(len(self.cache), 5)
+        self.assertEqual(self.cache.evictions, 0)
+
+    def test_byte_limit(self):
+        evicted = []
+        cache = LRUCache(None, 10, len,
+                         lambda key, value: evicted.append(key))
+        cache["a"] = "aaaa"
+        cache["b"] = "bbbb"
+        self.assertEqual(cache.nbytes, 8)
+        cache["a"]
+        cache["c"] = "cccc"
+        self.assertEqual(cache.keys(), ["a", "c"])
+        self.assertEqual(evicted, ["b"])
+        # Changing a value changes the size.
+        cache["a"] = "a"
+        self.assertEqual(cache.nbytes, 5)
+        del cache["c"]
+        self.assertEqual(cache.nbytes, 1)
+        # A value too big for the cache isn't kept.
+        cache["d"] = "d" * 20
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+        self.assertEqual(evicted, ["b", "a", "d"])
+
+    def test_clear(self):
+        for key in "abc":
+            self.cache[key] = key
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.keys(), [])
+        self.cache["a"] = 1
+        self.assertEqual(self.cache.keys(), ["a"])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (LRUCacheTest,
+                ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
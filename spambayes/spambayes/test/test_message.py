@@ -566,14 +566,7 @@ class MessageInfoBaseTest(unittest.TestCase):
         msg = email.message_from_string(good1, _class=Message)
         msg.id = "Test"
 
-        saved = self.db.store
-        self.done = False
-        try:
-            self.db.store = self._fake_store
-            self.db.store_msg(msg)
-        finally:
-            self.db.store = saved
-        self.assertEqual(self.done, True)
+        self.db.store_msg(msg)
         correct = [(att, getattr(msg, att)) \
                    for att in msg.stored_attributes]
         db_version = dict(self.db.db[msg.id])
@@ -581,23 +574,17 @@ class MessageInfoBaseTest(unittest.TestCase):
         correct_version["date_modified"], time.time()
         self.assertEqual(db_version, correct_version)
 
-    def _fake_store(self):
-        self.done = True
-        
     def test_remove_msg(self):
         msg = email.message_from_string(good1, _class=Message)
         msg.id = "Test"
         self.db.db[msg.id] = "test"
-        saved = self.db.store
-        self.done = False
-        try:
-            self.db.store = self._fake_store
-            self.db.remove_msg(msg)
-        finally:
-            self.db.store = saved
-        self.assertEqual(self.done, True)
+        self.db.remove_msg(msg)
         self.assertRaises(KeyError, self.db.db.__getitem__, msg.id)
-        
+
+    def _count_store(self):
+        self.done += 1
+        self.db._stored()
+
     def test_load(self):
         # Create a db to try and load.
         data = {"1" : ('a', 'b', 'c'),
@@ -628,15 +615,106 @@ class MessageInfoPickleTest(MessageInfoBaseTest):
         MessageInfoBaseTest.setUp(self, TEMP_PICKLE_NAME)
 
     def tearDown(self):
-        try:
-            os.remove(TEMP_PICKLE_NAME)
-        except OSError:
-            pass
+        for fn in (TEMP_PICKLE_NAME, TEMP_PICKLE_NAME + ".journal"):
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
 
     def store(self):
         if self.db is not None:
             self.db.sync()
 
+    def _store_msgs(self, keys):
+        for key in keys:
+            msg = Message(key)
+            msg.c = "s"
+            self.db.store_msg(msg)
+
+    def test_journal(self):
+        self._store_msgs(["1", "2", "3"])
+        self.db.remove_msg(Message("2"))
+        # Nothing has been stored yet, but the changes are in the journal.
+        self.assert_(not os.path.exists(TEMP_PICKLE_NAME))
+        db2 = self.klass(TEMP_PICKLE_NAME, self.mode)
+        self.assertEqual(db2.db, self.db.db)
+        self.assertEqual(db2.changes, 4)
+
+    def test_journal_after_store(self):
+        self._store_msgs(["1", "2"])
+        self.db.store()
+        self.assert_(os.path.exists(TEMP_PICKLE_NAME))
+        self.assert_(not os.path.exists(TEMP_PICKLE_NAME + ".journal"))
+        self._store_msgs(["3"])
+        self.db.remove_msg(Message("1"))
+        db2 = self.klass(TEMP_PICKLE_NAME, self.mode)
+        self.assertEqual(db2.db, self.db.db)
+        self.assertEqual(sorted(db2.db.keys()), ["2", "3"])
+
+    def test_journal_unfinished(self):
+        self._store_msgs(["1", "2"])
+        fp = open(TEMP_PICKLE_NAME + ".journal", "ab")
+        fp.write("\x80\x02(U\x013")
+        fp.close()
+        db2 = self.klass(TEMP_PICKLE_NAME, self.mode)
+        self.assertEqual(db2.db, self.db.db)
+        # The journal is started again, so that later changes can be read.
+        self.assert_(not os.path.exists(TEMP_PICKLE_NAME + ".journal"))
+        msg = Message("3")
+        db2.store_msg(msg)
+        db3 = self.klass(TEMP_PICKLE_NAME, self.mode)
+        self.assertEqual(db3.db, db2.db)
+
+    def test_flush(self):
+        # Every change is already in the journal.
+        saved = self.db.store
+        self.done = 0
+        try:
+            self.db.store = self._count_store
+            self._store_msgs(["1"])
+            self.db.flush()
+            self.assertEqual(self.done, 0)
+        finally:
+            self.db.store = saved
+
+    def test_store_journal_size(self):
+        # The pickle is only rewritten once the journal has more records
+        # than there are messages (and than the batch size), however
+        # long it has been since it was last written.
+        saved = self.db.store
+        saved_size = options["Storage", "messageinfo_write_batch_size"]
+        self.done = 0
+        try:
+            options["Storage", "messageinfo_write_batch_size"] = 3
+            self.db.store = self._count_store
+            self._store_msgs(["0", "1", "2", "3"])
+            self.assertEqual(self.done, 0)
+            self.db.last_store -= \
+                options["Storage", "messageinfo_write_interval"]
+            self._store_msgs(["0", "1", "2", "3"])
+            # The fifth change made the journal longer than the database.
+            self.assertEqual(self.done, 1)
+            self.assertEqual(self.db.changes, 3)
+        finally:
+            self.db.store = saved
+            options["Storage", "messageinfo_write_batch_size"] = saved_size
+
+    def test_close(self):
+        self._store_msgs(["1"])
+        self.db.close()
+        self.assert_(os.path.exists(TEMP_PICKLE_NAME))
+        self.assert_(not os.path.exists(TEMP_PICKLE_NAME + ".journal"))
+        self.assertEqual(self.klass(TEMP_PICKLE_NAME, self.mode).db,
+                         self.db.db)
+
+    def test_journal_statistics(self):
+        self.db.set_persistent_statistics({"cls" : 1}, 0.0, {"cls" : 1},
+                                          [0.0])
+        db2 = self.klass(TEMP_PICKLE_NAME, self.mode)
+        self.assertEqual(db2.get_persistent_statistics(), {"cls" : 1})
+        self.assertEqual(db2.get_statistics_days(), [0.0])
+        self.assertEqual(db2.get_day_statistics(0.0), {"cls" : 1})
+
 
 class MessageInfoDBTest(MessageInfoBaseTest):
     def setUp(self):
@@ -655,6 +733,65 @@ class MessageInfoDBTest(MessageInfoBaseTest):
         if self.db is not None:
             self.db.sync()
 
+    def test_flush(self):
+        saved = self.db.store
+        self.done = 0
+        try:
+            self.db.store = self._count_store
+            self.db.store_msg(Message("1"))
+            self.db.flush()
+            self.assertEqual(self.done, 1)
+            self.db.flush()
+            self.assertEqual(self.done, 1)
+        finally:
+            self.db.store = saved
+
+    def test_store_each(self):
+        msg = email.message_from_string(good1, _class=Message)
+        msg.id = "Test"
+        saved = self.db.store
+        saved_size = options["Storage", "messageinfo_write_batch_size"]
+        self.done = 0
+        try:
+            options["Storage", "messageinfo_write_batch_size"] = 1
+            self.db.store = self._count_store
+            self.db.store_msg(msg)
+            self.assertEqual(self.done, 1)
+            self.db.remove_msg(msg)
+            self.assertEqual(self.done, 2)
+        finally:
+            self.db.store = saved
+            options["Storage", "messageinfo_write_batch_size"] = saved_size
+
+    def test_store_batched(self):
+        saved = self.db.store
+        saved_size = options["Storage", "messageinfo_write_batch_size"]
+        self.done = 0
+        try:
+            options["Storage", "messageinfo_write_batch_size"] = 3
+            self.db.store = self._count_store
+            for i in range(7):
+                msg = Message(str(i))
+                self.db.store_msg(msg)
+            self.assertEqual(self.done, 2)
+        finally:
+            self.db.store = saved
+            options["Storage", "messageinfo_write_batch_size"] = saved_size
+
+    def test_store_interval(self):
+        saved = self.db.store
+        self.done = 0
+        try:
+            self.db.store = self._count_store
+            self.db.store_msg(Message("1"))
+            self.assertEqual(self.done, 0)
+            self.db.last_store -= \
+                options["Storage", "messageinfo_write_interval"]
+            self.db.store_msg(Message("2"))
+            self.assertEqual(self.done, 1)
+        finally:
+            self.db.store = saved
+
     def _fake_close(self):
         self.done += 1
         
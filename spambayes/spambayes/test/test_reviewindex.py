@@ -0,0 +1,154 @@
+# Test the reviewindex module.
+
+import os
+import sys
+import shutil
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import reviewindex
+from spambayes.reviewindex import ReviewIndex, REVIEW_INDEX_NAME
+from spambayes.FileCorpus import FileCorpus, FileMessageFactory
+from spambayes.Options import options
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1
+
+classified = """From: someone@example.com
+Subject: spam,Buy now
+X-Spambayes-Classification: spam; 0.99
+X-Spambayes-Spam-Probability: 0.987654 (0.99)
+Content-Type: text/html
+
+<html><body><p>Cheap&nbsp;stuff</p>
+
+
+<!-- hidden --><p>here</p></body></html>
+"""
+
+class SummarizeTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = FileMessageFactory()
+        self.notate = options["Headers", "notate_subject"]
+        options["Headers", "notate_subject"] = ("spam",)
+
+    def tearDown(self):
+        options["Headers", "notate_subject"] = self.notate
+
+    def summarize(self, text):
+        return reviewindex.summarize(self.factory.create("1", ".", text))
+
+    def test_unclassified(self):
+        summary = self.summarize(good1)
+        self.assertEqual(summary["headers"]["subject"], "ZPT and DTML")
+        self.assertEqual(summary["headers"]["from"], "chris@example.com")
+        self.assertEqual(summary["score"], "?")
+        self.assertEqual(summary["classification"],
+                         options["Headers", "header_unsure_string"])
+        self.assert_(summary["body"].startswith("Jean Jordaan wrote:"))
+        self.assertEqual(summary["size"],
+                         len(good1.replace("\n", "\r\n")))
+
+    def test_classified(self):
+        summary = self.summarize(classified)
+        self.assertEqual(summary["headers"]["subject"], "Buy now")
+        self.assertEqual(int(round(summary["score"])), 99)
+        self.assertEqual(summary["classification"], "spam")
+        self.assertEqual(summary["body"],
+                         "(this message only has an HTML body)\n"
+                         "Cheap stuff here")
+
+    def test_long_body(self):
+        summary = self.summarize(good1 + "x" * 5000)
+        self.assertEqual(len(summary["body"]), reviewindex.MAX_BODY)
+
+    def test_display_headers(self):
+        summary = self.summarize(good1)
+        self.assert_(reviewindex.has_display_headers(summary))
+        headers = options["html_ui", "display_headers"]
+        options["html_ui", "display_headers"] = headers + ("X-Mailer",)
+        try:
+            self.assert_(not reviewindex.has_display_headers(summary))
+        finally:
+            options["html_ui", "display_headers"] = headers
+
+class ReviewIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = "reviewindextest"
+        os.mkdir(self.directory)
+        self.filename = os.path.join(self.directory, REVIEW_INDEX_NAME)
+        self.corpus = FileCorpus(FileMessageFactory(), self.directory,
+                                 "[0123456789]*")
+        self.index = ReviewIndex(self.filename, self.corpus)
+        self.corpus.addObserver(self.index)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add(self, key, text):
+        msg = self.corpus.makeMessage(key, text)
+        self.corpus.addMessage(msg)
+        return msg
+
+    def test_observes_corpus(self):
+        msg = self.add("1", good1)
+        self.add("2", spam1)
+        self.assertEqual(self.index.get("1")["headers"]["subject"],
+                         "ZPT and DTML")
+        self.assertEqual(self.index.get("1")["size"],
+                         os.path.getsize(msg.pathname()))
+        self.corpus.removeMessage(msg)
+        self.assertEqual(self.index.get("1"), None)
+        self.assertEqual(self.index.get("2")["headers"]["subject"],
+                         "Make money fast")
+
+    def test_persists(self):
+        self.add("1", good1)
+        self.add("2", spam1)
+        self.corpus.removeMessage(self.corpus["2"])
+        index = ReviewIndex(self.filename, self.corpus)
+        self.assertEqual(index.summaries, self.index.summaries)
+        self.assertEqual(index.summaries.keys(), ["1"])
+
+    def test_forgets_missing_messages(self):
+        self.add("1", good1)
+        self.add("2", spam1)
+        os.remove(self.corpus["2"].pathname())
+        corpus = FileCorpus(FileMessageFactory(), self.directory,
+                            "[0123456789]*")
+        index = ReviewIndex(self.filename, corpus)
+        self.assertEqual(index.summaries.keys(), ["1"])
+
+    def test_compact(self):
+        for i in range(5):
+            self.add(str(i), good1)
+        for i in range(4):
+            self.corpus.removeMessage(self.corpus[str(i)])
+        size = os.path.getsize(self.filename)
+        index = ReviewIndex(self.filename, self.corpus)
+        self.assertEqual(index.stale, 0)
+        self.assertEqual(index.summaries.keys(), ["4"])
+        self.assert_(os.path.getsize(self.filename) < size)
+
+    def test_unfinished_record(self):
+        self.add("1", good1)
+        self.add("2", spam1)
+        fp = open(self.filename, "ab")
+        fp.write("{\x00\x00")
+        fp.close()
+        index = ReviewIndex(self.filename, self.corpus)
+        self.assertEqual(index.summaries, self.index.summaries)
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (SummarizeTest,
+             ReviewIndexTest,
+             )
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -7,6 +7,7 @@ import unittest
 from spambayes.tokenizer import tokenize
 from spambayes.storage import open_storage
 from spambayes.storage import PickledClassifier, DBDictClassifier
+from spambayes.storage import MutuallyExclusiveError
 
 import sb_test_support
 sb_test_support.fix_sys_path()
@@ -54,6 +55,17 @@ class dbexpimpTest(unittest.TestCase):
         """Check that we don't import the old object craft csv module."""
         self.assert_(hasattr(sb_dbexpimp.csv, "reader"))
 
+    def test_database_type(self):
+        self.assertEqual(sb_dbexpimp.database_type([('-s', 'a.snap')]),
+                         ('a.snap', 'snapshot'))
+        self.assertEqual(sb_dbexpimp.database_type([('-d', 'a.db')]),
+                         ('a.db', 'dbm'))
+        for opts in ([('-s', 'a.snap'), ('-d', 'a.db')],
+                     [('-p', 'a.pik'), ('-s', 'a.snap')],
+                     [('-s', 'a.snap'), ('-s', 'b.snap')]):
+            self.assertRaises(MutuallyExclusiveError,
+                              sb_dbexpimp.database_type, opts)
+
     def test_pickle_export(self):
         # Create a pickled classifier to export.
         bayes = PickledClassifier(TEMP_PICKLE_NAME)
@@ -336,6 +336,27 @@ def helper():
             response = response + proxy.recv(1000)
         assert response.find(options["Headers", "classification_header_name"]) >= 0
 
+    # Retrieve a message over several connections at once, so that the
+    # proxy's classification threads are all busy together.
+    sessions = []
+    for i in range(3):
+        session = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        session.connect(('localhost', 8111))
+        response = session.recv(100)
+        assert response == "+OK ready\r\n"
+        sessions.append(session)
+    for session in sessions:
+        session.send("retr 2\r\n")
+    for session in sessions:
+        response = ""
+        while response.find('\n.\r\n') == -1:
+            response = response + session.recv(1000)
+        assert response.find(options["Headers", "classification_header_name"]) >= 0
+        assert response.find("ZPT and DTML") >= 0
+        session.send("quit\r\n")
+        session.recv(100)
+        session.close()
+
     # Check that the proxy times out when it should.  The consequence here
     # is that the first packet we receive from the proxy will contain a
     # partial message, so we assert for that.  At 100 characters per second
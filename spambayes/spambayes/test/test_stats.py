@@ -8,9 +8,10 @@ import unittest
 import sb_test_support
 sb_test_support.fix_sys_path()
 
-from spambayes.Stats import Stats
+from spambayes.Stats import Stats, day_start, SECONDS_PER_DAY
 from spambayes.Options import options
 from spambayes.message import MessageInfoPickle, Message
+from spambayes.message import STATS_STORAGE_KEY, STATS_DAYS_KEY
 
 class StatsTest(unittest.TestCase):
     def setUp(self):
@@ -20,8 +21,10 @@ class StatsTest(unittest.TestCase):
         Message.message_info_db = self.messageinfo_db
 
     def tearDown(self):
-        if os.path.exists(self.messageinfo_db_name):
-            os.remove(self.messageinfo_db_name)
+        for fn in (self.messageinfo_db_name,
+                   self.messageinfo_db_name + ".journal"):
+            if os.path.exists(fn):
+                os.remove(fn)
 
     def test_from_date_unset(self):
         self.assertEqual(None, self.s.from_date)
@@ -161,6 +164,16 @@ class StatsTest(unittest.TestCase):
         msg.RememberClassification(options['Headers','header_unsure_string'])
         msg = Message('8')
         msg.RememberClassification(options['Headers','header_unsure_string'])
+        self._count_messages()
+        self.assertEqual(self.s.totals["num_ham"], 3)
+        self.assertEqual(self.s.totals["num_spam"], 2)
+        self.assertEqual(self.s.totals["num_unsure"], 4)
+        self.assertEqual(self.s.totals["num_trained_spam"], 1)
+        self.assertEqual(self.s.totals["num_trained_spam_fn"], 1)
+        self.assertEqual(self.s.totals["num_trained_ham"], 1)
+        self.assertEqual(self.s.totals["num_trained_ham_fp"], 1)
+        # Once they've been counted, the messages aren't needed.
+        self.messageinfo_db.load_msg = None
         self.s.CalculatePersistentStats()
         self.assertEqual(self.s.totals["num_ham"], 3)
         self.assertEqual(self.s.totals["num_spam"], 2)
@@ -431,9 +444,17 @@ class StatsTest(unittest.TestCase):
         self.assertEqual(s[21], "SpamBayes savings:\t$-19.40")
         self.assertEqual(len(s), 22)
 
+    def _count_messages(self):
+        # Open the statistics as if they had been stored before daily
+        # statistics were kept, so that the messages are counted.
+        del self.messageinfo_db.db[STATS_STORAGE_KEY]
+        del self.messageinfo_db.db[STATS_DAYS_KEY]
+        self.s = Stats(options, self.messageinfo_db)
+
     def _stuff_with_data(self, use_html=False):
-        self._stuff_with_session_data()
         self._stuff_with_persistent_data()
+        self._count_messages()
+        self._stuff_with_session_data()
         self.s.CalculatePersistentStats()
         return self.s.GetStats(use_html=use_html)
 
@@ -491,6 +512,7 @@ class StatsTest(unittest.TestCase):
     def test_from_date_empty(self):
         # Put persistent data in, but no session data.
         self._stuff_with_persistent_data()
+        self._count_messages()
         # Wait for a bit to make sure the time is later.
         time.sleep(0.1)
         # Set the date to now.
@@ -503,28 +525,55 @@ class StatsTest(unittest.TestCase):
     def test_from_specified_date(self):
         # Put persistent data in, but no session data.
         self._stuff_with_persistent_data()
+        self._count_messages()
         # Wait for a bit to make sure the time is later.
         time.sleep(0.1)
         # Set the date to now.
-        self.s.from_date = time.time()
+        self.s.ResetTotal(permanently=True)
         # Wait for a bit to make sure the time is later.
         time.sleep(0.1)
         # Put more data in.
-        msg = Message('0')
-        msg.RememberTrained(True)
-        msg.RememberClassification(options['Headers','header_spam_string'])
-        msg = Message('7')
-        msg.RememberTrained(False)
-        msg.RememberClassification(options['Headers','header_spam_string'])
-        msg = Message('2')
-        msg.RememberTrained(True)
-        msg.RememberClassification(options['Headers','header_ham_string'])
+        self.s.RecordClassification(0.0)
+        self.s.RecordClassification(1.0)
+        self.s.RecordTraining(False, 0.0)
+        self.s.RecordClassification(0.5)
         # Recalculate.
         self.s.CalculatePersistentStats()
         # Check that there are the right number of messages (assume that
         # the rest is right - if not it should be caught by other tests).
         self.assertEqual(self.s.GetStats()[0], "Messages classified: 3")
-        
+        # The statistics since an earlier date include the whole of each
+        # day, including the messages before the reset.
+        self.s.from_date = day_start(time.time()) - SECONDS_PER_DAY / 2
+        self.s.CalculatePersistentStats()
+        self.assertEqual(self.s.GetStats()[0], "Messages classified: 12")
+
+    def test_days(self):
+        today = day_start(time.time())
+        stats = {today - 2 * SECONDS_PER_DAY : {"num_spam" : 1},
+                 today - SECONDS_PER_DAY : {"num_ham" : 2},
+                 today : {"num_ham" : 4, "num_unsure" : 8},
+                 }
+        self.messageinfo_db.set_daily_statistics(stats)
+        self.s = Stats(options, self.messageinfo_db)
+        self.s.from_date = today - SECONDS_PER_DAY + 60
+        self.s.CalculatePersistentStats()
+        self.assertEqual(self.s.totals["num_spam"], 0)
+        self.assertEqual(self.s.totals["num_ham"], 6)
+        self.assertEqual(self.s.totals["num_unsure"], 8)
+        self.s.from_date = None
+        self.s.CalculatePersistentStats()
+        self.assertEqual(self.s.totals["num_spam"], 1)
+
+    def test_daily_stats_stored(self):
+        self.s.RecordClassification(0.0)
+        self.s.RecordTraining(True, 1.0)
+        self.messageinfo_db = MessageInfoPickle(self.messageinfo_db_name)
+        s = Stats(options, self.messageinfo_db)
+        self.assertEqual(s.totals, self.s.totals)
+        s.CalculatePersistentStats()
+        self.assertEqual(s.totals, self.s.totals)
+        self.assertEqual(s.days, [day_start(time.time())])
 
 def suite():
     suite = unittest.TestSuite()
@@ -5,11 +5,22 @@ import glob
 import tempfile
 import cStringIO as StringIO
 
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
 import sb_test_support
 sb_test_support.fix_sys_path()
 
+from spambayes.Options import options
+from spambayes import classifier
+from spambayes.classifier import WordInfoTable
 from spambayes.storage import ZODBClassifier, CDBClassifier
 from spambayes.storage import DBDictClassifier, PickledClassifier
+from spambayes.storage import SnapshotClassifier, MappedCDBClassifier
+from spambayes.storage import SQLClassifier
+from spambayes import snapshot
 
 class _StorageTestBase(unittest.TestCase):
     # Subclass must define a concrete StorageClass.
@@ -171,9 +182,86 @@ class _StorageTestBase(unittest.TestCase):
 class PickleStorageTestCase(_StorageTestBase):
     StorageClass = PickledClassifier
 
+class _CompactStorageTestBase(_StorageTestBase):
+    # Hold the word database in a WordInfoTable rather than a dict.
+    def setUp(self):
+        self.compact = options["Storage", "compact_wordinfo"]
+        options["Storage", "compact_wordinfo"] = True
+        _StorageTestBase.setUp(self)
+
+    def tearDown(self):
+        _StorageTestBase.tearDown(self)
+        options["Storage", "compact_wordinfo"] = self.compact
+
+    def testIsCompact(self):
+        self.assert_(isinstance(self.classifier.wordinfo, WordInfoTable))
+        self.classifier.learn(["a", "b"], True)
+        self.classifier.store()
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name)
+        self.assert_(isinstance(self.classifier.wordinfo, WordInfoTable))
+
+class CompactPickleStorageTestCase(_CompactStorageTestBase):
+    StorageClass = PickledClassifier
+
+    def testLoadDictPickle(self):
+        # A pickle saved without the option is converted on loading.
+        options["Storage", "compact_wordinfo"] = False
+        c = PickledClassifier(self.db_name)
+        c.learn(["some", "simple", "tokens"], True)
+        c.store()
+        options["Storage", "compact_wordinfo"] = True
+        self.classifier = PickledClassifier(self.db_name)
+        self.assert_(isinstance(self.classifier.wordinfo, WordInfoTable))
+        self._checkAllWordCounts((("some", 0, 1),
+                                  ("tokens", 0, 1)), False)
+
 class DBStorageTestCase(_StorageTestBase):
     StorageClass = DBDictClassifier
 
+    def testWriteBehind(self):
+        c = self.classifier
+        batch_size = options["Storage", "dbm_write_batch_size"]
+        interval = options["Storage", "dbm_write_interval"]
+        options["Storage", "dbm_write_batch_size"] = 5
+        options["Storage", "dbm_write_interval"] = 3600.0
+        try:
+            c.learn(["a", "b"], True)
+            c.learn(["b", "c"], False)
+            # Nothing has been written yet, but the changes can be seen.
+            self.failIf(c.db.has_key("a"))
+            self.failIf(c.db.has_key(c.statekey))
+            self._checkAllWordCounts((("a", 0, 1),
+                                      ("b", 1, 1),
+                                      ("c", 1, 0)), False)
+            keys = c._wordinfokeys()
+            keys.sort()
+            self.assertEqual(keys, ["a", "c"])
+            # The buffer fills up, and is written.
+            c.learn(["d", "e", "f"], True)
+            self.assertEqual(c.db["a"], (1, 0))
+            self.assertEqual(c.db["f"], (1, 0))
+            self.assertEqual(c.db[c.statekey][1:], (2, 1))
+            self.assertEqual(c.pending_words, {})
+            # Cached words are still only written by store().
+            self.failIf(c.db.has_key("b"))
+            # Old enough changes are written even if there are few.
+            options["Storage", "dbm_write_interval"] = 0.0
+            c.learn(["g"], False)
+            self.assertEqual(c.db["g"], (0, 1))
+            c.store()
+            self.assertEqual(c.db["b"], (1, 1))
+        finally:
+            options["Storage", "dbm_write_batch_size"] = batch_size
+            options["Storage", "dbm_write_interval"] = interval
+
+    def testCloseWrites(self):
+        self.classifier.learn(["a", "b"], True)
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name)
+        self.assertEqual(self.classifier.nspam, 1)
+        self._checkAllWordCounts((("a", 0, 1),), False)
+
     def _fail_open_best(self, *args):
         from spambayes import dbmstorage
         raise dbmstorage.error("No dbm modules available!")
@@ -198,6 +286,229 @@ class DBStorageTestCase(_StorageTestBase):
 class CDBStorageTestCase(_StorageTestBase):
     StorageClass = CDBClassifier
 
+class CompactCDBStorageTestCase(_CompactStorageTestBase):
+    StorageClass = CDBClassifier
+
+class MappedCDBStorageTestCase(_StorageTestBase):
+    StorageClass = MappedCDBClassifier
+
+    def _reopen(self):
+        self.classifier.store()
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name)
+
+    def testLazyLoad(self):
+        self.classifier.learn(["some", "simple", "tokens"], True)
+        self._reopen()
+        self.assertEqual(self.classifier.wordinfo, {})
+        self.assertEqual(self.classifier._wordinfoget("simple").spamcount, 1)
+        self.assertEqual(self.classifier._wordinfoget("missing"), None)
+        self.assertEqual(self.classifier._wordinfoget("saved state"), None)
+
+    def testChangesMerged(self):
+        c = self.classifier
+        c.learn(["a", "b", "c"], True)
+        self._reopen()
+        c = self.classifier
+        c.unlearn(["a", "b", "c"], True)
+        c.learn(["b", "d"], False)
+        self._reopen()
+        keys = self.classifier._wordinfokeys()
+        keys.sort()
+        self.assertEqual(keys, ["b", "d"])
+        self._checkAllWordCounts((("b", 1, 0), ("d", 1, 0)), False)
+
+    def testReadsCDBClassifier(self):
+        self.classifier.close()
+        c = CDBClassifier(self.db_name)
+        c.learn(["some", "simple", "tokens"], True)
+        c.learn(["some"], False)
+        c.store()
+        self.classifier = self.StorageClass(self.db_name)
+        self.assertEqual(self.classifier.nham, 1)
+        self.assertEqual(self.classifier.nspam, 1)
+        self._checkAllWordCounts((("some", 1, 1), ("tokens", 0, 1)), False)
+
+class SnapshotStorageTestCase(_StorageTestBase):
+    StorageClass = SnapshotClassifier
+
+    def _reopen(self):
+        self.classifier.store()
+        self.classifier.close()
+        self.classifier = self.StorageClass(self.db_name)
+
+    def testLazyLoad(self):
+        c = self.classifier
+        c.learn(["some", "simple", "tokens"], True)
+        self._reopen()
+        self.assertEqual(self.classifier.wordinfo, {})
+        self.assertEqual(self.classifier._wordinfoget("simple").spamcount, 1)
+        self.assertEqual(self.classifier._wordinfoget("missing"), None)
+
+    def testChangesMerged(self):
+        c = self.classifier
+        c.learn(["a", "b", "c", "d"], True)
+        c.learn(["b", "d"], False)
+        self._reopen()
+        c = self.classifier
+        c.unlearn(["a", "b", "c", "d"], True)
+        c.learn(["e", "b", "aa"], False)
+        self._reopen()
+        c = self.classifier
+        self.assertEqual(c.nspam, 0)
+        self.assertEqual(c.nham, 2)
+        keys = c._wordinfokeys()
+        keys.sort()
+        self.assertEqual(keys, ["aa", "b", "d", "e"])
+        self.assertEqual(c.snapshot.words(), ["aa", "b", "d", "e"])
+        self._checkAllWordCounts((("aa", 1, 0),
+                                  ("b", 2, 0),
+                                  ("d", 1, 0),
+                                  ("e", 1, 0)), False)
+        self.assertEqual(c._wordinfoget("a"), None)
+        self.assertEqual(c._wordinfoget("c"), None)
+
+    def testUnicode(self):
+        word = u"caf\xe9"
+        self.classifier.learn([word], True)
+        self._reopen()
+        self.assertEqual(self.classifier._wordinfoget(word).spamcount, 1)
+        self.assertEqual(self.classifier._wordinfokeys(),
+                         [word.encode("utf-8")])
+
+    def testBadFiles(self):
+        self.classifier.learn(["a"], True)
+        self.classifier.store()
+        self.classifier.close()
+        data = open(self.db_name, "rb").read()
+        for bad in ("", data[:10], "XXXXXX" + data[6:],
+                    data[:6] + "\x63\x00" + data[8:], data[:-1]):
+            f = open(self.db_name, "wb")
+            f.write(bad)
+            f.close()
+            self.assertRaises(ValueError, snapshot.Snapshot, self.db_name)
+
+class SQLiteClassifier(SQLClassifier):
+    # SQLClassifier only needs a DB-API module, so it can be tested with
+    # sqlite rather than a Postgres or MySQL server.
+    placeholder = "?"
+    table_definition = ("create table bayes ("
+                        "  word text not null default '',"
+                        "  nspam integer not null default 0,"
+                        "  nham integer not null default 0,"
+                        "  primary key(word)"
+                        ")")
+
+    def cursor(self):
+        c = self.db.cursor()
+        return CountingCursor(c, self.statements)
+
+    def fetchall(self, c):
+        return c.fetchall()
+
+    def commit(self, _c):
+        self.commits += 1
+        self.db.commit()
+
+    def close(self):
+        SQLClassifier.close(self)
+        self.db.close()
+
+    def load(self):
+        self.statements = []
+        self.commits = 0
+        self.db = sqlite3.connect(self.db_name)
+        self.db.row_factory = sqlite3.Row
+        self.db.text_factory = str
+        c = self.cursor()
+        try:
+            c.execute("select count(*) from bayes")
+        except sqlite3.OperationalError:
+            self.create_bayes()
+        if self._has_key(self.statekey):
+            row = self._get_row(self.statekey)
+            self.nspam = row["nspam"]
+            self.nham = row["nham"]
+        else:
+            self.nspam = 0
+            self.nham = 0
+
+class CountingCursor(object):
+    def __init__(self, c, statements):
+        self.c = c
+        self.statements = statements
+
+    def execute(self, statement, args=()):
+        self.statements.append(statement.split()[0])
+        return self.c.execute(statement, args)
+
+    def __getattr__(self, name):
+        return getattr(self.c, name)
+
+class SQLStorageTestCase(_StorageTestBase):
+    StorageClass = SQLiteClassifier
+
+    def test_bug777026(self):
+        # SQLClassifier has no wordinfo to look in, so clone the record
+        # via _wordinfoget instead.
+        c = self.classifier
+        c.learn(["tim"], False)
+        c.learn(["tim"], False)
+        newrecord = c._wordinfoget("tim")
+        newrecord.hamcount -= 1
+        c._wordinfoset("tim", newrecord)
+        c._post_training()
+        self._checkAllWordCounts([("tim", 1, 0)], False)
+
+    def testScoringQueries(self):
+        c = self.classifier
+        words = ["w%d" % i for i in range(700)]
+        c.learn(words, True)
+        c.learn(words[:10], False)
+        ref = classifier.Classifier()
+        ref.learn(words, True)
+        ref.learn(words[:10], False)
+        del c.statements[:]
+        self.assertEqual(c.spamprob(words + ["unknown"], True),
+                         ref.spamprob(words + ["unknown"], True))
+        # 701 words, looked up max_batch at a time.
+        self.assertEqual(c.statements, ["select"] * 3)
+
+    def testTrainingQueries(self):
+        c = self.classifier
+        words = ["w%d" % i for i in range(700)]
+        del c.statements[:]
+        c.commits = 0
+        c.learn(words, True)
+        # A select per batch to fetch the records, and then a delete and
+        # an insert per batch to write them.
+        self.assertEqual(c.statements,
+                         ["select"] * 3 + ["delete", "insert"] * 3)
+        self.assertEqual(c.commits, 3)
+        del c.statements[:]
+        c.unlearn(words[:5], True)
+        self.assertEqual(c.statements, ["select", "delete"])
+        self._checkAllWordCounts((("w0", 0, 0),
+                                  ("w5", 0, 1)), False)
+
+    def testSingleTransaction(self):
+        single = options["Storage", "sql_single_transaction"]
+        options["Storage", "sql_single_transaction"] = True
+        try:
+            c = self.classifier
+            c.learn(["w%d" % i for i in range(700)], True)
+            c.commits = 0
+            c.unlearn(["w%d" % i for i in range(400)], True)
+            self.assertEqual(c.commits, 1)
+            # The message counts were written along with the words.
+            c.close()
+            self.classifier = self.StorageClass(self.db_name)
+            self.assertEqual(self.classifier.nspam, 0)
+            self._checkAllWordCounts((("w0", 0, 0),
+                                      ("w699", 0, 1)), False)
+        finally:
+            options["Storage", "sql_single_transaction"] = single
+
 class ZODBStorageTestCase(_StorageTestBase):
     StorageClass = ZODBClassifier
 
@@ -205,6 +516,10 @@ def suite():
     suite = unittest.TestSuite()
     clses = (PickleStorageTestCase,
              CDBStorageTestCase,
+             MappedCDBStorageTestCase,
+             SnapshotStorageTestCase,
+             CompactPickleStorageTestCase,
+             CompactCDBStorageTestCase,
              )
     from spambayes.port import bsddb
     from spambayes.port import gdbm
@@ -221,6 +536,11 @@ def suite():
     else:
          clses += (ZODBStorageTestCase,)
         
+    if sqlite3 is None:
+        print "Skipping SQL tests, sqlite3 not available"
+    else:
+        clses += (SQLStorageTestCase,)
+
     for cls in clses:
         suite.addTest(unittest.makeSuite(cls))
     return suite
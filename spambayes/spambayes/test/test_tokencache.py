@@ -0,0 +1,254 @@
+# Test the tokencache module.
+
+import os
+import sys
+import glob
+import tempfile
+import unittest
+import email
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import tokenizer
+from spambayes import tokencache
+from spambayes import message
+from spambayes import dbmstorage
+from spambayes.Options import options
+from spambayes.tokencache import TokenCache
+from spambayes.port import bsddb, gdbm
+
+msg1 = """From: someone@example.com
+To: someone.else@example.com
+Subject: A test message
+
+This is a test message, of no great interest.
+"""
+
+msg2 = """From: someone.else@example.com
+To: someone@example.com
+Subject: Re: A test message
+
+So I see.
+"""
+
+class CountingTokenizer:
+    """Count the messages tokenized by tokenizer.tokenize."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, obj):
+        self.calls += 1
+        return self.tokenize(obj)
+
+class _TokenCacheTestBase(unittest.TestCase):
+    def setUp(self):
+        self.counter = CountingTokenizer()
+        self.counter.tokenize = tokenizer.tokenize
+        tokenizer.tokenize = self.counter
+
+    def tearDown(self):
+        tokenizer.tokenize = self.counter.tokenize
+
+class TokenCacheTest(_TokenCacheTestBase):
+    def setUp(self):
+        _TokenCacheTestBase.setUp(self)
+        self.cache = TokenCache(2)
+
+    def test_same_tokens(self):
+        expected = tuple(self.counter.tokenize(msg1))
+        self.assertEqual(self.cache.tokenize(msg1), expected)
+        self.assertEqual(self.cache.tokenize(msg1), expected)
+        self.assertEqual(self.counter.calls, 1)
+
+    def test_message_objects(self):
+        msg = tokenizer.get_message(msg1)
+        tokens = self.cache.tokenize(msg)
+        self.assertEqual(self.cache.tokenize(tokenizer.get_message(msg1)),
+                         tokens)
+        self.assertEqual(self.counter.calls, 1)
+
+    def test_bounded(self):
+        self.cache.tokenize(msg1)
+        self.cache.tokenize(msg2)
+        self.cache.tokenize(msg1 + "\nmore text\n")
+        self.assertEqual(len(self.cache.cache), 2)
+        self.cache.tokenize(msg1)
+        self.assertEqual(self.counter.calls, 4)
+
+    def test_options_change_key(self):
+        self.cache.tokenize(msg1)
+        old = options["Tokenizer", "mine_received_headers"]
+        options["Tokenizer", "mine_received_headers"] = not old
+        try:
+            self.cache.tokenize(msg1)
+        finally:
+            options["Tokenizer", "mine_received_headers"] = old
+        self.assertEqual(self.counter.calls, 2)
+        # But the options that say where other caches are don't matter.
+        old = options["Tokenizer", "crack_image_cache"]
+        options["Tokenizer", "crack_image_cache"] = "somewhere"
+        try:
+            self.cache.tokenize(msg1)
+        finally:
+            options["Tokenizer", "crack_image_cache"] = old
+        self.assertEqual(self.counter.calls, 2)
+
+    def test_stats(self):
+        self.cache.tokenize(msg1)
+        self.cache.tokenize(msg1)
+        self.cache.tokenize(msg1)
+        self.cache.tokenize(msg2)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["disk_hits"], 0)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_sb_headers_ignored(self):
+        # A message that has been scored and then has the SpamBayes
+        # headers added isn't tokenized again.
+        scored = msg1.replace("Subject:", "X-Spambayes-Classification: "
+                              "spam; 0.99\nX-Spambayes-Evidence: "
+                              "'*H*': 0.00;\n    '*S*': 1.00\nSubject:")
+        self.assertEqual(self.cache.tokenize(scored),
+                         self.cache.tokenize(msg1))
+        self.assertEqual(self.counter.calls, 1)
+
+    def test_sb_headers_added(self):
+        # The way sb_server saves a message for the review page.
+        msg = message.SBHeaderMessage()
+        msg.set_payload("This is a test message.\n")
+        msg["Subject"] = "A test message"
+        self.cache.tokenize(msg)
+        msg[options["Headers", "classification_header_name"]] = "spam"
+        msg[options["Headers", "mailid_header_name"]] = "1234"
+        self.cache.tokenize(email.message_from_string(msg.as_string(),
+                                            message.SBHeaderMessage))
+        self.assertEqual(self.counter.calls, 1)
+
+    def test_sb_headers_counted(self):
+        # Unless they make a difference to the tokens.
+        scored = "X-Spambayes-Classification: spam\n" + msg1
+        old = options["Tokenizer", "count_all_header_lines"]
+        options["Tokenizer", "count_all_header_lines"] = True
+        try:
+            self.assertNotEqual(self.cache.tokenize(scored),
+                                self.cache.tokenize(msg1))
+        finally:
+            options["Tokenizer", "count_all_header_lines"] = old
+        self.assertEqual(self.counter.calls, 2)
+
+    def test_strip_headers(self):
+        names = ["x-spambayes-evidence", "x-spambayes-trained"]
+        text = "A: 1\r\nX-Spambayes-Evidence: a\r\n  b\r\nB: 2\r\n" \
+               "  c\r\n\r\nX-Spambayes-Trained: body\r\n"
+        self.assertEqual(tokencache.strip_headers(text, names),
+                         "A: 1\r\nB: 2\r\n  c\r\n\r\n"
+                         "X-Spambayes-Trained: body\r\n")
+        self.assert_(tokencache.strip_headers(msg1, names) is msg1)
+        # The headers are usually added at the end.
+        for eol in ("\n", "\r\n"):
+            text = "A: 1%sX-Spambayes-Trained: spam%s%sbody%s" % \
+                   (eol, eol, eol, eol)
+            self.assertEqual(tokencache.strip_headers(text, names),
+                             "A: 1%s%sbody%s" % (eol, eol, eol))
+
+class DiskTokenCacheTest(_TokenCacheTestBase):
+    def setUp(self):
+        _TokenCacheTestBase.setUp(self)
+        self.db_name = tempfile.mktemp("tokencachetest")
+
+    def tearDown(self):
+        _TokenCacheTestBase.tearDown(self)
+        for name in glob.glob(self.db_name + "*"):
+            if os.path.isfile(name):
+                os.remove(name)
+
+    def test_persists(self):
+        cache = TokenCache(2, self.db_name)
+        tokens = cache.tokenize(msg1)
+        cache.close()
+        cache = TokenCache(2, self.db_name)
+        self.assertEqual(cache.tokenize(msg1), tokens)
+        cache.close()
+        self.assertEqual(self.counter.calls, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def _messages(self, n):
+        return [msg1 + "\nmessage %d\n" % i for i in range(n)]
+
+    def _stored(self):
+        db = dbmstorage.open(self.db_name, "r")
+        try:
+            return len(db.keys()) - 1
+        finally:
+            db.close()
+
+    def test_bounded_file(self):
+        cache = TokenCache(1, self.db_name, 4)
+        msgs = self._messages(10)
+        for msg in msgs:
+            cache.tokenize(msg)
+        cache.close()
+        self.assert_(self._stored() <= 4)
+        # The most recent messages are still there.
+        cache = TokenCache(1, self.db_name, 4)
+        cache.tokenize(msgs[-1])
+        cache.close()
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_used_entries_kept(self):
+        cache = TokenCache(1, self.db_name, 4)
+        msgs = self._messages(10)
+        for msg in msgs:
+            cache.tokenize(msg)
+            # The first message is read from the file each time (it
+            # isn't in memory any more), so it isn't removed.
+            cache.tokenize(msgs[0])
+        cache.close()
+        self.assertEqual(self.counter.calls, 10)
+
+class SharedTokenCacheTest(_TokenCacheTestBase):
+    def setUp(self):
+        _TokenCacheTestBase.setUp(self)
+        self.size = options["Tokenizer", "token_cache_size"]
+        self.cache = tokencache._cache
+        tokencache._cache = None
+
+    def tearDown(self):
+        _TokenCacheTestBase.tearDown(self)
+        options["Tokenizer", "token_cache_size"] = self.size
+        tokencache._cache = self.cache
+
+    def test_disabled(self):
+        options["Tokenizer", "token_cache_size"] = 0
+        self.assertEqual(tokencache.get_cache(), None)
+        list(tokencache.tokenize(msg1))
+        list(tokencache.tokenize(msg1))
+        self.assertEqual(self.counter.calls, 2)
+
+    def test_enabled(self):
+        options["Tokenizer", "token_cache_size"] = 10
+        cache = tokencache.get_cache()
+        self.assertEqual(cache.cache.maxsize, 10)
+        self.assert_(tokencache.get_cache() is cache)
+        list(tokencache.tokenize(msg1))
+        list(tokencache.tokenize(msg1))
+        self.assertEqual(self.counter.calls, 1)
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (TokenCacheTest,
+             SharedTokenCacheTest,
+             )
+    if gdbm or bsddb:
+        clses += (DiskTokenCacheTest,)
+    else:
+        print "Skipping disk cache tests, no dbm module available"
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,271 @@
+# Test the tokenizer module.
+
+import os
+import sys
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import tokenizer
+from spambayes.Options import options
+
+# We borrow the test messages that other tests use.
+from test_sb_server import good1, spam1, malformed1
+from test_tokencache import msg1, msg2
+from test_reviewindex import classified
+
+BUDGET_OPTIONS = ("x-part_byte_budget", "x-body_byte_budget",
+                  "x-token_budget")
+
+def make_message(encoding="7bit"):
+    """Return a message with two text parts, each of a thousand words
+    (word0 to word999 and other0 to other999), in the given encoding."""
+    first = " ".join(["word%d" % i for i in range(1000)]) + "\n"
+    second = " ".join(["other%d" % i for i in range(1000)]) + "\n"
+    if encoding == "base64":
+        first = first.encode("base64")
+        second = second.encode("base64")
+    elif encoding == "quoted-printable":
+        first = first.encode("quopri")
+        second = second.encode("quopri")
+    return ("From: someone@example.com\n"
+            "Subject: budget\n"
+            "MIME-Version: 1.0\n"
+            "Content-Type: multipart/mixed; boundary=\"xyzzy\"\n\n"
+            "--xyzzy\n"
+            "Content-Type: text/plain\n"
+            "Content-Transfer-Encoding: %s\n\n%s\n"
+            "--xyzzy\n"
+            "Content-Type: text/plain\n"
+            "Content-Transfer-Encoding: %s\n\n%s\n"
+            "--xyzzy--\n" % (encoding, first, encoding, second))
+
+class BudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = {}
+        for opt in BUDGET_OPTIONS:
+            self.saved[opt] = options["Tokenizer", opt]
+
+    def tearDown(self):
+        for opt, value in self.saved.items():
+            options["Tokenizer", opt] = value
+
+    def tokens(self, encoding="7bit"):
+        return list(tokenizer.tokenize(make_message(encoding)))
+
+    def budgetless_tokens(self):
+        for opt in BUDGET_OPTIONS:
+            options["Tokenizer", opt] = 0
+        return self.tokens()
+
+    def test_no_budget(self):
+        tokens = self.tokens()
+        self.assert_("word999" in tokens)
+        self.assert_("other999" in tokens)
+        for token in tokenizer.TRUNCATED_TOKENS:
+            self.assert_(token not in tokens)
+
+    def test_part_budget(self):
+        for encoding in ("7bit", "base64", "quoted-printable"):
+            options["Tokenizer", "x-part_byte_budget"] = 100
+            tokens = self.tokens(encoding)
+            self.assertEqual(tokens.count("control: part truncated"), 2)
+            self.assert_("word1" in tokens)
+            self.assert_("other1" in tokens)
+            self.assert_("word999" not in tokens)
+            self.assert_("other999" not in tokens)
+            self.assert_("control: body truncated" not in tokens)
+
+    def test_part_budget_not_reached(self):
+        options["Tokenizer", "x-part_byte_budget"] = 100000
+        self.assertEqual(self.tokens(), self.budgetless_tokens())
+
+    def test_body_budget(self):
+        options["Tokenizer", "x-body_byte_budget"] = 100
+        tokens = self.tokens("base64")
+        self.assertEqual(tokens.count("control: body truncated"), 1)
+        self.assert_("word1" in tokens)
+        self.assert_("other1" not in tokens)
+        # The headers are all still there.
+        self.assert_("subject:budget" in tokens)
+
+    def test_body_budget_second_part(self):
+        # The first part (of 7891 bytes) fits, but not all of the second.
+        options["Tokenizer", "x-body_byte_budget"] = 8000
+        tokens = self.tokens()
+        self.assertEqual(tokens.count("control: body truncated"), 1)
+        self.assert_("word999" in tokens)
+        self.assert_("other1" in tokens)
+        self.assert_("other999" not in tokens)
+
+    def test_body_budget_exhausted(self):
+        # The first part uses up all of the budget, so the second is
+        # skipped entirely.
+        options["Tokenizer", "x-part_byte_budget"] = 100
+        options["Tokenizer", "x-body_byte_budget"] = 100
+        tokens = self.tokens()
+        self.assertEqual(tokens.count("control: part truncated"), 1)
+        self.assertEqual(tokens.count("control: body truncated"), 1)
+        self.assert_("other1" not in tokens)
+
+    def test_token_budget(self):
+        options["Tokenizer", "x-token_budget"] = 50
+        tokens = self.tokens()
+        self.assertEqual(len(tokens), 51)
+        self.assertEqual(tokens[-1], "control: tokens truncated")
+        self.assertEqual(tokens[:50], self.budgetless_tokens()[:50])
+
+    def test_dns_questions(self):
+        saved = (options["Tokenizer", "x-lookup_ip"],
+                 options["Tokenizer", "x-pick_apart_urls"])
+        try:
+            options["Tokenizer", "x-lookup_ip"] = True
+            options["Tokenizer", "x-pick_apart_urls"] = True
+            options["Tokenizer", "x-part_byte_budget"] = 100
+            msg = tokenizer.get_message("Subject: hosts\n\n%s\n"
+                                        "http://www.example.com/\n" %
+                                        ("x" * 200,))
+            self.assertEqual(tokenizer.dns_questions(msg), [])
+        finally:
+            (options["Tokenizer", "x-lookup_ip"],
+             options["Tokenizer", "x-pick_apart_urls"]) = saved
+
+html1 = """From: "Sales" <sales@example.com>
+To: someone@example.org, someone.else@example.org
+Subject: Your ORDER &#65; is ready
+MIME-Version: 1.0
+Content-Type: multipart/alternative; boundary="==alt"
+
+--==alt
+Content-Type: text/plain; charset="us-ascii"
+
+Your order is ready.  See http://www.example.com/orders?id=42&x=%41%42
+or write to orders@example.com.  Thanks, Sales.
+
+--==alt
+Content-Type: text/html; charset="us-ascii"
+Content-Transfer-Encoding: quoted-printable
+
+<HTML><HEAD><STYLE type=3D"text/css">body { color: red }</STYLE></HEAD>
+<BODY>Your&nbsp;order<BR>is<p>ready.<!-- a comment with http://hidden.exam=
+ple.com/page in it --> See <A HREF=3D"http://www.example.com/orders">your
+orders</A>.<comment>old style comment</COMMENT>
+<noframes>no frames here</noframes><script>evil()</script>
+<iframe src=3Dcid:part1 height=3D0 width=3D"0"></iframe>
+&#60;!-- an entity comment --&#62; &#87;&#111;rds &#999; &#x41;
+<http://example.com/ style>hidden by a style</style> after the style
+<!-- never closed
+</BODY></HTML>
+
+--==alt--
+"""
+
+uuencoded1 = """From: someone@example.com
+Subject: a uuencoded file
+
+Here's the file.
+
+begin 644 money.txt
+M86)C9&5F9VAI:FML;6YO<'%R<W1U=G=X>7H*
+`
+end
+
+And some text after it, with <b>tags</b> & an ftp://ftp.example.com/pub.
+"""
+
+latin1 = """From: =?iso-8859-1?q?Andr=E9?= <andre@example.fr>
+Subject: =?iso-8859-1?q?Caf=E9_na=EFve?=
+MIME-Version: 1.0
+Content-Type: text/plain; charset="iso-8859-1"
+Content-Transfer-Encoding: 8bit
+
+Un caf\xe9 tr\xe8s na\xefve\xa0!  Control\x01characters\x02here.
+superlongwordthatgoesonandonandonforever andanotherlongwordhere123
+\xe9\xe8\xe0\xe9\xe8\xe0\xe9\xe8\xe0\xe9\xe8\xe0\xe9\xe8\xe0\xe9
+"""
+
+base64html = """From: someone@example.com
+Subject: encoded html
+MIME-Version: 1.0
+Content-Type: text/html
+Content-Transfer-Encoding: base64
+
+%s
+""" % ("<html><body><style>p {}</style><p>Base64 <b>HTML</b> with a "
+       "<a href='http://www.example.net/a/b.html'>link</a> and "
+       "<!-- secret -->text&nbsp;here.</body></html>\n").encode("base64")
+
+GOLDEN_MESSAGES = (("good1", good1), ("spam1", spam1),
+                   ("malformed1", malformed1), ("msg1", msg1),
+                   ("msg2", msg2), ("classified", classified),
+                   ("html1", html1), ("uuencoded1", uuencoded1),
+                   ("latin1", latin1), ("base64html", base64html))
+
+# The options for each set of golden tokens.  Only tokenizing options
+# that can be changed after the tokenizer module is imported are used.
+GOLDEN_OPTIONS = (("default", ()),
+                  ("variant", (("replace_nonascii_chars", True),
+                               ("x-pick_apart_urls", True),
+                               ("x-short_runs", True),
+                               ("generate_long_skips", False),
+                               ("mine_received_headers", True))))
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "tokenizer_golden.txt")
+
+def golden_tokens():
+    """Return a list of lines: for each set of golden options and each
+    golden message, a "== options message" line, followed by a line with
+    the repr of each of its tokens."""
+    lines = []
+    for options_name, values in GOLDEN_OPTIONS:
+        saved = []
+        for opt, value in values:
+            saved.append((opt, options["Tokenizer", opt]))
+            options["Tokenizer", opt] = value
+        try:
+            for name, msg in GOLDEN_MESSAGES:
+                lines.append("== %s %s" % (options_name, name))
+                for token in tokenizer.tokenize(msg):
+                    lines.append(repr(token))
+        finally:
+            for opt, value in saved:
+                options["Tokenizer", opt] = value
+    return lines
+
+def write_golden():
+    """Write the golden tokens file.  Only do this when a change to the
+    tokens is intended (and check the differences first)!"""
+    f = open(GOLDEN_FILE, "w")
+    f.write("\n".join(golden_tokens()) + "\n")
+    f.close()
+
+class GoldenTokensTest(unittest.TestCase):
+    # The tokens of a set of messages, with a couple of sets of options,
+    # must be exactly the ones in the golden file; changes to the
+    # tokenizer that are only meant to make it quicker must not change
+    # them.  Call write_golden() to make the file again if a change to
+    # the tokens is intended.
+    def test_golden(self):
+        f = open(GOLDEN_FILE)
+        expected = f.read().splitlines()
+        f.close()
+        actual = golden_tokens()
+        for i in range(min(len(expected), len(actual))):
+            if expected[i].startswith("== "):
+                section = expected[i]
+            self.assertEqual(actual[i], expected[i],
+                             "token %d differs (in %s)" % (i, section))
+        self.assertEqual(len(actual), len(expected))
+
+def suite():
+    suite = unittest.TestSuite()
+    for cls in (BudgetTest,
+                GoldenTokensTest,
+               ):
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
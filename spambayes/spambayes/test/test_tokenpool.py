@@ -0,0 +1,116 @@
+# Test the tokenpool module.
+
+import os
+import sys
+import unittest
+
+import sb_test_support
+sb_test_support.fix_sys_path()
+
+from spambayes import tokenpool, tokenizer, hammie, hammiebulk
+from spambayes.classifier import Classifier
+from spambayes.Options import options
+
+# We borrow the test messages that test_sb_server uses.
+from test_sb_server import good1, spam1, malformed1
+
+MESSAGES = [good1, spam1, malformed1] * 10
+
+def fail_on_spam(msg):
+    if msg.find("Make money fast") >= 0:
+        raise ValueError("spam!")
+    return tokenizer.tokenize(msg)
+
+def option_tokens(msg):
+    return [str(options["Tokenizer", "x-short_runs"])]
+
+class TokenizeManyTest(unittest.TestCase):
+    jobs = 1
+
+    def test_tokens(self):
+        result = list(tokenpool.tokenize_many(MESSAGES, self.jobs))
+        self.assertEqual([msg for msg, tokens in result], MESSAGES)
+        for msg, tokens in result:
+            self.assertEqual(tuple(tokens), tuple(tokenizer.tokenize(msg)))
+
+    def test_message(self):
+        items = [(i, MESSAGES[i]) for i in range(len(MESSAGES))]
+        def message(item):
+            i, msg = item
+            if i % 2:
+                return None
+            return msg
+        result = list(tokenpool.tokenize_many(items, self.jobs, message))
+        self.assertEqual([item for item, tokens in result], items)
+        for (i, msg), tokens in result:
+            if i % 2:
+                self.assertEqual(tokens, None)
+            else:
+                self.assertEqual(tuple(tokens),
+                                 tuple(tokenizer.tokenize(msg)))
+
+    def test_error(self):
+        result = tokenpool.tokenize_many(MESSAGES, self.jobs, None,
+                                         fail_on_spam)
+        self.assertEqual(result.next()[0], good1)
+        self.assertRaises(ValueError, result.next)
+
+    def test_options(self):
+        saved = options["Tokenizer", "x-short_runs"]
+        try:
+            options["Tokenizer", "x-short_runs"] = not saved
+            result = tokenpool.tokenize_many([good1], self.jobs, None,
+                                             option_tokens)
+            self.assertEqual(list(result.next()[1]), [str(not saved)])
+        finally:
+            options["Tokenizer", "x-short_runs"] = saved
+
+    def test_hammiebulk(self):
+        mbox = "tokenpool_test.mbox"
+        f = open(mbox, "w")
+        for msg in MESSAGES:
+            f.write("From test@example.com Mon Jan  1 00:00:00 2007\n")
+            f.write(msg)
+            f.write("\n")
+        f.close()
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, "w")
+            h1 = hammie.Hammie(Classifier(), "c")
+            h2 = hammie.Hammie(Classifier(), "c")
+            hammiebulk.train(h1, mbox, True)
+            hammiebulk.train(h2, mbox, True, self.jobs)
+            hammiebulk.untrain(h2, mbox, True, self.jobs)
+            hammiebulk.train(h2, mbox, True, self.jobs)
+        finally:
+            sys.stdout = stdout
+            os.remove(mbox)
+        self.assertEqual(h1.bayes.nspam, len(MESSAGES))
+        self.assertEqual(h2.bayes.nspam, len(MESSAGES))
+        self.assertEqual(h1.bayes.nham, h2.bayes.nham)
+        self.assertEqual(sorted(h1.bayes.wordinfo.keys()),
+                         sorted(h2.bayes.wordinfo.keys()))
+        for word, record in h1.bayes.wordinfo.items():
+            self.assertEqual(h2.bayes.wordinfo[word].spamcount,
+                             record.spamcount)
+            self.assertEqual(h2.bayes.wordinfo[word].hamcount,
+                             record.hamcount)
+
+class TokenizeManyWorkersTest(TokenizeManyTest):
+    jobs = 3
+
+def suite():
+    suite = unittest.TestSuite()
+    clses = (TokenizeManyTest,
+             )
+    if tokenpool.multiprocessing is not None:
+        clses += (TokenizeManyWorkersTest,)
+    else:
+        print "Skipping tokenpool worker tests, multiprocessing is not " \
+              "available"
+    for cls in clses:
+        suite.addTest(unittest.makeSuite(cls))
+    return suite
+
+if __name__=='__main__':
+    sb_test_support.unittest_main(argv=sys.argv + ['suite'])
@@ -0,0 +1,319 @@
+"""A cache of the tokens generated for each message.
+
+Tokenizing is the most expensive part of scoring or training on a
+message, and the same message is often tokenized several times: when it
+is scored as it is retrieved, again when it is trained on (perhaps after
+being scored by a separate filter run), and again for every training
+round of contrib/tte.py.  A TokenCache remembers the tokens of recently
+seen messages so that this only needs to be done once.
+
+Entries are keyed by an md5 digest of the message text together with the
+tokenizer options, so changing the options never returns stale tokens.
+The headers that SpamBayes adds to a message are left out of the text
+(when the options are such that they make no difference to the tokens),
+so that a message that is scored, and later trained on from the review
+page with the headers added, is only tokenized once.
+
+The cache holds at most a fixed number of messages in memory (dropping
+the least recently used ones), and may also keep the tokens of messages
+in a dbm file so that they survive from one run to the next.  Each entry
+in the file is marked with the generation it was written (or last used)
+in; a new generation is started after every half of the file's limit of
+messages, and then the entries from before the previous generation are
+removed, so the file holds at most about that many messages.
+
+The shared cache is configured by the Tokenizer token_cache_size,
+token_cache and token_cache_file_size options; it is off by default.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import os
+import re
+import sys
+import atexit
+import struct
+import marshal
+import threading
+
+from spambayes import tokenizer
+from spambayes import dbmstorage
+from spambayes.port import md5
+from spambayes.lrucache import LRUCache
+from spambayes.Options import options
+
+# The options that say where other caches are kept make no difference to
+# the tokens, so changing them shouldn't make the cache useless.
+_ignored_options = ("lookup_ip_cache", "crack_image_cache",
+                    "x-lookup_ip_budget", "x-lookup_ip_threads",
+                    "ocr_threads", "ocr_timeout",
+                    "token_cache", "token_cache_size",
+                    "token_cache_file_size",
+                    "x-cache_directory", "x-cache_expiry_days")
+
+_tokenizer_options = None
+
+def options_digest():
+    """Return a digest of the options that the tokenizer uses."""
+    global _tokenizer_options
+    # This is done for every message, so look the options up only once.
+    if _tokenizer_options is None:
+        _tokenizer_options = []
+        for sect in ("Tokenizer", "URLRetriever"):
+            for opt in options.options_in_section(sect):
+                if opt not in _ignored_options:
+                    _tokenizer_options.append(options.get_option(sect, opt))
+    return md5(repr([opt.get() for opt in _tokenizer_options])).digest()
+
+# Changed whenever the keys or the stored form of the tokens change, so
+# that a file from an older version is never misread.
+_FORMAT = "2"
+
+# The key, in a token cache file, of the current generation and the
+# number of entries written in it (which can't be confused with an md5
+# digest).
+_STATE_KEY = "generation"
+
+def _sb_header_names():
+    return [options["Headers", name].lower() for name in
+            ("classification_header_name", "mailid_header_name",
+             "thermostat_header_name", "evidence_header_name",
+             "score_header_name", "trained_header_name")] + \
+           [options["Headers", "classification_header_name"].lower() +
+            "-id"]
+
+_ignored_headers = (None, None)
+
+def ignored_headers():
+    """Return the (lower case) names of the headers that SpamBayes adds
+    to messages, if the tokenizer options are such that the tokens are
+    the same with or without them, and otherwise an empty list."""
+    global _ignored_headers
+    # This is done for every message, so only work it out again when
+    # the options change.
+    compiled = options.compiled
+    if _ignored_headers[0] is compiled:
+        return _ignored_headers[1]
+    names = _sb_header_names()
+    tok = compiled.Tokenizer
+    if tok.count_all_header_lines:
+        ignored = []
+    else:
+        ignored = names
+        for name in names:
+            if name in tok.safe_headers or name in tok.address_headers:
+                ignored = []
+                break
+            if tok.basic_header_tokenize:
+                for skip in tok.basic_header_skip:
+                    if re.match(skip, name):
+                        break
+                else:
+                    ignored = []
+                    break
+    _ignored_headers = (compiled, ignored)
+    return ignored
+
+def strip_headers(text, names):
+    """Return the text of a message without the headers with the given
+    (lower case) names."""
+    # end is just after the line ending of the last header.
+    end = text.find("\n\n")
+    if end != -1:
+        end += 1
+    crlf_end = text.find("\r\n\r\n")
+    if crlf_end != -1 and (end == -1 or crlf_end + 2 < end):
+        end = crlf_end + 2
+    if end == -1:
+        end = len(text)
+    headers = text[:end].lower()
+    for name in names:
+        if name + ":" in headers:
+            break
+    else:
+        # The usual case: there are none.
+        return text
+    lines = text[:end].splitlines(True)
+    kept = []
+    skipping = False
+    for line in lines:
+        if line[:1] in (" ", "\t"):
+            # A continuation of the previous header.
+            if not skipping:
+                kept.append(line)
+            continue
+        skipping = line.split(":", 1)[0].strip().lower() in names
+        if not skipping:
+            kept.append(line)
+    return "".join(kept) + text[end:]
+
+def _message_text(obj):
+    """Return (text, obj) for something that tokenize() accepts.  text
+    is None if the text of the message can't be found, in which case
+    it can't be cached."""
+    if hasattr(obj, "read"):
+        obj = obj.read()
+    if isinstance(obj, str):
+        return obj, obj
+    try:
+        return obj.as_string(), obj
+    except (TypeError, LookupError, AttributeError):
+        # Broken messages can confuse the generator.
+        return None, obj
+
+class TokenCache(object):
+    def __init__(self, maxsize, filename="", filesize=0):
+        '''Constructor(number of messages to keep in memory,
+        name of dbm file to keep tokens in, or "" for none,
+        number of messages to keep in the file, or 0 for no limit)'''
+        self.cache = LRUCache(maxsize)
+        self.filename = filename and os.path.expanduser(filename)
+        self.filesize = filesize
+        self.generation = self.written = 0
+        if self.filename:
+            self.db = dbmstorage.open(self.filename, "c")
+            if self.db.has_key(_STATE_KEY):
+                self.generation, self.written = \
+                                 marshal.loads(self.db[_STATE_KEY])
+        else:
+            self.db = None
+        self.hits = self.disk_hits = self.misses = 0
+        # Messages may be tokenized in several threads at once (by the
+        # POP3 proxy, for example); the tokenizing is done outside the
+        # lock, but neither the LRUCache nor a dbm file may be used by
+        # two threads together.
+        self.lock = threading.Lock()
+
+    def close(self):
+        if options["globals", "verbose"]:
+            print >> sys.stderr, "token cache:", self.stats_string()
+        self.lock.acquire()
+        try:
+            if self.db is not None:
+                self.db[_STATE_KEY] = marshal.dumps((self.generation,
+                                                     self.written))
+                self.db.close()
+                self.db = None
+        finally:
+            self.lock.release()
+
+    def key(self, text):
+        """Return the cache key for the message text."""
+        names = ignored_headers()
+        if names:
+            text = strip_headers(text, names)
+        return md5(_FORMAT + options_digest() + text).digest()
+
+    def _store(self, key, tokens):
+        # Put the tokens in the file, in the current generation.  The
+        # lock must be held.
+        self.db[key] = struct.pack("<i", self.generation) + \
+                       marshal.dumps(tokens)
+        self.written += 1
+        if self.filesize and self.written >= max(self.filesize // 2, 1):
+            self.generation += 1
+            self.written = 0
+            self._prune()
+            self.db[_STATE_KEY] = marshal.dumps((self.generation,
+                                                 self.written))
+
+    def _prune(self):
+        # Remove the entries from before the previous generation (and
+        # any that can't be read).  The lock must be held.
+        for key in self.db.keys():
+            if key == _STATE_KEY:
+                continue
+            value = self.db[key]
+            if len(value) < 4 or not self.generation - 1 <= \
+               struct.unpack("<i", value[:4])[0] <= self.generation:
+                del self.db[key]
+
+    def tokenize(self, obj):
+        """Return the tokens for obj (a string, file or Message object,
+        as for tokenizer.tokenize) as a tuple."""
+        text, obj = _message_text(obj)
+        if text is None:
+            self.misses += 1
+            return tuple(tokenizer.tokenize(obj))
+        key = self.key(text)
+        self.lock.acquire()
+        try:
+            tokens = self.cache.get(key)
+            if tokens is not None:
+                self.hits += 1
+                return tokens
+            if self.db is not None and self.db.has_key(key):
+                value = self.db[key]
+                tokens = marshal.loads(value[4:])
+                self.hits += 1
+                self.disk_hits += 1
+                self.cache[key] = tokens
+                if struct.unpack("<i", value[:4])[0] != self.generation:
+                    # Keep it, as it's still being used.
+                    self._store(key, tokens)
+                return tokens
+        finally:
+            self.lock.release()
+        tokens = tuple(tokenizer.tokenize(obj))
+        self.lock.acquire()
+        try:
+            self.misses += 1
+            if self.db is not None:
+                self._store(key, tokens)
+            self.cache[key] = tokens
+        finally:
+            self.lock.release()
+        return tokens
+
+    def stats(self):
+        """Return a dictionary of the cache statistics."""
+        lookups = self.hits + self.misses
+        if lookups:
+            hit_rate = float(self.hits) / lookups
+        else:
+            hit_rate = 0.0
+        return {"hits" : self.hits,
+                "disk_hits" : self.disk_hits,
+                "misses" : self.misses,
+                "evictions" : self.cache.evictions,
+                "size" : len(self.cache),
+                "hit_rate" : hit_rate,
+                }
+
+    def stats_string(self):
+        stats = self.stats()
+        stats["hit_rate"] *= 100
+        return "%(hits)d hits (%(disk_hits)d from disk), %(misses)d " \
+               "misses, %(hit_rate).2f%% hit rate" % stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the shared TokenCache, or None if the token cache is
+    disabled."""
+    global _cache
+    maxsize = options["Tokenizer", "token_cache_size"]
+    if maxsize <= 0:
+        return None
+    _cache_lock.acquire()
+    try:
+        if _cache is None:
+            _cache = TokenCache(maxsize, options["Tokenizer", "token_cache"],
+                                options["Tokenizer", "token_cache_file_size"])
+            atexit.register(_cache.close)
+        else:
+            _cache.cache.maxsize = maxsize
+    finally:
+        _cache_lock.release()
+    return _cache
+
+def tokenize(obj):
+    """Like tokenizer.tokenize, but using the shared cache if it is
+    enabled."""
+    cache = get_cache()
+    if cache is None:
+        return tokenizer.tokenize(obj)
+    return cache.tokenize(obj)
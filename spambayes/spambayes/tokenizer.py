@@ -9,6 +9,7 @@ import email.Header
 import email.Utils
 import email.Errors
 import re
+import copy
 import math
 import os
 import binascii
@@ -29,6 +30,9 @@ except (IOError, ImportError):
         @staticmethod
         def lookup(*args):
             return []
+        @staticmethod
+        def prefetch(*args):
+            pass
 else:
     import atexit
     atexit.register(cache.close)
@@ -613,6 +617,32 @@ def textparts(msg):
     return set(filter(lambda part: part.get_content_maintype() == 'text',
                       msg.walk()))
 
+# The tokens generated when a message is cut short by the tokenizing
+# budget (the x-part_byte_budget, x-body_byte_budget and x-token_budget
+# options).
+TRUNCATED_TOKENS = ("control: part truncated",
+                    "control: body truncated",
+                    "control: tokens truncated")
+
+def decoded_prefix(part, size):
+    """Return part's payload decoded, as part.get_payload(decode=True)
+    does, but if size is given, decode only enough of a large payload for
+    the result to have at least size bytes (it may have more)."""
+    payload = part.get_payload()
+    # An encoded byte takes at most three characters (quoted-printable
+    # '=XX'), so four times as many undecoded characters are plenty.
+    cut = size * 4
+    if size and isinstance(payload, str) and len(payload) > cut:
+        # Keep whole lines, so that base64 decodes cleanly.
+        newline = payload.rfind("\n", 0, cut)
+        if newline > 0:
+            cut = newline + 1
+        else:
+            cut -= cut % 4
+        part = copy.copy(part)
+        part.set_payload(payload[:cut])
+    return part.get_payload(decode=True)
+
 def octetparts(msg):
     """Return a set of all msg parts with type 'application/octet-stream'."""
     return set(filter(lambda part:
@@ -716,7 +746,7 @@ def tokenize_word(word, _len=len, maxword=options["Tokenizer",
             # rate, but is neutral for the f-p rate.  I don't know why!
             # XXX Figure out why, and/or see if some other way of summarizing
             # XXX this info has greater benefit.
-            if options["Tokenizer", "generate_long_skips"]:
+            if options.compiled.Tokenizer.generate_long_skips:
                 yield "skip:%c %d" % (word[0], n // 10 * 10)
             if has_highbit_char(word):
                 hicount = 0
@@ -824,6 +854,15 @@ del i, ch
 
 non_ascii_translate_tab = ''.join(non_ascii_translate_tab)
 
+# Every character, to build tables from (see lower_non_ascii_table()).
+all_chars = ''.join(map(chr, range(256)))
+
+def lower_non_ascii_table():
+    """Return a string.translate table that does what lower() followed
+    by translating with non_ascii_translate_tab does, in one pass.  This
+    is made afresh each time, since lower() depends on the locale."""
+    return all_chars.lower().translate(non_ascii_translate_tab)
+
 
 def crack_content_xyz(msg):
     yield 'content-type:' + msg.get_content_type()
@@ -1053,7 +1092,8 @@ class URLStripper(Stripper):
         tokens = ["proto:" + proto]
         pushclue = tokens.append
 
-        if options["Tokenizer", "x-pick_apart_urls"]:
+        compiled = options.compiled.Tokenizer
+        if compiled.x_pick_apart_urls:
             url = proto + "://" + guts
 
             escapes = re.findall(r'%..', guts)
@@ -1074,7 +1114,7 @@ class URLStripper(Stripper):
             except ValueError:
                 pushclue("url:invalid-url")
             else:
-                if options["Tokenizer", "x-lookup_ip"]:
+                if compiled.x_lookup_ip:
                     ips = cache.lookup(netloc)
                     if not ips:
                         pushclue("url-ip:lookup error")
@@ -1196,12 +1236,30 @@ crack_noframes = NoframesStripper().analyze
 # src=cid:
 # height=0  width=0
 
+#
+# virus_re finds the same things as
+#     < /? \s* (?: script | iframe) \b
+# |   \b src= ['"]? cid:
+# |   \b (?: height | width) = ['"]? 0
+# but each alternative starts by matching its first character, so that
+# the regexp engine can skip quickly over text where no match can start
+# (the lookbehinds check which alternative that character was for, and
+# do what \b did).
 virus_re = re.compile(r"""
-    < /? \s* (?: script | iframe) \b
-|   \b src= ['"]? cid:
-|   \b (?: height | width) = ['"]? 0
+    [<shw]
+    (?: (?<=<) /? \s* (?: script | iframe) \b
+    |   (?<!\ws) (?<=s) rc= ['"]? cid:
+    |   (?<!\wh) (?<=h) eight= ['"]? 0
+    |   (?<!\ww) (?<=w) idth= ['"]? 0
+    )
 """, re.VERBOSE)                        # '
 
+# Just the tags that virus_re finds, for text without any of the
+# attributes that it looks for.
+virus_tag_re = re.compile(r"""
+    < /? \s* (?: script | iframe) \b
+""", re.VERBOSE)
+
 def find_html_virus_clues(text):
     for bingo in virus_re.findall(text):
         yield bingo
@@ -1224,6 +1282,55 @@ breaking_entity_re = re.compile(r"""
     >
 """, re.VERBOSE)
 
+# Crack a lower-cased body part: find the virus clues, strip out (and
+# tokenize) uuencoded sections, URLs, <style>, comments and <noframes>,
+# and remove breaking entities and HTML tags, in that order.  Each of
+# these scans the whole of the text, but most parts contain few of the
+# constructs that they look for, or none (plain text has no tags, for a
+# start).  So crack_body() checks, with quick substring searches, for a
+# string that each construct must contain, and skips the scans that
+# can't find anything.  It doesn't try to find all the constructs in a
+# single scan:  each step works on the text left by the one before (for
+# example, "<http://example.com/ style>" only becomes a <style> tag once
+# the URL is stripped), and the results must be exactly the same as
+# doing every step.  Returns (text, tokens).
+def crack_body(text):
+    tokens = []
+    if "src=" in text or "height=" in text or "width=" in text:
+        clues = virus_re.findall(text)
+    elif "<" in text:
+        clues = virus_tag_re.findall(text)
+    else:
+        clues = ()
+    for clue in clues:
+        tokens.append("virus:" + clue)
+
+    crackers = [crack_urls]
+    if "begin" in text:
+        crackers.insert(0, crack_uuencode)
+    if "<" in text:
+        crackers.extend([crack_html_style, crack_html_comment,
+                         crack_noframes])
+    for cracker in crackers:
+        text, cracker_tokens = cracker(text)
+        tokens.extend(cracker_tokens)
+
+    # Remove HTML/XML tags.  Also &nbsp;.  <br> and <p> tags should
+    # create a space too.
+    has_tag = "<" in text
+    if has_tag or "&nbsp;" in text:
+        text = breaking_entity_re.sub(' ', text)
+    # It's important to eliminate HTML tags rather than, e.g.,
+    # replace them with a blank (as this code used to do), else
+    # simple tricks like
+    #    Wr<!$FS|i|R3$s80sA >inkle Reduc<!$FS|i|R3$s80sA >tion
+    # can be used to disguise words.  <br> and <p> were special-
+    # cased just above (because browsers break text on those,
+    # they can't be used to hide words effectively).
+    if has_tag:
+        text = html_re.sub('', text)
+    return text, tokens
+
 class Tokenizer:
 
     date_hms_re = re.compile(r' (?P<hour>[0-9][0-9])'
@@ -1258,13 +1365,21 @@ class Tokenizer:
 
     def tokenize(self, obj):
         msg = self.get_message(obj)
-
-        for tok in self.tokenize_headers(msg):
-            yield tok
-        for tok in self.tokenize_body(msg):
-            yield tok
+        prefetch_dns(msg)
+
+        budget = options.compiled.Tokenizer.x_token_budget
+        count = 0
+        for tokens in (self.tokenize_headers(msg), self.tokenize_body(msg)):
+            for tok in tokens:
+                if budget and count >= budget:
+                    yield "control: tokens truncated"
+                    return
+                count += 1
+                yield tok
 
     def tokenize_headers(self, msg):
+        compiled = options.compiled.Tokenizer
+
         # Special tagging of header lines and MIME metadata.
 
         # Content-{Type, Disposition} and their params, and charsets.
@@ -1294,7 +1409,7 @@ class Tokenizer:
         # times, several headers with date/time information will become
         # the best discriminators.
         # (Not just Date, but Received and X-From_.)
-        if options["Tokenizer", "basic_header_tokenize"]:
+        if compiled.basic_header_tokenize:
             for k, v in msg.items():
                 k = k.lower()
                 for rx in self.basic_skip:
@@ -1305,11 +1420,11 @@ class Tokenizer:
                     for w in subject_word_re.findall(v):
                         for t in tokenize_word(w):
                             yield "%s:%s" % (k, t)
-            if options["Tokenizer", "basic_header_tokenize_only"]:
+            if compiled.basic_header_tokenize_only:
                 return
 
         # Habeas Headers - see http://www.habeas.com
-        if options["Tokenizer", "x-search_for_habeas_headers"]:
+        if compiled.x_search_for_habeas_headers:
             habeas_headers = [
 ("X-Habeas-SWE-1", "winter into spring"),
 ("X-Habeas-SWE-2", "brightly anticipated"),
@@ -1326,7 +1441,7 @@ class Tokenizer:
             for opt, val in habeas_headers:
                 habeas = msg.get(opt)
                 if habeas is not None:
-                    if options["Tokenizer", "x-reduce_habeas_headers"]:
+                    if compiled.x_reduce_habeas_headers:
                         if habeas == val:
                             valid_habeas += 1
                         else:
@@ -1336,7 +1451,7 @@ class Tokenizer:
                             yield opt.lower() + ":valid"
                         else:
                             yield opt.lower() + ":invalid"
-            if options["Tokenizer", "x-reduce_habeas_headers"]:
+            if compiled.x_reduce_habeas_headers:
                 # If there was any invalid line, we record as invalid.
                 # If all nine lines were correct, we record as valid.
                 # Otherwise we ignore.
@@ -1376,7 +1491,7 @@ class Tokenizer:
         #               # not significant), so leaving it out
         # To:, Cc:      # These can help, if your ham and spam are sourced
         #               # from the same location. If not, they'll be horrible.
-        for field in options["Tokenizer", "address_headers"]:
+        for field in compiled.address_headers:
             addrlist = msg.get_all(field, [])
             if not addrlist:
                 yield field + ":none"
@@ -1419,7 +1534,7 @@ class Tokenizer:
         # to yield a final token value of "pfxlen:04".  The length test
         # eliminates the bad case where the message was sent to a single
         # individual.
-        if options["Tokenizer", "summarize_email_prefixes"]:
+        if compiled.summarize_email_prefixes:
             all_addrs = []
             addresses = msg.get_all('to', []) + msg.get_all('cc', [])
             for name, addr in email.Utils.getaddresses(addresses):
@@ -1446,7 +1561,7 @@ class Tokenizer:
         #   To: "skip" <bugs@mojam.com>, <chris@mojam.com>,
         #       <concertmaster@mojam.com>, <concerts@mojam.com>,
         #       <design@mojam.com>, <rob@mojam.com>, <skip@mojam.com>
-        if options["Tokenizer", "summarize_email_suffixes"]:
+        if compiled.summarize_email_suffixes:
             all_addrs = []
             addresses = msg.get_all('to', []) + msg.get_all('cc', [])
             for name, addr in email.Utils.getaddresses(addresses):
@@ -1493,7 +1608,7 @@ class Tokenizer:
 
         # Received:
         # Neil Schemenauer reports good results from this.
-        if options["Tokenizer", "mine_received_headers"]:
+        if compiled.mine_received_headers:
             for header in msg.get_all("received", ()):
                 # everything here should be case insensitive and not be
                 # split across continuation lines, so normalize whitespace
@@ -1513,7 +1628,7 @@ class Tokenizer:
         # Lots of spam gets posted on Usenet.  If it is then gatewayed to a
         # mailing list perhaps the NNTP-Posting-Host info will yield some
         # useful clues.
-        if options["Tokenizer", "x-mine_nntp_headers"]:
+        if compiled.x_mine_nntp_headers:
             for clue in mine_nntp(msg):
                 yield clue
 
@@ -1533,7 +1648,7 @@ class Tokenizer:
         # For example, all-caps SUBJECT is a strong spam clue, while
         # X-Complaints-To a strong ham clue.
         x2n = {}
-        if options["Tokenizer", "count_all_header_lines"]:
+        if compiled.count_all_header_lines:
             for x in msg.keys():
                 x2n[x] = x2n.get(x, 0) + 1
         else:
@@ -1541,15 +1656,15 @@ class Tokenizer:
             # collected from different sources, the count of some header
             # lines can be a too strong a discriminator for accidental
             # reasons.
-            safe_headers = options["Tokenizer", "safe_headers"]
+            safe_headers = compiled.safe_headers
             for x in msg.keys():
                 if x.lower() in safe_headers:
                     x2n[x] = x2n.get(x, 0) + 1
         for x in x2n.items():
             yield "header:%s:%d" % x
-        if options["Tokenizer", "record_header_absence"]:
+        if compiled.record_header_absence:
             for k in x2n:
-                if not k.lower() in options["Tokenizer", "safe_headers"]:
+                if not k.lower() in compiled.safe_headers:
                     yield "noheader:" + k
 
     def tokenize_text(self, text, maxword=options["Tokenizer",
@@ -1577,7 +1692,7 @@ class Tokenizer:
                 elif n >= 3:
                     for t in tokenize_word(w):
                         yield t
-        if short_runs and options["Tokenizer", "x-short_runs"]:
+        if short_runs and options.compiled.Tokenizer.x_short_runs:
             yield "short:%d" % int(log2(max(short_runs)))
 
     def tokenize_body(self, msg):
@@ -1587,8 +1702,9 @@ class Tokenizer:
         undecoded characters of application/octet-stream parts of the
         message body become tokens.
         """
+        compiled = options.compiled.Tokenizer
 
-        if options["Tokenizer", "check_octets"]:
+        if compiled.check_octets:
             # Find, decode application/octet-stream parts of the body,
             # tokenizing the first few characters of each chunk.
             for part in octetparts(msg):
@@ -1602,11 +1718,10 @@ class Tokenizer:
                     yield "control: octet payload is None"
                     continue
 
-                yield "octet:%s" % text[:options["Tokenizer",
-                                                 "octet_prefix_size"]]
+                yield "octet:%s" % text[:compiled.octet_prefix_size]
 
         parts = imageparts(msg)
-        if options["Tokenizer", "image_size"]:
+        if compiled.image_size:
             # Find image/* parts of the body, calculating the log(size) of
             # each image.
 
@@ -1625,8 +1740,8 @@ class Tokenizer:
             if total_len:
                 yield "image-size:2**%d" % round(log2(total_len))
 
-        if options["Tokenizer", "crack_images"]:
-            engine_name = options["Tokenizer", 'ocr_engine']
+        if compiled.crack_images:
+            engine_name = compiled.ocr_engine
             from spambayes.ImageStripper import crack_images
             text, tokens = crack_images(engine_name, parts)
             for t in tokens:
@@ -1634,11 +1749,28 @@ class Tokenizer:
             for t in self.tokenize_text(text):
                 yield t
 
-        # Find, decode (base64, qp), and tokenize textual parts of the body.
-        for part in textparts(msg):
+        # Find, decode (base64, qp), and tokenize textual parts of the body,
+        # in order, as far as the tokenizing budget allows.
+        part_budget = compiled.x_part_byte_budget
+        # The bytes of the body budget left, or None if there isn't one.
+        remaining = compiled.x_body_byte_budget or None
+        body_truncated = False
+        parts = textparts(msg)
+        for part in msg.walk():
+            if part not in parts:
+                continue
+            limit = part_budget
+            if remaining is not None:
+                if remaining <= 0:
+                    if not body_truncated:
+                        yield "control: body truncated"
+                    break
+                if not limit or remaining < limit:
+                    limit = remaining
+
             # Decode, or take it as-is if decoding fails.
             try:
-                text = part.get_payload(decode=True)
+                text = decoded_prefix(part, limit)
             except:
                 yield "control: couldn't decode"
                 text = part.get_payload(decode=False)
@@ -1649,42 +1781,33 @@ class Tokenizer:
                 yield 'control: payload is None'
                 continue
 
+            if limit and len(text) > limit:
+                text = text[:limit]
+                if limit == part_budget:
+                    yield "control: part truncated"
+                else:
+                    yield "control: body truncated"
+                    body_truncated = True
+            if remaining is not None:
+                remaining -= len(text)
+
             # Replace numeric character entities (like &#97; for the letter
             # 'a').
-            text = numeric_entity_re.sub(numeric_entity_replacer, text)
+            if "&#" in text:
+                text = numeric_entity_re.sub(numeric_entity_replacer, text)
 
-            # Normalize case.
-            text = text.lower()
+            # Normalize case, and if the option is set, replace high-bit
+            # chars and control chars with '?', in the same pass.
+            if compiled.replace_nonascii_chars:
+                text = text.translate(lower_non_ascii_table())
+            else:
+                text = text.lower()
 
-            if options["Tokenizer", "replace_nonascii_chars"]:
-                # Replace high-bit chars and control chars with '?'.
-                text = text.translate(non_ascii_translate_tab)
-
-            for t in find_html_virus_clues(text):
-                yield "virus:%s" % t
-
-            # Get rid of uuencoded sections, embedded URLs, <style gimmicks,
-            # and HTML comments.
-            for cracker in (crack_uuencode,
-                            crack_urls,
-                            crack_html_style,
-                            crack_html_comment,
-                            crack_noframes):
-                text, tokens = cracker(text)
-                for t in tokens:
-                    yield t
-
-            # Remove HTML/XML tags.  Also &nbsp;.  <br> and <p> tags should
-            # create a space too.
-            text = breaking_entity_re.sub(' ', text)
-            # It's important to eliminate HTML tags rather than, e.g.,
-            # replace them with a blank (as this code used to do), else
-            # simple tricks like
-            #    Wr<!$FS|i|R3$s80sA >inkle Reduc<!$FS|i|R3$s80sA >tion
-            # can be used to disguise words.  <br> and <p> were special-
-            # cased just above (because browsers break text on those,
-            # they can't be used to hide words effectively).
-            text = html_re.sub('', text)
+            # Find virus clues, get rid of uuencoded sections, embedded URLs,
+            # <style gimmicks, and HTML comments, and remove HTML tags.
+            text, tokens = crack_body(text)
+            for t in tokens:
+                yield t
 
             for t in self.tokenize_text(text):
                 yield t
@@ -1725,6 +1848,74 @@ def mine_nntp(msg):
                 if cache.lookup(addresses[0], qType="PTR") == name:
                     yield 'nntp-host-ip:has-reverse'
 
+def dns_questions(msg):
+    """Return a list of the (question, query type) pairs that tokenizing
+    msg will look up in the DNS cache, as nearly as can be told without
+    tokenizing it: the hosts of the URLs in its text parts (if x-lookup_ip
+    is on) and its NNTP-Posting-Host headers (if x-mine_nntp_headers is
+    on)."""
+    questions = []
+    if options["Tokenizer", "x-mine_nntp_headers"]:
+        for address in msg.get_all("nntp-posting-host", ()):
+            questions.append((address, "A"))
+    if options["Tokenizer", "x-lookup_ip"] and \
+       options["Tokenizer", "x-pick_apart_urls"]:
+        if options["Tokenizer", "x-fancy_url_recognition"]:
+            finditer = url_fancy_re.finditer
+        else:
+            finditer = url_re.finditer
+        # Tokenizing won't look at more of a part than this.
+        limit = options["Tokenizer", "x-part_byte_budget"]
+        body_budget = options["Tokenizer", "x-body_byte_budget"]
+        if body_budget and (not limit or body_budget < limit):
+            limit = body_budget
+        for part in textparts(msg):
+            try:
+                text = decoded_prefix(part, limit)
+            except:
+                text = part.get_payload(decode=False)
+            if not isinstance(text, str):
+                continue
+            if limit:
+                text = text[:limit]
+            # Tokenizing looks for URLs after this, so the hosts found
+            # here must be in the same form.
+            if "&#" in text:
+                text = numeric_entity_re.sub(numeric_entity_replacer, text)
+            if options["Tokenizer", "replace_nonascii_chars"]:
+                text = text.translate(lower_non_ascii_table())
+            else:
+                text = text.lower()
+            for m in finditer(text):
+                # This follows URLStripper.tokenize.
+                proto, guts = m.groups()
+                if proto is None:
+                    if guts.lower().startswith("www"):
+                        proto = "http"
+                    elif guts.lower().startswith("ftp"):
+                        proto = "ftp"
+                    else:
+                        proto = "unknown"
+                try:
+                    netloc = urlparse.urlparse(urllib.unquote(proto + "://" +
+                                                              guts))[1]
+                except ValueError:
+                    continue
+                questions.append((netloc, "A"))
+    return questions
+
+def prefetch_dns(msg):
+    """Look up all the hosts that tokenizing msg will need at once (for
+    at most the x-lookup_ip_budget time), rather than one after another
+    as they are found."""
+    if options["Tokenizer", "x-lookup_ip"] or \
+       options["Tokenizer", "x-mine_nntp_headers"]:
+        questions = dns_questions(msg)
+        if questions:
+            cache.maxThreads = options["Tokenizer", "x-lookup_ip_threads"]
+            cache.prefetch(questions, options["Tokenizer",
+                                              "x-lookup_ip_budget"])
+
 def gen_dotted_quad_clues(pfx, ips):
     for ip in ips:
         yield "%s:%s/32" % (pfx, ip)
@@ -0,0 +1,171 @@
+"""Tokenizing messages in several processes at once.
+
+Tokenizing is the most expensive part of training on or scoring a
+mailbox full of messages, and each message is tokenized independently
+of the others; only the changes to the database (or the scores) need to
+be made in order, in one process.  tokenize_many() gives each message to
+one of a pool of worker processes, which parse and tokenize them, and
+generates the tokens of each, in the order that the messages were given,
+so that training or scoring can carry on while the next messages are
+being tokenized.
+
+Only a limited number of messages are read ahead of the one being
+trained on, so a large mailbox doesn't have to fit in memory.  The
+worker processes don't use the token cache (see tokencache.py), as they
+would all be writing to the same file.
+
+This needs the multiprocessing module (Python 2.6 and later); without
+it, messages are tokenized one at a time, as usual.
+"""
+
+# This module is part of the spambayes project, which is Copyright 2002-2007
+# The Python Software Foundation and is covered by the Python Software
+# Foundation license.
+
+import sys
+import Queue
+import traceback
+import cPickle as pickle
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from spambayes import mboxutils
+from spambayes import tokenizer
+from spambayes import tokencache
+from spambayes.Options import options
+
+# The most messages to have been given to the workers, but not yet
+# generated, for each worker.
+QUEUED_PER_WORKER = 8
+
+def _option_values():
+    """Return the value of every option, to give to the workers (which
+    might not be forked from this process, and so might not have the
+    same options)."""
+    values = []
+    for sect in options.sections():
+        for opt in options.options_in_section(sect):
+            values.append((sect, opt, options.get_option(sect, opt).get()))
+    return values
+
+def _work(tasks, results, option_values, tokenize):
+    """Tokenize the messages in the tasks queue, putting their tokens on
+    the results queue."""
+    for sect, opt, value in option_values:
+        options.get_option(sect, opt).set(value)
+    # A forked worker has this process's compiled options, too.
+    options.invalidate_compiled()
+    if tokenize is None:
+        tokenize = tokenizer.tokenize
+    while True:
+        seq, msg = tasks.get()
+        try:
+            results.put((seq, tuple(tokenize(pickle.loads(msg))), None))
+        except Exception, e:
+            traceback.print_exc()
+            try:
+                pickle.dumps(e, 2)
+            except Exception:
+                e = RuntimeError(str(e))
+            results.put((seq, None, e))
+
+def _pickled(msg):
+    """Return the message pickled, to give to a worker."""
+    # A file can't be given to another process.
+    if hasattr(msg, "read"):
+        msg = msg.read()
+    try:
+        return pickle.dumps(msg, 2)
+    except (pickle.PicklingError, TypeError):
+        # Some Message objects can't be pickled (spambayes.message's
+        # keep a method as an attribute), so give the text instead.
+        return pickle.dumps(mboxutils.as_string(msg), 2)
+
+def tokenize_many(items, jobs=1, message=None, tokenize=None):
+    """Generate (item, tokens) for each of items, in order.
+
+    Each item is a message (a string, file or Message object, as for
+    tokenizer.tokenize), or, if message is given, message(item) is the
+    message; if that is None, tokens is None, too.  message is called
+    in this process, before the message is given to a worker.
+
+    If jobs is more than one, that many worker processes tokenize the
+    messages.  tokenize, if given, is the function that those use to get
+    the tokens of a message (it must be possible to pickle it); by
+    default the usual tokenizer is used (with the token cache when not
+    using workers).
+    """
+    if message is None:
+        message = lambda item: item
+    if jobs <= 1 or multiprocessing is None:
+        if tokenize is None:
+            tokenize = tokencache.tokenize
+        for item in items:
+            msg = message(item)
+            if msg is None:
+                yield item, None
+            else:
+                yield item, tokenize(msg)
+        return
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    option_values = _option_values()
+    workers = []
+    for i in range(jobs):
+        worker = multiprocessing.Process(target=_work,
+                                         args=(tasks, results,
+                                               option_values, tokenize))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    items = iter(items)
+    waiting = {}    # sequence number -> item, for items not yet generated
+    tokens = {}     # sequence number -> tokens, for those that have them
+    errors = {}     # sequence number -> exception tokenizing it
+    next_in = next_out = 0
+    more = True
+    try:
+        while True:
+            while more and next_in - next_out < jobs * QUEUED_PER_WORKER:
+                try:
+                    item = items.next()
+                except StopIteration:
+                    more = False
+                    break
+                waiting[next_in] = item
+                msg = message(item)
+                if msg is None:
+                    tokens[next_in] = None
+                else:
+                    tasks.put((next_in, _pickled(msg)))
+                next_in += 1
+            if next_out == next_in:
+                break
+            while next_out not in tokens:
+                try:
+                    seq, msg_tokens, error = results.get(True, 1.0)
+                except Queue.Empty:
+                    for worker in workers:
+                        if not worker.is_alive():
+                            raise RuntimeError("tokenizing process exited "
+                                               "with code %s" %
+                                               (worker.exitcode,))
+                    continue
+                tokens[seq] = msg_tokens
+                if error is not None:
+                    errors[seq] = error
+            if next_out in errors:
+                raise errors[next_out]
+            yield waiting.pop(next_out), tokens.pop(next_out)
+            next_out += 1
+    finally:
+        # Anything the workers are still doing isn't wanted.
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+"""chi2bench.py: Time chi-squared combining, one message at a time versus
+all messages at once with NumPy.
+
+Usage: chi2bench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n MSGS
+        Number of messages to score.  Default is 100000.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+Each "message" is a vector of clue probabilities, as returned by the
+classifier's _getclues(), with a random length up to max_discriminators
+and a mix of hammy, spammy and neutral probabilities.  Both ways of
+combining are timed, and the largest difference between their scores is
+reported (it should be below 1e-12).
+"""
+
+import getopt
+import random
+import sys
+import time
+
+from spambayes import classifier, chi2
+from spambayes.Options import options
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def make_clues(nmsgs, seed):
+    rand = random.Random(seed)
+    maxn = options["Classifier", "max_discriminators"]
+    mindist = options["Classifier", "minimum_prob_strength"]
+    clue_lists = []
+    for _i in xrange(nmsgs):
+        clues = []
+        for j in xrange(rand.randint(0, maxn)):
+            prob = rand.choice((rand.uniform(0.0001, 0.5 - mindist),
+                                rand.uniform(0.5 + mindist, 0.9999)))
+            clues.append((prob, "word%d" % j, None))
+        clues.sort()
+        clue_lists.append(clues)
+    return clue_lists
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    nmsgs = 100000
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            nmsgs = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    print "Generating clues for %d messages..." % nmsgs
+    clue_lists = make_clues(nmsgs, seed)
+    c = classifier.Classifier()
+
+    start = time.time()
+    scalar = [c._chi2_combine(clues) for clues in clue_lists]
+    scalar_time = time.time() - start
+    print "scalar: %8.3f seconds" % scalar_time
+
+    if chi2.load_numpy() is None:
+        print "NumPy is not available; nothing to compare against."
+        return
+
+    start = time.time()
+    vector = c._chi2_combine_many(clue_lists)
+    vector_time = time.time() - start
+    print "numpy:  %8.3f seconds (%.1fx)" % (vector_time,
+                                             scalar_time / vector_time)
+    print "largest score difference: %g" % \
+          max([abs(a - b) for a, b in zip(scalar, vector)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+"""cluesbench.py: Time clue selection (Classifier._getclues) on large
+messages.
+
+Usage: cluesbench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n MSGS
+        Number of messages to time.  Default is 200.
+
+    -t TOKENS
+        Number of tokens in each message.  Default is 5000.
+
+    -v VOCAB
+        Number of distinct words in the training database.  Default is
+        100000.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+The classifier is filled with random word counts, and each message is a
+random selection of its words (plus some unknown ones).  The bounded-heap
+selection that _getclues uses is timed against the original
+sort-everything selection, for both the unigram and the bigram (tiling)
+schemes, and the clues they pick are checked to be identical.
+"""
+
+import getopt
+import random
+import sys
+import time
+
+from spambayes import classifier
+from spambayes.Options import options
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def sorting_getclues(c, wordstream, distanceget):
+    """The original _getclues(): sort every candidate, then truncate."""
+    mindist = options["Classifier", "minimum_prob_strength"]
+    maxdisc = options["Classifier", "max_discriminators"]
+    if options["Classifier", "use_bigrams"]:
+        raw = []
+        pair = None
+        seen = {pair: 1}
+        for i, token in enumerate(wordstream):
+            if i:
+                pair = "bi:%s %s" % (last_token, token)
+            last_token = token
+            for clue, indices in (token, (i,)), (pair, (i-1, i)):
+                if clue not in seen:
+                    seen[clue] = 1
+                    tup = distanceget(clue)
+                    if tup[0] >= mindist:
+                        raw.append((tup, indices))
+        raw.sort()
+        raw.reverse()
+        clues = []
+        seen = {}
+        for tup, indices in raw:
+            overlap = [i for i in indices if i in seen]
+            if not overlap:
+                for i in indices:
+                    seen[i] = 1
+                clues.append(tup)
+        clues.reverse()
+    else:
+        clues = []
+        for word in set(wordstream):
+            tup = distanceget(word)
+            if tup[0] >= mindist:
+                clues.append(tup)
+        clues.sort()
+    if len(clues) > maxdisc:
+        del clues[0 : -maxdisc]
+    return [t[1:] for t in clues]
+
+def make_classifier(vocab, rand):
+    c = classifier.Classifier()
+    c.nham = c.nspam = 1000
+    for i in xrange(vocab):
+        record = classifier.WordInfo()
+        record.hamcount = rand.randint(0, 50)
+        record.spamcount = rand.randint(0, 50)
+        if record.hamcount or record.spamcount:
+            c.wordinfo["word%d" % i] = record
+    # Make bigrams of nearby words known too.
+    for i in xrange(0, vocab, 3):
+        record = classifier.WordInfo()
+        record.spamcount = rand.randint(1, 50)
+        c.wordinfo["bi:word%d word%d" % (i, i+1)] = record
+    return c
+
+def make_messages(nmsgs, ntokens, vocab, rand):
+    msgs = []
+    for _i in xrange(nmsgs):
+        start = rand.randrange(vocab)
+        msg = []
+        for j in xrange(ntokens):
+            if rand.random() < 0.5:
+                # Runs of consecutive words, so some bigrams are known.
+                msg.append("word%d" % ((start + j) % vocab))
+            elif rand.random() < 0.8:
+                msg.append("word%d" % rand.randrange(vocab))
+            else:
+                msg.append("unknown%d" % rand.randrange(vocab))
+        msgs.append(msg)
+    return msgs
+
+def timeit(func, c, msgs, distanceget):
+    start = time.time()
+    results = [func(c, msg, distanceget) for msg in msgs]
+    return time.time() - start, results
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:t:v:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    nmsgs = 200
+    ntokens = 5000
+    vocab = 100000
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            nmsgs = int(arg)
+        elif opt == '-t':
+            ntokens = int(arg)
+        elif opt == '-v':
+            vocab = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    rand = random.Random(seed)
+    c = make_classifier(vocab, rand)
+    msgs = make_messages(nmsgs, ntokens, vocab, rand)
+
+    use_bigrams = options["Classifier", "use_bigrams"]
+    try:
+        for scheme in False, True:
+            options["Classifier", "use_bigrams"] = scheme
+            # Look up every token in advance (as spamprob_many does), so
+            # that only the selection of clues is timed.
+            distances = {}
+            for msg in msgs:
+                for word in c._enhance_wordstream(msg):
+                    distances[word] = c._worddistanceget(word)
+            distanceget = distances.__getitem__
+            sort_time, sorted_clues = timeit(sorting_getclues, c, msgs,
+                                             distanceget)
+            heap_time, heap_clues = timeit(classifier.Classifier._getclues,
+                                           c, msgs, distanceget)
+            if scheme:
+                print "bigrams:"
+            else:
+                print "unigrams:"
+            print "    sort: %8.3f seconds" % sort_time
+            print "    heap: %8.3f seconds (%.2fx)" % (heap_time,
+                                                       sort_time / heap_time)
+            if sorted_clues != heap_clues:
+                print "    *** the clues differ! ***"
+    finally:
+        options["Classifier", "use_bigrams"] = use_bigrams
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+"""filterbench.py: Time "sb_filter.py -f" on single messages with each
+database backend.
+
+Usage: filterbench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n TOKENS
+        Number of distinct tokens in the database.  Default is 200000.
+
+    -m MSGS
+        Number of messages to filter (one sb_filter.py run each).
+        Default is 20.
+
+    -b BACKENDS
+        Comma separated list of database types to time.  Default is
+        pickle,dbm,cdb,mmapcdb,snapshot (dbm is skipped if no dbm module
+        is available).
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+Each database is filled with the same random word counts, and then each
+message is piped through a new sb_filter.py process, as procmail would
+do.  The mean wall time per message is reported.
+"""
+
+import os
+import sys
+import time
+import glob
+import getopt
+import random
+import tempfile
+import subprocess
+
+from spambayes import storage
+
+program = sys.argv[0]
+
+SB_FILTER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, "scripts", "sb_filter.py")
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def make_database(db_name, db_type, ntokens, seed):
+    rand = random.Random(seed)
+    c = storage.open_storage(db_name, db_type)
+    c.nham = c.nspam = 1000
+    for i in xrange(ntokens):
+        record = c.WordInfoClass()
+        record.spamcount = rand.randint(0, 100)
+        record.hamcount = rand.randint(1, 100)
+        c._wordinfoset("word%d" % i, record)
+    c.store()
+    c.close()
+
+def make_messages(nmsgs, ntokens, rand):
+    msgs = []
+    for i in xrange(nmsgs):
+        words = ["word%d" % rand.randrange(ntokens) for _j in xrange(300)]
+        msgs.append("From: someone@example.com\n"
+                    "To: someone.else@example.com\n"
+                    "Subject: message %d\n\n%s\n" % (i, " ".join(words)))
+    return msgs
+
+def filter_time(db_name, db_type, msgs):
+    cmd = [sys.executable, SB_FILTER, "-f",
+           "-o", "Storage:persistent_use_database:%s" % db_type,
+           "-o", "Storage:persistent_storage_file:%s" % db_name]
+    start = time.time()
+    for msg in msgs:
+        p = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE)
+        out = p.communicate(msg)[0]
+        if p.returncode or "X-Spambayes-Classification" not in out:
+            raise RuntimeError("sb_filter.py failed with %s" % db_type)
+    return (time.time() - start) / len(msgs)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:m:b:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    ntokens = 200000
+    nmsgs = 20
+    backends = ["pickle", "dbm", "cdb", "mmapcdb", "snapshot"]
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            ntokens = int(arg)
+        elif opt == '-m':
+            nmsgs = int(arg)
+        elif opt == '-b':
+            backends = arg.split(",")
+        elif opt == '-s':
+            seed = int(arg)
+
+    msgs = make_messages(nmsgs, ntokens, random.Random(seed))
+    # The filter must find the sources of this copy of spambayes.
+    env_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.path.join(os.path.dirname(SB_FILTER),
+                                            os.pardir)
+    if env_path:
+        os.environ["PYTHONPATH"] += os.pathsep + env_path
+
+    print "%d tokens, %d messages" % (ntokens, nmsgs)
+    for db_type in backends:
+        db_name = tempfile.mktemp("filterbench")
+        try:
+            try:
+                make_database(db_name, db_type, ntokens, seed)
+            except Exception, e:
+                print "%-10s skipped (%s)" % (db_type, e)
+                continue
+            print "%-10s %8.3f seconds per message" % \
+                  (db_type, filter_time(db_name, db_type, msgs))
+        finally:
+            for name in glob.glob(db_name + "*"):
+                os.remove(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#! /usr/bin/env python
+"""proxybench.py: Time POP3 sessions through sb_server.py's proxy, with
+several email clients retrieving their mail at once.
+
+Usage: proxybench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -c CLIENTS
+        Number of email clients, each retrieving its mail at the same
+        time as the others.  Default is 10.
+
+    -m MSGS
+        Number of messages that each client retrieves.  Default is 5.
+
+    -k SIZE
+        Size of each message, in kilobytes.  Default is 20.
+
+    -b SIZE
+        Size of a large message, in kilobytes, that the first client
+        retrieves before its others; while the proxy classifies it, the
+        other clients should carry on.  0 means no large message.
+        Default is 500.
+
+    -w THREADS
+        Comma separated list of values of the pop3proxy classify_threads
+        option to time.  Default is 0,4.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+A fake POP3 server and the proxy run in this process, each with its own
+async loop thread, and the clients in threads of their own.  The proxy
+runs as in sb_server.py's self-test, without caching the messages.  For
+each number of classification threads, the mean and longest session
+times (from connecting to the response to QUIT) and the mean time to
+retrieve a message are reported.
+"""
+
+import os
+import sys
+import time
+import socket
+import getopt
+import random
+import tempfile
+import threading
+
+from spambayes import asyncore
+from spambayes import Dibbler
+from spambayes.Options import options
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def make_message(number, size, rand):
+    words = []
+    length = 0
+    while length < size:
+        word = "word%d" % rand.randrange(20000)
+        if rand.random() < 0.01:
+            word = "http://www%d.example.com/%s" % (rand.randrange(100),
+                                                     word)
+        words.append(word)
+        length += len(word) + 1
+    lines = []
+    for i in range(0, len(words), 10):
+        lines.append(" ".join(words[i:i+10]))
+    return ("From: someone%d@example.com\r\n"
+            "To: someone.else@example.com\r\n"
+            "Subject: message %d\r\n\r\n%s\r\n" %
+            (number, number, "\r\n".join(lines)))
+
+class FakePOP3Server(Dibbler.BrighterAsyncChat):
+    """Serves the same maildrop to every client, without needing to be
+    logged in to.  Commands other than RETR and STAT just return "+OK"."""
+
+    def __init__(self, clientSocket, maildrop, socketMap):
+        Dibbler.BrighterAsyncChat.__init__(self, map=socketMap)
+        Dibbler.BrighterAsyncChat.set_socket(self, clientSocket, socketMap)
+        self.maildrop = maildrop
+        self.set_terminator('\r\n')
+        self.request = ''
+        self.push("+OK ready\r\n")
+
+    def collect_incoming_data(self, data):
+        self.request = self.request + data
+
+    def found_terminator(self):
+        args = self.request.split()
+        self.request = ''
+        command = args[0].upper()
+        if command == 'RETR':
+            message = self.maildrop[int(args[1]) - 1]
+            # Byte-stuff the message, as a real server would.
+            message = message.replace("\r\n.", "\r\n..")
+            self.push("+OK %d octets\r\n%s.\r\n" % (len(message), message))
+        elif command == 'STAT':
+            self.push("+OK %d %d\r\n" %
+                      (len(self.maildrop), sum(map(len, self.maildrop))))
+        else:
+            self.push("+OK\r\n")
+            if command == 'QUIT':
+                self.close_when_done()
+
+def start_server(maildrop):
+    """Start the fake POP3 server, and return its port."""
+    socketMap = {}
+    listener = Dibbler.Listener(('127.0.0.1', 0), FakePOP3Server,
+                                (maildrop, socketMap), socketMap)
+    server = threading.Thread(target=asyncore.loop,
+                              kwargs={"map" : socketMap})
+    server.setDaemon(True)
+    server.start()
+    return listener.socket.getsockname()[1]
+
+def start_proxy(serverPort, info_name):
+    """Start the proxy, keeping its message information in a pickle
+    named info_name, and return its port."""
+    # sb_server lives in the scripts directory.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), os.pardir, "scripts"))
+    options["Storage", "persistent_use_database"] = "pickle"
+    options["Storage", "messageinfo_storage_file"] = info_name
+    import sb_server
+    sb_server.state.isTest = True
+    sb_server.state.createWorkers()
+    # Give the classifier something to look up.
+    bayes = sb_server.state.bayes
+    rand = random.Random(0)
+    for i in range(20):
+        bayes.learn(make_message(i, 5000, rand).split(), i % 2)
+    listener = sb_server.BayesProxyListener('127.0.0.1', serverPort,
+                                            ('127.0.0.1', 0))
+    proxy = threading.Thread(target=Dibbler.run)
+    proxy.setDaemon(True)
+    proxy.start()
+    return listener.socket.getsockname()[1]
+
+def read_response(sock, multiline):
+    end = multiline and "\r\n.\r\n" or "\r\n"
+    chunks = []
+    tail = ""
+    while not tail.endswith(end):
+        data = sock.recv(65536)
+        if not data:
+            raise RuntimeError("the connection was closed")
+        chunks.append(data)
+        tail = (tail + data)[-len(end):]
+    return "".join(chunks)
+
+def session(port, messages, go, results):
+    """Retrieve the messages, and append (session time, [retrieval
+    times]) to results."""
+    go.wait()
+    start = time.time()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(600)
+    sock.connect(('127.0.0.1', port))
+    # No USER or PASS: the proxy would expire the message caches, which
+    # it doesn't have in this test mode.
+    read_response(sock, False)
+    retrievals = []
+    for number in messages:
+        retr_start = time.time()
+        sock.sendall("RETR %d\r\n" % (number,))
+        response = read_response(sock, True)
+        if response.find(options["Headers",
+                                  "classification_header_name"]) == -1:
+            raise RuntimeError("message %d wasn't classified" % (number,))
+        retrievals.append(time.time() - retr_start)
+    sock.sendall("QUIT\r\n")
+    read_response(sock, False)
+    sock.close()
+    results.append((time.time() - start, retrievals))
+
+def time_sessions(port, nclients, nmsgs, big):
+    results = []
+    go = threading.Event()
+    clients = []
+    for i in range(nclients):
+        messages = range(2, nmsgs + 2)
+        if i == 0 and big:
+            messages.insert(0, 1)
+        client = threading.Thread(target=session,
+                                  args=(port, messages, go, results))
+        client.start()
+        clients.append(client)
+    start = time.time()
+    go.set()
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start
+    if len(results) != nclients:
+        raise RuntimeError("some sessions failed")
+    return elapsed, results
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:m:k:b:w:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    nclients = 10
+    nmsgs = 5
+    size = 20
+    big = 500
+    threads = [0, 4]
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-c':
+            nclients = int(arg)
+        elif opt == '-m':
+            nmsgs = int(arg)
+        elif opt == '-k':
+            size = int(arg)
+        elif opt == '-b':
+            big = int(arg)
+        elif opt == '-w':
+            threads = map(int, arg.split(","))
+        elif opt == '-s':
+            seed = int(arg)
+
+    info_name = tempfile.mktemp("proxybench")
+    rand = random.Random(seed)
+    maildrop = [make_message(1, max(big, 1) * 1024, rand)]
+    for i in range(nmsgs):
+        maildrop.append(make_message(i + 2, size * 1024, rand))
+    try:
+        port = start_proxy(start_server(maildrop), info_name)
+        print "%d clients, %d messages of %dK each" % (nclients, nmsgs, size),
+        if big:
+            print "(and one of %dK)" % (big,)
+        else:
+            print
+        for nthreads in threads:
+            options["pop3proxy", "classify_threads"] = nthreads
+            elapsed, results = time_sessions(port, nclients, nmsgs, big)
+            sessions = [t for t, retrievals in results]
+            retrievals = []
+            for t, times in results:
+                retrievals.extend(times)
+            print "%2d threads: %7.3f seconds in all, sessions %7.3f mean " \
+                  "%7.3f max, retrievals %7.3f mean" % \
+                  (nthreads, elapsed, sum(sessions) / len(sessions),
+                   max(sessions), sum(retrievals) / len(retrievals))
+    finally:
+        for name in (info_name, info_name + ".journal"):
+            if os.path.exists(name):
+                os.remove(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+"""retrbench.py: Time retrieving large messages through sb_server.py's
+proxy.
+
+Usage: retrbench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -s SIZES
+        Comma separated list of message sizes, in megabytes.  Default
+        is 1,10,50.
+
+    -n TIMES
+        Number of times to retrieve each message.  Default is 3.
+
+Each message is a short text body and an attachment that makes up the
+rest of its size, as a large message usually is.  It is retrieved from
+the fake POP3 server (see proxybench.py) directly, and through the proxy,
+and the mean time for each is reported, as is the largest the process
+has grown (where that can be found out).
+"""
+
+import os
+import sys
+import time
+import socket
+import getopt
+import random
+import tempfile
+
+from spambayes.Options import options
+
+from proxybench import start_server, start_proxy, read_response
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def make_message(size, rand):
+    text = "".join([chr(rand.randrange(256)) for i in range(57 * 1024)])
+    line_data = text.encode("base64").replace("\n", "\r\n")
+    attachment = line_data * (size / len(line_data) + 1)
+    return ("From: someone@example.com\r\n"
+            "To: someone.else@example.com\r\n"
+            "Subject: a large attachment\r\n"
+            "MIME-Version: 1.0\r\n"
+            "Content-Type: multipart/mixed; boundary=\"xyzzy\"\r\n\r\n"
+            "--xyzzy\r\n"
+            "Content-Type: text/plain\r\n\r\n"
+            "Here's that file you wanted.\r\n\r\n"
+            "--xyzzy\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            "Content-Transfer-Encoding: base64\r\n\r\n%s\r\n"
+            "--xyzzy--\r\n" % (attachment[:size],))
+
+def retrieve(port, number):
+    """Retrieve the message, and return how long that took."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(3600)
+    sock.connect(('127.0.0.1', port))
+    read_response(sock, False)
+    start = time.time()
+    sock.sendall("RETR %d\r\n" % (number,))
+    read_response(sock, True)
+    elapsed = time.time() - start
+    sock.sendall("QUIT\r\n")
+    read_response(sock, False)
+    sock.close()
+    return elapsed
+
+def max_size():
+    """Return the most memory this process has used, in megabytes, or
+    None if that's not known."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Bytes, rather than kilobytes.
+        usage /= 1024
+    return usage / 1024.0
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hs:n:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    sizes = [1, 10, 50]
+    times = 3
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-s':
+            sizes = map(int, arg.split(","))
+        elif opt == '-n':
+            times = int(arg)
+
+    rand = random.Random(101)
+    maildrop = [make_message(size * 1024 * 1024, rand) for size in sizes]
+    info_name = tempfile.mktemp("retrbench")
+    try:
+        server_port = start_server(maildrop)
+        proxy_port = start_proxy(server_port, info_name)
+        for number in range(1, len(sizes) + 1):
+            direct = proxied = 0.0
+            for i in range(times):
+                direct += retrieve(server_port, number)
+                proxied += retrieve(proxy_port, number)
+            print "%4d MB: %8.3f seconds direct, %8.3f seconds through " \
+                  "the proxy" % (sizes[number - 1], direct / times,
+                                 proxied / times),
+            size = max_size()
+            if size is None:
+                print
+            else:
+                print "(%d MB used)" % (size,)
+    finally:
+        for name in (info_name, info_name + ".journal"):
+            if os.path.exists(name):
+                os.remove(name)
+
+if __name__ == "__main__":
+    main()
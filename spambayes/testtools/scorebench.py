@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+"""scorebench.py: Time tokenizing and scoring many messages, as a bulk
+filtering run does.
+
+Usage: scorebench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -m MSGS
+        Number of messages to score.  Default is 10000.
+
+    -n TOKENS
+        Number of distinct words in the classifier.  Default is 50000.
+
+    -w WORDS
+        Number of words in each message.  Default is 200.
+
+    -p
+        Profile the run, and show the functions that took the most time
+        (including the option lookups, which have their own lines).
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+The classifier is trained on 1000 random messages, and then each message
+is tokenized and scored in turn.  The messages have a few headers, some
+words the classifier hasn't seen, and an occasional URL and long word,
+so that most of the tokenizer is exercised.  The total time, and the time
+per message, are reported.
+"""
+
+import sys
+import time
+import getopt
+import random
+
+from spambayes import tokenizer
+from spambayes.classifier import Classifier
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def make_message(number, ntokens, nwords, rand):
+    words = []
+    for i in xrange(nwords):
+        r = rand.random()
+        if r < 0.01:
+            words.append("http://www%d.example.com/page%d.html" %
+                         (rand.randrange(100), rand.randrange(1000)))
+        elif r < 0.02:
+            words.append("x" * rand.randrange(13, 40))
+        elif r < 0.1:
+            words.append("new%d" % rand.randrange(1000000))
+        else:
+            words.append("word%d" % rand.randrange(ntokens))
+    lines = []
+    for i in range(0, len(words), 12):
+        lines.append(" ".join(words[i:i+12]))
+    return ("Received: from mail%d.example.com (mail%d.example.com "
+            "[10.0.%d.%d])\n\tby mx.example.org; Mon, 1 Jan 2007 "
+            "12:00:00 +0000\n"
+            "From: someone%d@example.com\n"
+            "To: someone.else@example.org\n"
+            "Subject: message %d\n"
+            "Message-Id: <%d@example.com>\n\n%s\n" %
+            (number % 50, number % 50, number % 256, number % 200,
+             number % 300, number, number, "\n".join(lines)))
+
+def score_all(classifier, msgs):
+    spamprob = classifier.spamprob
+    tokenize = tokenizer.tokenize
+    for msg in msgs:
+        spamprob(tokenize(msg))
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hm:n:w:ps:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    nmsgs = 10000
+    ntokens = 50000
+    nwords = 200
+    profile = False
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-m':
+            nmsgs = int(arg)
+        elif opt == '-n':
+            ntokens = int(arg)
+        elif opt == '-w':
+            nwords = int(arg)
+        elif opt == '-p':
+            profile = True
+        elif opt == '-s':
+            seed = int(arg)
+
+    rand = random.Random(seed)
+    classifier = Classifier()
+    for i in xrange(1000):
+        classifier.learn(tokenizer.tokenize(make_message(i, ntokens,
+                                                         nwords, rand)),
+                         i % 2)
+    msgs = [make_message(i, ntokens, nwords, rand) for i in xrange(nmsgs)]
+
+    print "%d messages of %d words, %d words in the classifier" % \
+          (nmsgs, nwords, ntokens)
+    if profile:
+        import cProfile
+        import pstats
+        prof = cProfile.Profile()
+        start = time.time()
+        prof.runcall(score_all, classifier, msgs)
+        elapsed = time.time() - start
+        pstats.Stats(prof).sort_stats("time").print_stats(15)
+    else:
+        start = time.time()
+        score_all(classifier, msgs)
+        elapsed = time.time() - start
+    print "%.2f seconds in all, %.3f ms per message" % \
+          (elapsed, elapsed * 1e3 / nmsgs)
+
+if __name__ == "__main__":
+    main()
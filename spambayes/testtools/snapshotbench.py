@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+"""snapshotbench.py: Compare pickle and binary snapshot databases for the
+one-message-per-process case (sb_filter.py run from procmail, say).
+
+Usage: snapshotbench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n TOKENS
+        Number of distinct tokens in the database.  Default is 1000000.
+
+    -t TOKENS
+        Number of tokens in the scored message.  Default is 300.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+A database is filled with random word counts and stored in each format.
+For each format, the time to store it, and the time to open it and score
+one message (which is what each sb_filter.py process does) are reported.
+"""
+
+import os
+import sys
+import time
+import glob
+import getopt
+import random
+import tempfile
+
+from spambayes import storage
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def fill(c, ntokens, rand):
+    c.nham = c.nspam = 10000
+    for i in xrange(ntokens):
+        record = c.WordInfoClass()
+        record.spamcount = rand.randint(0, 100)
+        record.hamcount = rand.randint(1, 100)
+        c._wordinfoset("word%d" % i, record)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:t:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    ntokens = 1000000
+    msglen = 300
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            ntokens = int(arg)
+        elif opt == '-t':
+            msglen = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    rand = random.Random(seed)
+    msg = ["word%d" % rand.randrange(2 * ntokens) for _i in xrange(msglen)]
+    scores = []
+    for db_type in "pickle", "snapshot":
+        db_name = tempfile.mktemp("snapshotbench")
+        try:
+            c = storage.open_storage(db_name, db_type)
+            fill(c, ntokens, random.Random(seed))
+            start = time.time()
+            c.store()
+            store_time = time.time() - start
+            c.close()
+            del c
+
+            start = time.time()
+            c = storage.open_storage(db_name, db_type)
+            scores.append(c.spamprob(msg))
+            c.close()
+            filter_time = time.time() - start
+
+            print "%s:" % db_type
+            print "    size:         %8.1f MB" % \
+                  (os.path.getsize(db_name) / 1024.0 / 1024.0)
+            print "    store:        %8.3f seconds" % store_time
+            print "    open + score: %8.3f seconds" % filter_time
+        finally:
+            for name in glob.glob(db_name + "*"):
+                os.remove(name)
+    if scores[0] != scores[1]:
+        print "*** the scores differ! ***"
+
+if __name__ == "__main__":
+    main()
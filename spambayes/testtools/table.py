@@ -26,6 +26,8 @@ statistic.
 #   best cost,
 #   ham score deviation for all runs,
 #   spam score deviations for all runs,
+#   tokenizing time per message,
+#   truncated message rate,
 # )
 # from summary file f.
 def suck(f):
@@ -40,6 +42,8 @@ def suck(f):
     unp = 0.0
     htest = 0
     stest = 0
+    tokms = 0.0
+    trunc = 0.0
 
     get = f.readline
     while 1:
@@ -88,12 +92,18 @@ def suck(f):
         elif line.startswith('-> <stat> all runs unsure %: '):
             unp = float(line.split()[-1])
 
+        elif line.startswith('-> <stat> all runs tokenizing ms per message: '):
+            tokms = float(line.split()[-1])
+
+        elif line.startswith('-> <stat> all runs truncated %: '):
+            trunc = float(line.split()[-1])
+
         elif line.startswith('-> <stat> all runs cost: '):
             cost = float(line.split('$')[-1])
             break
 
     return (htest, stest, fp, fn, un, fpp, fnp, unp, cost, bestcost,
-            hamdevall, spamdevall)
+            hamdevall, spamdevall, tokms, trunc)
 
 def windowsfy(fn):
     import os
@@ -126,9 +136,12 @@ def table():
     ssdev = "s sdev:   "
     meand = "mean diff:"
     kval  = "k:        "
+    tokpm = "tok ms:   "
+    trper = "trunc %:  "
 
     tfptot = tfpper = tfntot = tfnper = tuntot = tunper = trcost = tbcost = \
-    thmean = thsdev = tsmean = tssdev = tmeand = tkval =  0
+    thmean = thsdev = tsmean = tssdev = tmeand = tkval = ttokpm = \
+    ttrper = 0
 
     args, fileargs = getopt.getopt(sys.argv[1:], 'm')
     for arg, val in args:
@@ -138,7 +151,7 @@ def table():
     for filename in fileargs:
         filename = windowsfy(filename)
         (htest, stest, fp, fn, un, fpp, fnp, unp, cost, bestcost,
-         hamdevall, spamdevall) = suck(file(filename))
+         hamdevall, spamdevall, tokms, trunc) = suck(file(filename))
         if filename.endswith('.txt'):
             filename = filename[:-4]
         filename = filename[filename.rfind('/')+1:]
@@ -188,6 +201,10 @@ def table():
         k = (spamdevall[0] - hamdevall[0]) / (spamdevall[1] + hamdevall[1])
         kval  += "%12.2f" % k
         tkval  += k
+        tokpm += "%12.2f" % tokms
+        ttokpm += tokms
+        trper += "%12.2f" % trunc
+        ttrper += trunc
 
     nfiles = len(fileargs)
     if nfiles and showMean:
@@ -205,6 +222,8 @@ def table():
         ssdev += "%12.2f" % (tssdev/nfiles)
         meand += "%12.2f" % (tmeand/nfiles)
         kval  += "%12.2f" % (tkval/nfiles)
+        tokpm += "%12.2f" % (ttokpm/nfiles)
+        trper += "%12.2f" % (ttrper/nfiles)
 
     print fname
     if len(fnam2.strip()) > 0:
@@ -226,6 +245,8 @@ def table():
     print ssdev
     print meand
     print kval
+    print tokpm
+    print trper
 
 if __name__ == "__main__":
     table()
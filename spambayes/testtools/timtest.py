@@ -12,6 +12,8 @@ Where:
     -n int
         Number of Set directories (Data/Spam/Set1, ... and Data/Ham/Set1, ...).
         This is required.
+    -j int
+        Tokenize messages in this many processes at once.
 
 If you only want to use some of the messages in each set,
 
@@ -54,7 +56,7 @@ def usage(code, msg=''):
     print >> sys.stderr, __doc__ % globals()
     sys.exit(code)
 
-def drive(nsets):
+def drive(nsets, jobs=1):
     print options.display()
 
     spamdirs = [get_pathname_option("TestDriver", "spam_directories") % \
@@ -63,7 +65,7 @@ def drive(nsets):
                 i for i in range(1, nsets+1)]
     spamhamdirs = zip(spamdirs, hamdirs)
 
-    d = TestDriver.Driver()
+    d = TestDriver.Driver(jobs)
     for spamdir, hamdir in spamhamdirs:
         d.new_classifier()
         d.train(msgs.HamStream(hamdir, [hamdir]),
@@ -80,12 +82,13 @@ def main():
     import getopt
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hn:s:',
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:s:j:',
                                    ['ham-keep=', 'spam-keep='])
     except getopt.error, msg:
         usage(1, msg)
 
     nsets = seed = hamkeep = spamkeep = None
+    jobs = 1
     for opt, arg in opts:
         if opt == '-h':
             usage(0)
@@ -97,6 +100,8 @@ def main():
             hamkeep = int(arg)
         elif opt == '--spam-keep':
             spamkeep = int(arg)
+        elif opt == '-j':
+            jobs = int(arg)
 
     if args:
         usage(1, "Positional arguments not supported")
@@ -104,7 +109,7 @@ def main():
         usage(1, "-n is required")
 
     msgs.setparms(hamkeep, spamkeep, seed=seed)
-    drive(nsets)
+    drive(nsets, jobs)
 
 if __name__ == "__main__":
     main()
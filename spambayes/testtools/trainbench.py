@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+"""trainbench.py: Time training a dbm database, writing every change as it
+is made versus buffering the writes (Storage/dbm_write_batch_size).
+
+Usage: trainbench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n MSGS
+        Number of messages to train on.  Default is 5000.
+
+    -t TOKENS
+        Number of tokens in each message.  Default is 200.
+
+    -b SIZE
+        Write batch size to use.  Default is the configured
+        dbm_write_batch_size.
+
+    -D
+        Use the dumbdbm module (which is always available) rather than
+        the configured dbm type.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+The messages are made of words with a Zipf-like distribution, so that, as
+with real mail, most words are only ever seen once.  Each way of writing
+is used to train a new database on the same messages (and then store it),
+and the training rate in messages per second and the number of writes
+made to the dbm database are reported.
+"""
+
+import os
+import sys
+import time
+import glob
+import getopt
+import random
+import tempfile
+
+from spambayes import storage
+from spambayes import dbmstorage
+from spambayes.Options import options
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+class WriteThroughClassifier(storage.DBDictClassifier):
+    """DBDictClassifier as it was before writes were buffered: singleton
+    words are written as soon as they are set, and the state key after
+    every message."""
+    def _wordinfoset(self, word, record):
+        if record.spamcount + record.hamcount <= 1:
+            self.db[word] = record.__getstate__()
+            self.changed_words.pop(word, None)
+            self.wordinfo.pop(word, None)
+        else:
+            self.wordinfo[word] = record
+            self.changed_words[word] = storage.WORD_CHANGED
+
+    def _post_training(self):
+        self._write_state_key()
+
+class CountingDB(object):
+    """Wrap a dbm object, counting the writes made to it."""
+    def __init__(self, db):
+        self.db = db
+        self.writes = 0
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        self.db[key] = value
+
+    def __getitem__(self, key):
+        return self.db[key]
+
+    def __delitem__(self, key):
+        self.writes += 1
+        del self.db[key]
+
+    def __contains__(self, key):
+        return self.db.has_key(key)
+
+    def __len__(self):
+        return len(self.db)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+def make_messages(nmsgs, ntokens, rand):
+    msgs = []
+    for _i in xrange(nmsgs):
+        msgs.append(["word%d" % int(rand.paretovariate(0.5))
+                     for _j in xrange(ntokens)])
+    return msgs
+
+def train(klass, msgs):
+    db_name = tempfile.mktemp("trainbench")
+    try:
+        start = time.time()
+        c = klass(db_name)
+        c.db.dict = counter = CountingDB(c.db.dict)
+        for i, msg in enumerate(msgs):
+            c.learn(msg, i % 2)
+        c.store()
+        c.close()
+        return len(msgs) / (time.time() - start), counter.writes
+    finally:
+        for name in glob.glob(db_name + "*"):
+            os.remove(name)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:t:b:Ds:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    nmsgs = 5000
+    ntokens = 200
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            nmsgs = int(arg)
+        elif opt == '-t':
+            ntokens = int(arg)
+        elif opt == '-b':
+            options["Storage", "dbm_write_batch_size"] = int(arg)
+        elif opt == '-D':
+            import dumbdbm
+            dbmstorage.open = lambda name, mode: dumbdbm.open(name, mode)
+        elif opt == '-s':
+            seed = int(arg)
+
+    msgs = make_messages(nmsgs, ntokens, random.Random(seed))
+    before, writes = train(WriteThroughClassifier, msgs)
+    print "write-through:   %8.1f messages/second, %d writes" % \
+          (before, writes)
+    after, writes = train(storage.DBDictClassifier, msgs)
+    print "batches of %-5d %8.1f messages/second, %d writes (%.2fx)" % \
+          (options["Storage", "dbm_write_batch_size"], after, writes,
+           after / before)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+"""wordinfobench.py: Compare the memory use and pickle load time of the
+two in-memory word databases: a dict of WordInfo objects, and a compact
+WordInfoTable (the Storage/compact_wordinfo option).
+
+Usage: wordinfobench.py [options]
+
+Options:
+    -h
+        Show usage and exit.
+
+    -n TOKENS
+        Number of distinct tokens in the database.  Default is 1000000.
+
+    -s SEED
+        Seed for random number generator.  Default is 101.
+
+A classifier is filled with random word counts and saved as a pickle in
+each representation.  Each pickle is then loaded in a fresh child process
+(so that the memory high-water mark of one doesn't hide the other), and
+the time taken and the growth of the maximum resident set size are
+reported.  This needs os.fork() and the resource module, so it runs on
+Unix only.
+"""
+
+import os
+import sys
+import time
+import getopt
+import random
+import tempfile
+import resource
+import cPickle as pickle
+
+from spambayes import classifier
+from spambayes.Options import options
+
+program = sys.argv[0]
+
+def usage(code, msg=''):
+    """Print usage message and sys.exit(code)."""
+    if msg:
+        print >> sys.stderr, msg
+        print >> sys.stderr
+    print >> sys.stderr, __doc__
+    sys.exit(code)
+
+def maxrss():
+    # ru_maxrss is in kilobytes on Linux (bytes on Mac OS X).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def make_classifier(ntokens, rand):
+    c = classifier.Classifier()
+    c.nham = c.nspam = 10000
+    for i in xrange(ntokens):
+        record = c.WordInfoClass()
+        record.spamcount = rand.randint(0, 100)
+        record.hamcount = rand.randint(1, 100)
+        c._wordinfoset("word%d" % i, record)
+    return c
+
+def load(filename):
+    """Load the pickle in a child process; return (seconds, KB)."""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        before = maxrss()
+        start = time.time()
+        f = open(filename, "rb")
+        c = pickle.load(f)
+        f.close()
+        elapsed = time.time() - start
+        os.write(w, "%r %d" % (elapsed, maxrss() - before))
+        os._exit(0)
+    os.close(w)
+    result = os.read(r, 100)
+    os.close(r)
+    os.waitpid(pid, 0)
+    elapsed, growth = result.split()
+    return float(elapsed), int(growth)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hn:s:')
+    except getopt.error, msg:
+        usage(2, msg)
+    if args:
+        usage(2, "Positional arguments not allowed")
+
+    ntokens = 1000000
+    seed = 101
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            ntokens = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    compact = options["Storage", "compact_wordinfo"]
+    results = []
+    try:
+        for scheme in False, True:
+            options["Storage", "compact_wordinfo"] = scheme
+            c = make_classifier(ntokens, random.Random(seed))
+            filename = tempfile.mktemp("wordinfobench")
+            try:
+                f = open(filename, "wb")
+                pickle.dump(c, f, 1)
+                f.close()
+                del c
+                size = os.path.getsize(filename)
+                elapsed, growth = load(filename)
+            finally:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            results.append((elapsed, growth))
+            if scheme:
+                print "WordInfoTable:"
+            else:
+                print "dict of WordInfo:"
+            print "    pickle:  %8.1f MB" % (size / 1024.0 / 1024.0)
+            print "    load:    %8.3f seconds" % elapsed
+            print "    memory:  %8.1f MB" % (growth / 1024.0)
+    finally:
+        options["Storage", "compact_wordinfo"] = compact
+
+    (dict_time, dict_mem), (table_time, table_mem) = results
+    print "WordInfoTable loads %.1fx faster in %.1fx less memory" % \
+          (dict_time / table_time, float(dict_mem) / max(table_mem, 1))
+
+if __name__ == "__main__":
+    main()